@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from typing import Annotated
+from typing import Annotated, Literal
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -17,6 +17,35 @@ class Settings(BaseSettings):
   week_shift: Annotated[int, Field(alias="WEEK_SHIFT")] = 0
   testing_stores: Annotated[list[int], Field(alias="TESTING_STORES")] = []
   test_file: Annotated[bool, Field(alias="TEST_FILE")] = False
+  sql_pool_size: Annotated[int, Field(alias="SQL_POOL_SIZE", ge=1)] = 1
+  sql_slice_pool_size: Annotated[int, Field(alias="SQL_SLICE_POOL_SIZE", ge=1)] = 4
+  sql_pool_idle_timeout: Annotated[float, Field(alias="SQL_POOL_IDLE_TIMEOUT")] = 300.0
+  sql_fetch_batch_size: Annotated[int, Field(alias="SQL_FETCH_BATCH_SIZE", ge=1)] = 5000
+  sql_connect_stagger: Annotated[float, Field(alias="SQL_CONNECT_STAGGER", ge=0)] = 0.3
+  sql_max_in_flight: Annotated[int, Field(alias="SQL_MAX_IN_FLIGHT", ge=1)] = 16
+  sql_min_in_flight: Annotated[int, Field(alias="SQL_MIN_IN_FLIGHT", ge=1)] = 2
+  sql_retry_attempts: Annotated[int, Field(alias="SQL_RETRY_ATTEMPTS", ge=1)] = 3
+  sql_retry_base_delay: Annotated[float, Field(alias="SQL_RETRY_BASE_DELAY", ge=0)] = 5.0
+  sql_retry_max_delay: Annotated[float, Field(alias="SQL_RETRY_MAX_DELAY", ge=0)] = 60.0
+  sql_breaker_threshold: Annotated[int, Field(alias="SQL_BREAKER_THRESHOLD", ge=1)] = 3
+  sql_breaker_reset_timeout: Annotated[float, Field(alias="SQL_BREAKER_RESET_TIMEOUT", ge=0)] = 60.0
+  incremental_extraction: Annotated[bool, Field(alias="INCREMENTAL_EXTRACTION")] = False
+  invoice_reread_hours: Annotated[float, Field(alias="INVOICE_REREAD_HOURS", ge=0)] = 48.0
+  invoice_store_retention_weeks: Annotated[int, Field(alias="INVOICE_STORE_RETENTION_WEEKS", ge=0)] = 2
+  inventory_dimension_cache: Annotated[bool, Field(alias="INVENTORY_DIMENSION_CACHE")] = False
+  bulk_rate_cache: Annotated[bool, Field(alias="BULK_RATE_CACHE")] = False
+  preflight_probe: Annotated[bool, Field(alias="PREFLIGHT_PROBE")] = False
+  day_sliced_extraction: Annotated[bool, Field(alias="DAY_SLICED_EXTRACTION")] = False
+  slice_target_lines: Annotated[int, Field(alias="SLICE_TARGET_LINES", ge=1)] = 50000
+  backfill_week_shifts: Annotated[list[int], Field(alias="BACKFILL_WEEK_SHIFTS")] = []
+  result_cache: Annotated[bool, Field(alias="RESULT_CACHE")] = True
+  result_cache_max_mb: Annotated[float, Field(alias="RESULT_CACHE_MAX_MB", ge=0)] = 10240.0
+  result_cache_max_age_hours: Annotated[float | None, Field(alias="RESULT_CACHE_MAX_AGE_HOURS", ge=0)] = 168.0
+  sheet_cache_max_age_hours: Annotated[float, Field(alias="SHEET_CACHE_MAX_AGE_HOURS", ge=0)] = 1.0
+  promo_invoice_cache: Annotated[bool, Field(alias="PROMO_INVOICE_CACHE")] = False
+  patch_scan_outputs: Annotated[bool, Field(alias="PATCH_SCAN_OUTPUTS")] = False
+  promo_engine: Annotated[Literal["grouped", "vectorized"], Field(alias="PROMO_ENGINE")] = "grouped"
+  manufacturers: Annotated[list[Literal["RJR", "Altria", "ITG"]], Field(alias="MANUFACTURERS")] = ["RJR"]
 
 
 SETTINGS = Settings()
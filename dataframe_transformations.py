@@ -5,15 +5,21 @@ if __name__ == "__main__":
   configure_logging()
 
 from copy import deepcopy
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from hashlib import sha256
 from itertools import chain
 from logging import getLogger
 from re import compile
-from string import Template
 from typing import Annotated, Callable, Optional, ParamSpec, TypeVar
 
-from dataframe_utils import NULL_VALUES, combine_same_coupons, distribute_discount, distribute_multipack, fix_decimals
-from pandas import DataFrame, Series, concat, isna
+import validation_config
+import validation_itemizedinvoice
+import validators_shared
+from dataframe_utils import combine_same_coupons, distribute_discount, distribute_multipack
+from numpy import full, ndarray
+from pandas import DataFrame, MultiIndex, Series, concat, isna
+from result_cache import source_digest
 from rich.progress import Progress
 from sql_querying import CUR_WEEK
 from types_column_names import (
@@ -38,14 +44,21 @@ from types_custom import (
   StoreNum,
   VAPDataType,
 )
-from utils import cached_for_testing, convert_storenum_to_str, taskgen_whencalled, wraps
+from utils import cached_result, convert_storenum_to_str, taskgen_whencalled, wraps
 from validation_config import CustomBaseModel
-from validation_itemizedinvoice import ItemizedInvoiceModel
+from validation_itemizedinvoice import itemized_invoice_model
 from validators_shared import map_to_upca
 
 logger = getLogger(__name__)
 
 
+# The models the validation passes apply and the validators they share, a change to any of them invalidates
+# the cached passes
+VALIDATION_CODE_VERSION = sha256(
+  "".join(source_digest(module) for module in (validation_config, validation_itemizedinvoice, validators_shared)).encode()
+).hexdigest()
+
+
 USSTC_BRAND_GROUPS = {
   "Copenhagen Premium": {
     "CAN": [
@@ -300,13 +313,20 @@ LOYALTY_COUPON_DEPARTMENTS = ["PMCOUPON", "HelxCoup", "USSTCoup"]
 
 ALL_COUPON_DEPARTMENTS = REGULAR_COUPON_DEPARTMENTS + LOYALTY_COUPON_DEPARTMENTS
 
-mixnmatch_rate_pattern = Template(r"(?P<Quantity>\d+) ${uom}/\$$(?P<Price>[\d\.]+)")
+# A MixNMatchRate reads as "<Quantity> <Unit of measure>/$<Price>", only applying to lines sold in that unit
+MIXNMATCH_RATE_PATTERN = compile(r"^(?P<Quantity>\d+) (?P<UOM>.*?)/\$(?P<Price>[\d\.]+)")
+MIXNMATCH_RATE_COLUMNS = ["Quantity", "UOM", "Price"]
+
+# Distinct MixNMatchRates whose parse is kept around, a week of every store holds far fewer
+MIXNMATCH_RATE_CACHE_SIZE = 4096
 
 VALID_MANUFACTURER_MULTIPACK_PATTERNS: dict[tuple[tuple[int, Decimal]], str] = {}
 
 rjr_depts = DeptIDsEnum.rjr_depts_set()
 pm_depts = DeptIDsEnum.pm_depts_set()
 scan_depts = rjr_depts.union(pm_depts)
+# Every department an itemized invoice line is needed for, both reported items and the coupons applied to them
+REPORTED_DEPARTMENTS = scan_depts.union(ALL_COUPON_DEPARTMENTS)
 
 
 base_context: ModelContextType = {
@@ -513,14 +533,21 @@ def init_bulk_types(row: Series) -> Series:
   return row
 
 
-@cached_for_testing(date_for_sig=CUR_WEEK)
+def index_bulk_rates(bulk_dat: BulkRateDataType) -> BulkRateDataType:
+  """Index the bulk rates of a store by UPC, keeping the first rate of a UPC listed more than once."""
+  if bulk_dat.index.name == BulkRateCols.ItemNum:
+    return bulk_dat
+  return bulk_dat.drop_duplicates(BulkRateCols.ItemNum).set_index(BulkRateCols.ItemNum)
+
+
+@cached_result(date_for_sig=CUR_WEEK, copy_frames=False)
 def bulk_rate_validation_pass(
   pbar: Annotated[Progress, "ignore_for_sig"],
   storenum: StoreNum,
   bulk_dat: Annotated[BulkRateDataType, "ignore_for_sig"],
 ) -> BulkDataPackage:
-  bulk_dat = bulk_dat.map(fix_decimals)
-  bulk_dat = bulk_dat.replace(NULL_VALUES, value=None)
+  # The 0E-8 Decimal fix and NULL normalization are applied at ingest by get_store_data
+  bulk_dat = bulk_dat.astype(object)
 
   bulk_dat = bulk_dat.apply(
     taskgen_whencalled(
@@ -541,11 +568,11 @@ def bulk_rate_validation_pass(
 
   return BulkDataPackage(
     storenum=storenum,
-    bulk_rate_data=bulk_dat,
+    bulk_rate_data=index_bulk_rates(bulk_dat),
   )
 
 
-@cached_for_testing(date_for_sig=CUR_WEEK)
+@cached_result(date_for_sig=CUR_WEEK, version=VALIDATION_CODE_VERSION)
 def itemized_inv_first_validation_pass(
   pbar: Annotated[Progress, "ignore_for_sig"],
   storenum: StoreNum,
@@ -558,9 +585,9 @@ def itemized_inv_first_validation_pass(
   # filter itemized invoices down to only RJR and PM departments
   itemized_invoice_data = itemized_invoice_data[itemized_invoice_data[ItemizedInvoiceCols.Dept_ID].isin(scan_depts)]
 
-  itemized_invoice_data = itemized_invoice_data.map(fix_decimals)
-  itemized_invoice_data = itemized_invoice_data.astype(object)
-  itemized_invoice_data = itemized_invoice_data.replace(NULL_VALUES, value=None)
+  # The 0E-8 Decimal fix and NULL normalization are applied at ingest by get_store_data, only the typed
+  # columns' missing values (NA/NaT/NaN) still need to become None before the rows reach the model
+  itemized_invoice_data = itemized_invoice_data.astype(object).where(itemized_invoice_data.notna(), None)
   # itemized_invoice_data = itemized_invoice_data.map(fillnas)
 
   itemized_invoice_data.sort_values(ItemizedInvoiceCols.DateTime, inplace=True)
@@ -575,7 +602,8 @@ def itemized_inv_first_validation_pass(
       clear_when_finished=True,
     )(
       context_setup(
-        model=ItemizedInvoiceModel,
+        # Columns the query did not select are not checked, the selected ones are
+        model=itemized_invoice_model(itemized_invoice_data.columns),
         # xtra_rules=rules,
       )(apply_addrinfo_and_initial_validation)
     )(),
@@ -651,9 +679,6 @@ def apply_addrinfo_and_initial_validation(
 
 def process_item_lines(
   group: DataFrame,
-  bulk_rate_data: dict[StoreNum, BulkRateDataType],
-  buydowns_data: BuydownsDataType,
-  vap_data: VAPDataType,
 ) -> DataFrame:  # sourcery skip: remove-redundant-if
   if group.empty:
     return group
@@ -669,66 +694,98 @@ def process_item_lines(
   # if invoicenum in [90198]:
   #   pass
 
-  group = apply_vap(group, vap_data)
-  group = apply_buydowns(group, buydowns_data)
-
   group = calculate_scanned_coupons(group)
-  group = identify_bulk_rates(group, bulk_rate_data)
   group = identify_multipack(group)
   group = identify_loyalty(group)
 
   return group
 
 
-def apply_vap(group: DataFrame, vap_data: VAPDataType) -> DataFrame:
-  for index, row in group.iterrows():
-    upc = row[ItemizedInvoiceCols.ItemNum]
+def apply_vap[T: ItemizedInvoiceDataType](item_lines: T, vap_data: VAPDataType) -> T:
+  """Set the VAP discount of every invoice line whose UPC is on the VAP sheet.
 
-    vap_data_match = vap_data.loc[vap_data[GSheetsVAPDiscountsCols.UPC] == upc, :]
+  Runs over every invoice at once, joining the lines against the VAP sheet indexed by UPC.
 
-    if not vap_data_match.empty:
-      assert len(vap_data_match) == 1
+  :param item_lines: Invoice lines of any number of invoices.
+  :type item_lines: ItemizedInvoiceDataType
+  :param vap_data: VAP sheet.
+  :type vap_data: VAPDataType
+  :return: Copy of ``item_lines`` with the VAP discounts set.
+  :rtype: ItemizedInvoiceDataType
+  """
+  vap_by_upc = vap_data.set_index(GSheetsVAPDiscountsCols.UPC)[
+    [GSheetsVAPDiscountsCols.Discount_Amt, GSheetsVAPDiscountsCols.Discount_Type]
+  ]
 
-      vap_row = vap_data_match.iloc[0]
+  upcs = item_lines[ItemizedInvoiceCols.ItemNum]
+  has_vap = upcs.isin(vap_by_upc.index)
 
-      vap_amt = vap_row[GSheetsVAPDiscountsCols.Discount_Amt]
-      vap_desc = vap_row[GSheetsVAPDiscountsCols.Discount_Type]
+  # A line matches at most one row of the VAP sheet
+  duplicated_upcs = vap_by_upc.index[vap_by_upc.index.duplicated()]
+  assert not upcs[has_vap].isin(duplicated_upcs).any()
 
-      group.loc[index, ItemizedInvoiceCols.Manufacturer_Discount_Amt] = vap_amt
-      group.loc[index, ItemizedInvoiceCols.Manufacturer_Promo_Desc] = vap_desc
+  item_lines = item_lines.copy()
 
-  return group
+  if has_vap.any():
+    vap_matches = vap_by_upc[~vap_by_upc.index.isin(duplicated_upcs)].reindex(upcs[has_vap])
 
+    item_lines.loc[
+      has_vap, [ItemizedInvoiceCols.Manufacturer_Discount_Amt, ItemizedInvoiceCols.Manufacturer_Promo_Desc]
+    ] = vap_matches.to_numpy()
 
-def apply_buydowns(group: DataFrame, buydowns_data: BuydownsDataType) -> DataFrame:
-  for index, row in group.iterrows():
-    # lookup the item by State and UPC in the buydowns data
-    state = row[ItemizedInvoiceCols.Store_State]
-    upc = row[ItemizedInvoiceCols.ItemNum]
+  return item_lines
 
-    buydowns_data_match = buydowns_data.loc[
-      (buydowns_data[GSheetsBuydownsCols.State] == state) & (buydowns_data[GSheetsBuydownsCols.UPC] == upc),
-      :,
-    ]
 
-    if not buydowns_data_match.empty:
-      assert len(buydowns_data_match) == 1
+def apply_buydowns[T: ItemizedInvoiceDataType](item_lines: T, buydowns_data: BuydownsDataType) -> T:
+  """Apply the buydown of every invoice line whose State and UPC are on the buydowns sheet.
+
+  Runs over every invoice at once, joining the lines against the buydowns sheet indexed by State and UPC, and
+  raises the price of every line with a buydown amount by that amount.
+
+  :param item_lines: Invoice lines of any number of invoices.
+  :type item_lines: ItemizedInvoiceDataType
+  :param buydowns_data: Buydowns sheet, preferably already indexed by State and UPC as ``SheetCache.bds_by_state_upc``.
+  :type buydowns_data: BuydownsDataType
+  :return: Copy of ``item_lines`` with the buydowns applied.
+  :rtype: ItemizedInvoiceDataType
+  """
+  buydown_keys = [GSheetsBuydownsCols.State, GSheetsBuydownsCols.UPC]
+  if list(buydowns_data.index.names) != buydown_keys:
+    buydowns_data = buydowns_data.set_index(buydown_keys)
 
-      buydown_row = buydowns_data_match.iloc[0]
+  line_keys = MultiIndex.from_arrays(
+    [item_lines[ItemizedInvoiceCols.Store_State].to_numpy(), item_lines[ItemizedInvoiceCols.ItemNum].to_numpy()]
+  )
+  has_buydown = line_keys.isin(buydowns_data.index)
 
-      buydown_amt = buydown_row[GSheetsBuydownsCols.Buydown_Amt]
+  # A line matches at most one row of the buydowns sheet
+  duplicated_keys = buydowns_data.index[buydowns_data.index.duplicated()]
+  assert not line_keys[has_buydown].isin(duplicated_keys).any()
 
-      if buydown_amt is not None or not isna(buydown_amt):
-        buydown_desc = buydown_row[GSheetsBuydownsCols.Buydown_Desc]
+  item_lines = item_lines.copy()
 
-        fixed_item_price = row[ItemizedInvoiceCols.Inv_Price] + buydown_amt
+  if not has_buydown.any():
+    return item_lines
 
-        group.loc[index, ItemizedInvoiceCols.Manufacturer_Buydown_Amt] = buydown_amt
-        group.loc[index, ItemizedInvoiceCols.Manufacturer_Buydown_Desc] = buydown_desc
+  buydown_matches = buydowns_data[~buydowns_data.index.isin(duplicated_keys)].reindex(line_keys[has_buydown])
 
-        group.loc[index, ItemizedInvoiceCols.Inv_Price] = fixed_item_price
+  # Rows without a buydown amount leave their lines untouched
+  has_amt = buydown_matches[GSheetsBuydownsCols.Buydown_Amt].notna().to_numpy()
+  buydown_matches = buydown_matches[has_amt]
+  applies = has_buydown.copy()
+  applies[has_buydown] = has_amt
 
-  return group
+  buydown_amts = buydown_matches[GSheetsBuydownsCols.Buydown_Amt].to_numpy()
+
+  item_lines.loc[applies, ItemizedInvoiceCols.Manufacturer_Buydown_Amt] = buydown_amts
+  item_lines.loc[applies, ItemizedInvoiceCols.Manufacturer_Buydown_Desc] = buydown_matches[
+    GSheetsBuydownsCols.Buydown_Desc
+  ].to_numpy()
+  item_lines.loc[applies, ItemizedInvoiceCols.Inv_Price] = (
+    item_lines.loc[applies, ItemizedInvoiceCols.Inv_Price].to_numpy() + buydown_amts
+  )
+
+  return item_lines
 
 
 def calculate_scanned_coupons(group: DataFrame) -> DataFrame:
@@ -778,38 +835,159 @@ def calculate_scanned_coupons(group: DataFrame) -> DataFrame:
   return group
 
 
-def identify_bulk_rates(group: DataFrame, bulk_rate_data: dict[StoreNum, BulkRateDataType]) -> DataFrame:
-  if group.empty:
-    return group
+def apply_bulk_rates[T: ItemizedInvoiceDataType](
+  item_lines: T,
+  bulk_rate_data: dict[StoreNum, BulkRateDataType],
+) -> T:
+  """Set the retail multipack discount of every invoice line bought in the quantity of its store's bulk rate.
+
+  Runs over the lines of every store at once, joining them against the bulk rates of all stores indexed by
+  store and UPC.
+
+  :param item_lines: Invoice lines of any number of stores and invoices.
+  :type item_lines: ItemizedInvoiceDataType
+  :param bulk_rate_data: Bulk rates per store, as indexed by ``index_bulk_rates``.
+  :type bulk_rate_data: dict[StoreNum, BulkRateDataType]
+  :return: Copy of ``item_lines`` with the bulk rate discounts set.
+  :rtype: ItemizedInvoiceDataType
+  """
+  item_lines = item_lines.copy()
 
-  # invoicenum = group[ItemizedInvoiceCols.Invoice_Number].iloc[0]
-  # if invoicenum in [162372, "162372"]:
-  #   pass
+  if not bulk_rate_data or item_lines.empty:
+    return item_lines
 
-  storenum = group[ItemizedInvoiceCols.Store_Number].iloc[0]
-  store_bulk_data = bulk_rate_data[storenum]
+  bulk_rates = concat({storenum: index_bulk_rates(bulk) for storenum, bulk in bulk_rate_data.items()})
 
-  for index, row in group.iterrows():
-    # check if the itemnum is in the bulk rate data and whether the quantity meets the minimum required for a bulk rate
-    itemnum = row[ItemizedInvoiceCols.ItemNum]
-    if itemnum in store_bulk_data[BulkRateCols.ItemNum].values:
-      bulk_rate_row: Series = store_bulk_data.loc[store_bulk_data[BulkRateCols.ItemNum] == itemnum].iloc[0]
-      bulk_quan = bulk_rate_row[BulkRateCols.Bulk_Quan]
-      bulk_price = bulk_rate_row[BulkRateCols.Bulk_Price]
+  line_keys = MultiIndex.from_arrays(
+    [item_lines[ItemizedInvoiceCols.Store_Number].to_numpy(), item_lines[ItemizedInvoiceCols.ItemNum].to_numpy()]
+  )
+  has_bulk_rate = line_keys.isin(bulk_rates.index)
 
-      bulk_price_per_item = bulk_price / bulk_quan
+  if not has_bulk_rate.any():
+    return item_lines
 
-      item_price = row[ItemizedInvoiceCols.Inv_Price]
+  bulk_matches = bulk_rates.reindex(line_keys[has_bulk_rate])
+  bulk_quans = bulk_matches[BulkRateCols.Bulk_Quan].to_numpy()
 
-      bulk_disc_per_item = item_price - bulk_price_per_item
+  # The bulk rate only applies once the minimum quantity is bought
+  meets_quantity = (item_lines.loc[has_bulk_rate, ItemizedInvoiceCols.Quantity].to_numpy() >= bulk_quans).astype(bool)
+  applies = has_bulk_rate.copy()
+  applies[has_bulk_rate] = meets_quantity
 
-      quantity = row[ItemizedInvoiceCols.Quantity]
+  bulk_quans = bulk_quans[meets_quantity]
+  bulk_price_per_item = bulk_matches[BulkRateCols.Bulk_Price].to_numpy()[meets_quantity] / bulk_quans
 
-      if quantity >= bulk_quan:
-        group.loc[index, ItemizedInvoiceCols.Retail_Multipack_Disc_Amt] = bulk_disc_per_item
-        group.loc[index, ItemizedInvoiceCols.Retail_Multipack_Quantity] = bulk_quan
+  item_lines.loc[applies, ItemizedInvoiceCols.Retail_Multipack_Disc_Amt] = (
+    item_lines.loc[applies, ItemizedInvoiceCols.Inv_Price].to_numpy() - bulk_price_per_item
+  )
+  item_lines.loc[applies, ItemizedInvoiceCols.Retail_Multipack_Quantity] = bulk_quans
 
-  return group
+  return item_lines
+
+
+@lru_cache(maxsize=MIXNMATCH_RATE_CACHE_SIZE)
+def parse_mixnmatch_rate(rate: str) -> tuple[int, str, Decimal] | None:
+  """Quantity, unit of measure and price of a MixNMatchRate, None if it does not read as one."""
+  if (match := MIXNMATCH_RATE_PATTERN.match(rate)) is None:
+    return None
+  try:
+    return int(match["Quantity"]), match["UOM"], abs(Decimal(match["Price"]))
+  except InvalidOperation:
+    logger.warning(f"Unable to parse the price of MixNMatchRate {rate!r}")
+    return None
+
+
+def parse_mixnmatch_rates(rates: Series) -> DataFrame:
+  """Parse the quantity, unit of measure and price of every MixNMatchRate of ``rates``.
+
+  Each distinct rate string is only parsed once, see ``parse_mixnmatch_rate``, every line is then a lookup.
+
+  :param rates: MixNMatchRate of any number of invoice lines.
+  :type rates: Series
+  :return: Quantity, UOM and Price per rate, indexed like ``rates``. None where the rate does not parse.
+  :rtype: DataFrame
+  """
+  parsed = {rate: parse_mixnmatch_rate(rate) for rate in rates.dropna().unique() if isinstance(rate, str)}
+
+  return DataFrame(
+    [
+      (None, None, None) if (rate_parse := parsed.get(rate) if isinstance(rate, str) else None) is None else rate_parse
+      for rate in rates
+    ],
+    columns=MIXNMATCH_RATE_COLUMNS,
+    index=rates.index,
+    dtype=object,
+  )
+
+
+def manufacturer_multipack_descs(quantities: ndarray, prices: ndarray) -> ndarray:
+  """Description of the manufacturer multipack every quantity and price pair is, None for retailer multipacks."""
+  if not VALID_MANUFACTURER_MULTIPACK_PATTERNS or not len(quantities):
+    return full(len(quantities), None, dtype=object)
+
+  return (
+    Series(VALID_MANUFACTURER_MULTIPACK_PATTERNS, dtype=object)
+    .reindex(MultiIndex.from_arrays([quantities, prices]))
+    .astype(object)
+    .where(lambda descs: descs.notna(), None)
+    .to_numpy()
+  )
+
+
+def apply_mixnmatch_rates[T: ItemizedInvoiceDataType](item_lines: T) -> T:
+  """Apply the MixNMatchRate of every invoice line sold in the unit of measure of its rate.
+
+  A rate of a single item is a price cut, a rate of several items a manufacturer or retailer multipack.
+  Every line only depends on itself, so ``item_lines`` may hold any number of invoices. Updated in place.
+
+  :param item_lines: Invoice lines to apply the rates of.
+  :type item_lines: ItemizedInvoiceDataType
+  :return: ``item_lines``, with the discounts of the rates set.
+  :rtype: ItemizedInvoiceDataType
+  """
+  rates = parse_mixnmatch_rates(item_lines[ItemizedInvoiceCols.MixNMatchRate])
+  unit_types = item_lines[ItemizedInvoiceCols.Unit_Type].fillna("").to_numpy()
+  has_rate = (rates["Quantity"].notna() & (rates["UOM"].to_numpy() == unit_types)).to_numpy()
+
+  if has_rate.any():
+    multipack_quantities = rates["Quantity"].to_numpy()
+    multipack_prices = rates["Price"].to_numpy()
+    item_prices = item_lines[ItemizedInvoiceCols.Inv_Price].to_numpy()
+
+    # A rate of a single item is a plain price cut
+    is_single = has_rate & (multipack_quantities == 1)
+    single_discounts = item_prices[is_single] - multipack_prices[is_single]
+    single_applies = is_single.copy()
+    single_applies[is_single] = (single_discounts > 0).astype(bool)
+
+    item_lines.loc[single_applies, ItemizedInvoiceCols.Acct_Promo_Name] = "Customer Appreciation"
+    item_lines.loc[single_applies, ItemizedInvoiceCols.Acct_Discount_Amt] = single_discounts[single_applies[is_single]]
+
+    is_multipack = has_rate & (multipack_quantities != 1)
+    multipack_discounts = item_prices[is_multipack] - multipack_prices[is_multipack] / multipack_quantities[is_multipack]
+    applies = is_multipack.copy()
+    applies[is_multipack] = (multipack_discounts > 0).astype(bool)
+    multipack_discounts = multipack_discounts[applies[is_multipack]]
+    multipack_quantities = multipack_quantities[applies]
+
+    manufacturer_descs = manufacturer_multipack_descs(multipack_quantities, multipack_prices[applies])
+    is_manufacturer = ~isna(manufacturer_descs)
+    manufacturer_applies = applies.copy()
+    manufacturer_applies[applies] = is_manufacturer
+    retail_applies = applies.copy()
+    retail_applies[applies] = ~is_manufacturer
+
+    item_lines.loc[manufacturer_applies, ItemizedInvoiceCols.Manufacturer_Multipack_Desc] = manufacturer_descs[is_manufacturer]
+    item_lines.loc[manufacturer_applies, ItemizedInvoiceCols.Manufacturer_Multipack_Discount_Amt] = multipack_discounts[
+      is_manufacturer
+    ]
+    item_lines.loc[manufacturer_applies, ItemizedInvoiceCols.Manufacturer_Multipack_Quantity] = multipack_quantities[
+      is_manufacturer
+    ]
+    item_lines.loc[retail_applies, ItemizedInvoiceCols.Retail_Multipack_Disc_Amt] = multipack_discounts[~is_manufacturer]
+    item_lines.loc[retail_applies, ItemizedInvoiceCols.Retail_Multipack_Quantity] = multipack_quantities[~is_manufacturer]
+
+  return item_lines
 
 
 def identify_multipack(group: DataFrame):
@@ -820,43 +998,7 @@ def identify_multipack(group: DataFrame):
   # if invoicenum in [106745, "106745"]:
   #   pass
 
-  retail_multipack_rows = group.loc[group[ItemizedInvoiceCols.MixNMatchRate].notna()]
-
-  # sourcery skip: move-assign, remove-redundant-if
-  for index, row in retail_multipack_rows.iterrows():
-    if mixnmatchrate := row[ItemizedInvoiceCols.MixNMatchRate]:
-      uom = row[ItemizedInvoiceCols.Unit_Type] or ""
-      if isna(uom):
-        uom = ""
-      pattern = compile(mixnmatch_rate_pattern.substitute(uom=uom))
-      if match := pattern.match(mixnmatchrate):
-        multipack_quantity = int(match["Quantity"])
-        multipack_price = abs(Decimal(match["Price"]))
-
-        if multipack_quantity == 1:
-          discount_per_item = row[ItemizedInvoiceCols.Inv_Price] - multipack_price
-          if discount_per_item > 0:
-            group.loc[index, ItemizedInvoiceCols.Acct_Promo_Name] = "Customer Appreciation"
-            group.loc[index, ItemizedInvoiceCols.Acct_Discount_Amt] = discount_per_item
-          continue
-
-        multipack_price_per_item = multipack_price / multipack_quantity
-
-        discount_per_item = row[ItemizedInvoiceCols.Inv_Price] - multipack_price_per_item
-        if discount_per_item <= 0:
-          continue
-
-        # TODO check if this mix n match is a manufacturer multipack or a retailer multipack
-        if multipack_desc := VALID_MANUFACTURER_MULTIPACK_PATTERNS.get((multipack_quantity, multipack_price)):
-          disc_amt_set_field = ItemizedInvoiceCols.Manufacturer_Multipack_Discount_Amt
-          multi_quantity_set_field = ItemizedInvoiceCols.Manufacturer_Multipack_Quantity
-          group.loc[index, ItemizedInvoiceCols.Manufacturer_Multipack_Desc] = multipack_desc
-        else:
-          disc_amt_set_field = ItemizedInvoiceCols.Retail_Multipack_Disc_Amt
-          multi_quantity_set_field = ItemizedInvoiceCols.Retail_Multipack_Quantity
-
-        group.loc[index, disc_amt_set_field] = discount_per_item
-        group.loc[index, multi_quantity_set_field] = multipack_quantity
+  group = apply_mixnmatch_rates(group)
 
   itemnums = group[ItemizedInvoiceCols.ItemNum]
 
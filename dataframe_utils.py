@@ -7,14 +7,73 @@ from decimal import Decimal
 from logging import getLogger
 from typing import Any
 
-from numpy import nan
-from pandas import DataFrame, Index, Series, isna
+from numpy import concatenate, nan, ndarray
+from pandas import Categorical, DataFrame, Index, Series, array, concat, isna, notna, to_datetime
+from pandas.api.extensions import ExtensionArray
+from pandas.api.types import union_categoricals
+from pandas.util import hash_pandas_object
 from types_column_names import ItemizedInvoiceCols
+from types_custom import PhysicalDtype, QueryResultColumns
 from utils import truncate_decimal
 
 logger = getLogger(__name__)
 
 
+# Columns identifying an invoice across stores
+INVOICE_COLUMNS = [ItemizedInvoiceCols.Store_Number, ItemizedInvoiceCols.Invoice_Number]
+
+
+def distribute_discounts(prices: Series, quantities: Series, groups: Series, flat_discounts: Series) -> Series:
+  """Spread the flat discount of every group over its lines, in proportion to the price of each line.
+
+  Every line gets its share of its group's discount truncated to cents, and the cents lost to the truncation go
+  to the first of the cheapest lines of the group, the same amounts ``distribute_discount`` gives per group.
+  Allocates every group in one pass, ``distribute_discount`` stays faster for a single group.
+
+  :param prices: Price of every line.
+  :type prices: Series
+  :param quantities: Quantity of every line.
+  :type quantities: Series
+  :param groups: Group of every line.
+  :type groups: Series
+  :param flat_discounts: Discount to spread over the lines of every group, indexed by group.
+  :type flat_discounts: Series
+  :raises ValueError: When a group with a discount has no lines to spread it over.
+  :return: Discount of every line, indexed like ``prices``.
+  :rtype: Series
+  """
+  group_ids = groups.to_numpy()
+  price_values = prices.to_numpy()
+  quantity_values = quantities.to_numpy()
+
+  if not (unspread := flat_discounts[~flat_discounts.index.isin(group_ids) & (flat_discounts != 0)]).empty:
+    raise ValueError(f"No lines to spread the discounts of groups {list(unspread.index)} over")
+
+  subtotals = Series(price_values * quantity_values, dtype="object").groupby(group_ids, sort=False).sum()
+
+  line_subtotals = subtotals.reindex(group_ids).to_numpy()
+  line_discounts = flat_discounts.reindex(group_ids).to_numpy()
+
+  distributed = Series(price_values / line_subtotals * line_discounts * quantity_values, dtype="object")
+  distributed = distributed.map(truncate_decimal)
+
+  # fix rounding errors
+  differences = flat_discounts.reindex(subtotals.index) - distributed.groupby(group_ids, sort=False).sum()
+  differences = differences[differences != 0]
+
+  if not differences.empty:
+    lowest_prices = Series(price_values, dtype="object").groupby(group_ids, sort=False).transform("min").to_numpy()
+    is_fixed = Series((price_values == lowest_prices) & Series(group_ids).isin(differences.index).to_numpy())
+    # the first of the cheapest lines of every group takes the difference, as prices.idxmin() picks it
+    fixed = is_fixed[is_fixed].index[~Series(group_ids[is_fixed.to_numpy()]).duplicated().to_numpy()]
+
+    distributed.loc[fixed] = distributed.loc[fixed] + differences.reindex(group_ids[fixed]).to_numpy()
+    distributed.loc[fixed] = distributed.loc[fixed].map(truncate_decimal)
+
+  distributed.index = prices.index
+  return distributed
+
+
 def distribute_discount(prices: Series, quantities: Series, flat_discount: Decimal) -> Series:
   subtotal: Decimal = (prices * quantities).sum()
   percentages_of_total: Series = prices / subtotal
@@ -110,3 +169,157 @@ def applymap(row: Series, apply_func: callable) -> Series:
 
 def fix_decimals(x: Decimal) -> Decimal:
   return Decimal("0.00") if isinstance(x, Decimal) and str(x) == "0E-8" else x
+
+
+NULL_STRINGS = ["NULL", "", " "]
+
+
+def normalize_column_values(values: ndarray, dtype: PhysicalDtype | None = None) -> ndarray:
+  """Apply the ``0E-8`` Decimal fix and NULL normalization to an object array of query results in place."""
+  if dtype is PhysicalDtype.DECIMAL:
+    for index in (values == 0).nonzero()[0]:
+      values[index] = fix_decimals(values[index])
+
+  values[Series(values).isin(NULL_STRINGS).to_numpy() | isna(values)] = None
+
+  return values
+
+
+def materialize_column(column: str, values: ndarray, dtype: PhysicalDtype | None = None) -> ndarray | ExtensionArray:
+  """Store an object array of query results in its declared physical dtype.
+
+  Values that cannot be represented in the declared dtype are kept as an object array, arrays already stored
+  in a physical dtype are returned as they are.
+  """
+  if values.dtype != object:
+    return values
+
+  try:
+    match dtype:
+      case PhysicalDtype.INT:
+        return array(values, dtype=str(dtype))
+      case PhysicalDtype.DATETIME:
+        return to_datetime(values).array
+      case PhysicalDtype.CATEGORY:
+        return Categorical(values)
+      case _:
+        return values
+  except (TypeError, ValueError):
+    logger.debug(f"Unable to store {column} as {dtype}, keeping it as object")
+    return values
+
+
+def concat_column_chunks(chunks: list[ndarray | ExtensionArray]) -> ndarray | ExtensionArray:
+  """Join the arrays a query result column was materialized into batch by batch, in order.
+
+  A column some batch could not be stored in its physical dtype is kept as an object array as a whole, with
+  None for missing values.
+  """
+  if len(chunks) == 1:
+    return chunks[0]
+  if all(isinstance(chunk, Categorical) for chunk in chunks):
+    return union_categoricals(chunks)
+  if len({chunk.dtype for chunk in chunks}) == 1:
+    if isinstance(chunks[0], ndarray):
+      return concatenate(chunks)
+    return concat([Series(chunk, copy=False) for chunk in chunks], ignore_index=True).array
+  return concatenate(
+    [Series(chunk, dtype=object).where(notna(chunk), None).to_numpy(dtype=object) for chunk in chunks]
+  )
+
+
+def materialize_columns(columns: QueryResultColumns, dtypes: dict[str, PhysicalDtype]) -> DataFrame:
+  """Build a DataFrame from query result columns, storing each column in its declared physical dtype.
+
+  Columns without a declared dtype, and columns whose values cannot be represented in the declared
+  dtype, are kept as object columns.
+  """
+  data = {column: materialize_column(column, values, dtypes.get(column)) for column, values in columns.items()}
+  return DataFrame(data, columns=list(columns.keys()), copy=False)
+
+
+def join_dimension(facts: DataFrame, dimension: DataFrame, key: str, columns: list[str] | None = None) -> DataFrame:
+  """Left join the rows of a dimension table onto fact rows by ``key``, as the server side join would.
+
+  The join is a hash join on ``key``, so each distinct key is only looked up once no matter how many
+  fact rows share it.
+
+  :param facts: Fact rows holding ``key``.
+  :type facts: DataFrame
+  :param dimension: Dimension rows holding ``key``.
+  :type dimension: DataFrame
+  :param key: Column to join on.
+  :type key: str
+  :param columns: Columns to return, in order. Every fact and dimension column if not given.
+  :type columns: list[str] | None
+  :return: The joined rows, in the order of ``facts``.
+  :rtype: DataFrame
+  """
+  joined = facts.merge(dimension, how="left", on=key, sort=False)
+  return joined if columns is None else joined[columns]
+
+
+def concat_slices(frames: list[DataFrame], dtypes: dict[str, PhysicalDtype] | None = None) -> DataFrame:
+  """Reassemble the slices of a query result, in order.
+
+  Category columns of slices with differing categories fall back to object when concatenated, they are
+  converted back to categories.
+  """
+  combined = concat(frames, ignore_index=True)
+
+  for column, dtype in (dtypes or {}).items():
+    if dtype is PhysicalDtype.CATEGORY and column in combined.columns:
+      combined[column] = combined[column].astype("category")
+
+  return combined
+
+
+def grouped_row_hashes(data: DataFrame, by: list[str]) -> Series:
+  """Hash of the rows of ``data`` per value of ``by``, combined when several rows share one.
+
+  :return: Unsigned 64 bit hashes, indexed by the values of ``by``.
+  :rtype: Series
+  """
+  if data.empty:
+    return Series(dtype="uint64")
+  hashes = Series(hash_pandas_object(data, index=False).to_numpy(), index=data.index)
+  return hashes.groupby([data[column] for column in by], dropna=False).sum()
+
+
+def invoice_keys(
+  item_lines: DataFrame,
+  positions: Series,
+  by: list[str] | None = None,
+  **line_components: ndarray,
+) -> Series:
+  """Key every invoice of ``item_lines`` by the content and position of its lines.
+
+  :param positions: Position of every line within its invoice.
+  :type positions: Series
+  :param by: Columns identifying an invoice, ``INVOICE_COLUMNS`` if not given.
+  :type by: list[str] | None
+  :param line_components: Further hashes per line to key the invoices by, e.g. of the data the lines look up.
+  :type line_components: ndarray
+  :return: Key per invoice, indexed by the values of ``by``.
+  :rtype: Series
+  """
+  by = INVOICE_COLUMNS if by is None else by
+
+  line_hashes = DataFrame(
+    {
+      "line": hash_pandas_object(item_lines, index=False).to_numpy(),
+      "position": positions.to_numpy(),
+      **line_components,
+    }
+  )
+
+  invoice_hashes = (
+    Series(hash_pandas_object(line_hashes, index=False).to_numpy(), index=item_lines.index)
+    .groupby([item_lines[column] for column in by], dropna=False)
+    .agg(["sum", "size"])
+  )
+
+  return Series(
+    [f"{line_sum:016x}-{size}" for line_sum, size in zip(invoice_hashes["sum"], invoice_hashes["size"])],
+    index=invoice_hashes.index,
+  )
@@ -6,14 +6,30 @@ if __name__ == "__main__":
 from logging import getLogger
 
 from config import SETTINGS
+from dataframe_transformations import REPORTED_DEPARTMENTS
+from dataframe_utils import join_dimension
 from exec_final_validation import apply_altria_validation, apply_itg_validation, apply_rjr_validation
 from exec_initial_validation import process_promo_data, validate_and_concat_itemized, validate_bulk
 from gsheet_data_processing import SheetCache
-from init_constants import PRECOMBINATION_ITEM_LINES_FOLDER
+from invoice_store import LocalInvoiceStore
+from item_lines_dataset import write_item_lines
 from logging_config import RICH_CONSOLE, configure_logging
+from query_planning import plan_itemized_invoice_columns
 from rich_custom import LiveCustom
-from sql_query_builders import build_bulk_info_query, build_itemized_invoice_query
-from sql_querying import DEFAULT_STORES_LIST, query_all_stores_multithreaded
+from sql_query_builders import (
+  FINGERPRINT_COLUMN,
+  QueryTemplate,
+  build_bulk_info_fingerprint_query,
+  build_bulk_info_query,
+  build_inventory_dimension_query,
+  build_inventory_fingerprint_query,
+  build_itemized_invoice_query,
+  inventory_dimension_columns,
+)
+from sql_querying import CUR_WEEK, DEFAULT_STORES_LIST, SLICES_PER_STORE, query_all_stores_multithreaded
+from store_probe import extractable_stores, probe_stores
+from store_slicing import StoreLineHistory, plan_slices
+from table_cache import StoreTableCache
 from types_column_names import BulkRateCols, GSheetsUnitsOfMeasureCols, ItemizedInvoiceCols
 from types_custom import BulkRateDataType, ItemizedInvoiceDataType, QueryDict, QueryPackage, StoreNum
 from utils import get_full_dates
@@ -23,20 +39,141 @@ logger = getLogger(__name__)
 
 full_period_start, full_period_end = get_full_dates(SETTINGS.week_shift)
 
-queries: QueryDict = {
-  "bulk_rates": QueryPackage(query=build_bulk_info_query(), cols=BulkRateCols),
-  "invoices": QueryPackage(query=build_itemized_invoice_query(full_period_start, full_period_end), cols=ItemizedInvoiceCols),
-}
+invoice_columns = plan_itemized_invoice_columns(SETTINGS.manufacturers)
+
+if SETTINGS.inventory_dimension_cache:
+  # Item details are pulled once per store as a dimension and joined onto the invoice lines locally
+  inventory_cache = StoreTableCache("inventory")
+  dimension_columns = inventory_dimension_columns(invoice_columns)
+  fact_columns = [column for column in invoice_columns if column not in dimension_columns]
+else:
+  fact_columns = invoice_columns
+
+if SETTINGS.preflight_probe:
+  # Stores with nothing to extract are skipped, the rest are queried biggest first
+  store_probes = probe_stores(full_period_start, full_period_end, dept_ids=REPORTED_DEPARTMENTS)
+  query_storenums = extractable_stores(store_probes)
+  size_hints = {storenum: store_probes[storenum].total_lines for storenum in query_storenums}
+else:
+  query_storenums = DEFAULT_STORES_LIST
+  size_hints = None
+
+
+if SETTINGS.incremental_extraction:
+  invoice_store = LocalInvoiceStore()
+  fetch_starts = {
+    storenum: invoice_store.fetch_start(storenum, full_period_start, fact_columns) for storenum in DEFAULT_STORES_LIST
+  }
+
+  invoices_query = QueryPackage(
+    query=lambda storenum: build_itemized_invoice_query(
+      fetch_starts[storenum], full_period_end, keep_time=True, dept_ids=REPORTED_DEPARTMENTS, columns=fact_columns
+    ),
+    cols=fact_columns,
+    allow_empty=True,
+    schema=ItemizedInvoiceCols,
+  )
+else:
+  invoices_query = QueryPackage(
+    query=build_itemized_invoice_query(
+      full_period_start, full_period_end, dept_ids=REPORTED_DEPARTMENTS, columns=fact_columns
+    ),
+    cols=fact_columns,
+    schema=ItemizedInvoiceCols,
+  )
+
+if SETTINGS.day_sliced_extraction:
+  if SLICES_PER_STORE < 2:
+    logger.warning(
+      "Day sliced extraction is on with SQL_POOL_SIZE and SQL_SLICE_POOL_SIZE at 1,"
+      " the slices of each store will run one after another"
+    )
+  line_history = StoreLineHistory()
+
+  def invoice_slices(storenum: StoreNum) -> list[QueryTemplate]:
+    start = fetch_starts[storenum] if SETTINGS.incremental_extraction else full_period_start
+    probe = store_probes.get(storenum) if SETTINGS.preflight_probe else None
+    return [
+      build_itemized_invoice_query(
+        slice_start, slice_end, keep_time=True, dept_ids=REPORTED_DEPARTMENTS, columns=fact_columns
+      )
+      for slice_start, slice_end in plan_slices(
+        start,
+        full_period_end,
+        daily_lines=None if probe is None else probe.daily_lines,
+        lines_per_day=line_history.lines_per_day(storenum),
+      )
+    ]
+
+  invoices_query = invoices_query._replace(slices=invoice_slices)
+
+if SETTINGS.bulk_rate_cache:
+  # Bulk rates are only downloaded and validated again for stores whose bulk info changed
+  bulk_rate_cache = StoreTableCache("bulk_rates")
+  bulk_rates_query = QueryPackage(
+    query=lambda storenum: build_bulk_info_query(bulk_rate_cache.fingerprint(storenum)),
+    cols=BulkRateCols,
+    allow_empty=True,
+    after="bulk_rates_fingerprint",
+  )
+else:
+  bulk_rates_query = QueryPackage(query=build_bulk_info_query(), cols=BulkRateCols)
+
+queries: QueryDict = {}
+if SETTINGS.bulk_rate_cache:
+  # The bulk info query runs right after the fingerprint on the same connection, see StoreTableCache.refresh
+  queries["bulk_rates_fingerprint"] = QueryPackage(query=build_bulk_info_fingerprint_query(), cols=[FINGERPRINT_COLUMN])
+queries["bulk_rates"] = bulk_rates_query
+queries["invoices"] = invoices_query
+
+if SETTINGS.inventory_dimension_cache:
+  # The dimension query runs right after the fingerprint on the same connection, see StoreTableCache.refresh
+  queries["inventory_fingerprint"] = QueryPackage(
+    query=build_inventory_fingerprint_query(dimension_columns),
+    cols=[FINGERPRINT_COLUMN],
+  )
+  queries["inventory"] = QueryPackage(
+    query=lambda storenum: build_inventory_dimension_query(dimension_columns, inventory_cache.fingerprint(storenum)),
+    cols=[ItemizedInvoiceCols.ItemNum, *dimension_columns],
+    allow_empty=True,
+    schema=ItemizedInvoiceCols,
+    after="inventory_fingerprint",
+  )
 
 
-queries_result = query_all_stores_multithreaded(queries=queries)
+queries_result = query_all_stores_multithreaded(queries=queries, storenums=query_storenums, size_hints=size_hints)
+
+if SETTINGS.incremental_extraction:
+  queries_result["invoices"] = invoice_store.refresh(
+    queries_result["invoices"], fetch_starts, full_period_start, full_period_end
+  )
+
+if SETTINGS.day_sliced_extraction:
+  # Recorded over the whole period, the fetched delta of an incremental run only covers its last days
+  for storenum, invoices in queries_result["invoices"].items():
+    line_history.record(storenum, invoices, full_period_start, full_period_end)
+  line_history.save()
+
+if SETTINGS.inventory_dimension_cache:
+  inventory = inventory_cache.refresh(queries_result["inventory"], queries_result["inventory_fingerprint"])
+  joined_invoices = {}
+  for storenum, invoices in queries_result["invoices"].items():
+    if (store_inventory := inventory.get(storenum)) is None:
+      # Left out like a store whose invoices could not be queried
+      logger.warning(f"SFT {storenum:0>3}: Leaving out the store, its inventory could not be queried")
+      continue
+    invoices = join_dimension(invoices, store_inventory, ItemizedInvoiceCols.ItemNum, invoice_columns)
+    # The server already filters departments, this drops lines of items that changed department since
+    invoices = invoices[invoices[ItemizedInvoiceCols.Dept_ID].isin(REPORTED_DEPARTMENTS)]
+    joined_invoices[storenum] = invoices.reset_index(drop=True)
+  queries_result["invoices"] = joined_invoices
 
 logger.info("Initializing sheet data")
 sheet_data = SheetCache()
 logger.info("Sheet data initialized")
 
 unit_measure_data = sheet_data.uom
-buydowns_data = sheet_data.bds
+buydowns_data = sheet_data.bds_by_state_upc
 vap_data = sheet_data.vap
 
 
@@ -45,14 +182,13 @@ bulk: dict[StoreNum, BulkRateDataType] = queries_result["bulk_rates"]
 
 
 for storenum, invoices in itemized.items():
-  sorted_invoices = invoices.sort_values(ItemizedInvoiceCols.Invoice_Number)
-  sorted_invoices.to_csv(PRECOMBINATION_ITEM_LINES_FOLDER / f"{storenum:0>3}.csv", index=False)
+  write_item_lines(CUR_WEEK, storenum, invoices)
 
 
 empty = []
 
 
-items = {storenum: str(storenum) for storenum in DEFAULT_STORES_LIST}
+items = {storenum: str(storenum) for storenum in query_storenums}
 
 
 with LiveCustom(
@@ -70,7 +206,16 @@ with LiveCustom(
       bulk.pop(storenum)
 
   remaining_callable = live.init_remaining((items, "Bulk Rates"))
-  bulk_rates = validate_bulk(pbar, remaining_callable, bulk)
+  if SETTINGS.bulk_rate_cache:
+
+    def validate_changed_bulk(changed: dict[StoreNum, BulkRateDataType]) -> dict[StoreNum, BulkRateDataType]:
+      for storenum in bulk.keys() - changed.keys():
+        remaining_callable(storenum)
+      return validate_bulk(pbar, remaining_callable, changed)
+
+    bulk_rates = bulk_rate_cache.refresh(bulk, queries_result["bulk_rates_fingerprint"], prepare=validate_changed_bulk)
+  else:
+    bulk_rates = validate_bulk(pbar, remaining_callable, bulk)
 
   base_item_lines.sort_values(ItemizedInvoiceCols.DateTime, inplace=True)
 
@@ -109,15 +254,18 @@ with LiveCustom(
   rjr_item_lines = base_item_lines.copy(deep=True)
   itg_item_lines = base_item_lines.copy(deep=True)
 
-  # apply_altria_validation(
-  #   pbar=pbar,
-  #   input_data=altria_item_lines,
-  # )
-  apply_rjr_validation(
-    pbar=pbar,
-    input_data=rjr_item_lines,
-  )
-  # apply_itg_validation(
-  #   pbar=pbar,
-  #   input_data=itg_item_lines,
-  # )
+  if "Altria" in SETTINGS.manufacturers:
+    apply_altria_validation(
+      pbar=pbar,
+      input_data=altria_item_lines,
+    )
+  if "RJR" in SETTINGS.manufacturers:
+    apply_rjr_validation(
+      pbar=pbar,
+      input_data=rjr_item_lines,
+    )
+  if "ITG" in SETTINGS.manufacturers:
+    apply_itg_validation(
+      pbar=pbar,
+      input_data=itg_item_lines,
+    )
@@ -0,0 +1,198 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+from collections.abc import Callable
+from datetime import datetime
+from logging import getLogger
+from typing import NamedTuple
+
+from config import SETTINGS
+from dataframe_transformations import REPORTED_DEPARTMENTS
+from exec_final_validation import apply_altria_validation, apply_itg_validation, apply_rjr_validation
+from exec_initial_validation import process_promo_data, validate_and_concat_itemized, validate_bulk
+from gsheet_data_processing import SheetCache
+from item_lines_dataset import write_item_lines
+from logging_config import RICH_CONSOLE
+from pandas import DataFrame, concat, date_range
+from query_planning import plan_itemized_invoice_columns
+from rich.progress import Progress
+from rich_custom import LiveCustom
+from sql_query_builders import build_bulk_info_query, build_itemized_invoice_query
+from sql_querying import query_all_stores_multithreaded
+from types_column_names import BulkRateCols, GSheetsUnitsOfMeasureCols, ItemizedInvoiceCols
+from types_custom import BulkRateDataType, ItemizedInvoiceDataType, QueryPackage, StoreNum
+from utils import get_full_dates, get_week_of
+
+logger = getLogger(__name__)
+
+
+MANUFACTURER_VALIDATIONS: dict[str, Callable[[Progress, DataFrame, int], None]] = {
+  "RJR": apply_rjr_validation,
+  "Altria": apply_altria_validation,
+  "ITG": apply_itg_validation,
+}
+
+
+class BackfillWeek(NamedTuple):
+  week_shift: int
+  # Union of the manufacturer windows of the week
+  start: datetime
+  end: datetime
+  # Start of the part of the window not already extracted for an earlier week
+  fetch_start: datetime
+
+
+def plan_backfill(week_shifts: list[int]) -> list[BackfillWeek]:
+  """Order the weeks to backfill chronologically and work out which days each of them adds.
+
+  The windows of consecutive weeks overlap, as the Altria week starts the day before the RJR and ITG weeks. A
+  day is only extracted for the first week it falls into.
+
+  :param week_shifts: Week shifts to backfill, as for ``WEEK_SHIFT``.
+  :type week_shifts: list[int]
+  :return: Weeks in chronological order, duplicates removed.
+  :rtype: list[BackfillWeek]
+  """
+  weeks = []
+  covered_end = None
+
+  for week_shift in sorted(set(week_shifts), key=lambda shift: get_full_dates(shift)[0]):
+    start, end = get_full_dates(week_shift)
+    fetch_start = start if covered_end is None else min(max(start, covered_end), end)
+    weeks.append(BackfillWeek(week_shift=week_shift, start=start, end=end, fetch_start=fetch_start))
+    covered_end = end if covered_end is None else max(covered_end, end)
+
+  return weeks
+
+
+def in_window[T: DataFrame](data: T, start: datetime, end: datetime | None = None) -> T:
+  after_start = data[ItemizedInvoiceCols.DateTime] >= start
+  if end is None:
+    return data[after_start]
+  return data[after_start & (data[ItemizedInvoiceCols.DateTime] < end)]
+
+
+def process_new_days(
+  pbar: Progress,
+  remaining_callable: Callable[[int], None],
+  itemized: dict[StoreNum, ItemizedInvoiceDataType],
+  bulk_rates: dict[StoreNum, BulkRateDataType],
+  sheet_data: SheetCache,
+  week: BackfillWeek,
+) -> ItemizedInvoiceDataType:
+  """Validate and apply the promotions to the invoices extracted for the new days of ``week``.
+
+  :return: Processed invoice lines of the new days, ready for the final validations.
+  :rtype: ItemizedInvoiceDataType
+  """
+  item_lines = validate_and_concat_itemized(
+    pbar=pbar,
+    remaining_pbar=remaining_callable,
+    data=itemized,
+    empty=[],
+    expected_dates=date_range(start=week.fetch_start, end=week.end, freq="D", inclusive="left"),
+  )
+
+  item_lines.loc[:, ItemizedInvoiceCols.Unit_Type] = item_lines[ItemizedInvoiceCols.Unit_Type].map(
+    sheet_data.uom[GSheetsUnitsOfMeasureCols.Unit_of_Measure]
+  )
+
+  item_lines.sort_values(
+    by=[
+      ItemizedInvoiceCols.Store_Number,
+      ItemizedInvoiceCols.DateTime,
+    ],
+    inplace=True,
+  )
+
+  item_lines[ItemizedInvoiceCols.Altria_Manufacturer_Multipack_Discount_Amt] = None
+  item_lines[ItemizedInvoiceCols.Altria_Manufacturer_Multipack_Quantity] = None
+
+  return process_promo_data(
+    item_lines=item_lines,
+    bulk_rates=bulk_rates,
+    pbar=pbar,
+    buydowns_data=sheet_data.bds_by_state_upc,
+    vap_data=sheet_data.vap,
+  )
+
+
+weeks = plan_backfill(SETTINGS.backfill_week_shifts)
+if not weeks:
+  logger.error("No weeks to backfill, set BACKFILL_WEEK_SHIFTS")
+
+invoice_columns = plan_itemized_invoice_columns(SETTINGS.manufacturers)
+
+logger.info("Initializing sheet data")
+sheet_data = SheetCache()
+logger.info("Sheet data initialized")
+
+# Bulk rates are the current ones for every week, as when running exec.py for each week
+bulk: dict[StoreNum, BulkRateDataType] = (
+  query_all_stores_multithreaded(
+    queries={"bulk_rates": QueryPackage(query=build_bulk_info_query(), cols=BulkRateCols)},
+  )["bulk_rates"]
+  if weeks
+  else {}
+)
+
+with LiveCustom(console=RICH_CONSOLE) as live:
+  remaining_callable = live.init_remaining(({storenum: str(storenum) for storenum in bulk}, "Bulk Rates"))
+  bulk_rates = validate_bulk(live.pbar, remaining_callable, bulk)
+
+
+# Only the lines of the current window are held, every window is extracted and processed as the days it adds
+raw_lines: dict[StoreNum, ItemizedInvoiceDataType] = {}
+processed_lines: ItemizedInvoiceDataType | None = None
+
+for index, week in enumerate(weeks):
+  logger.info(
+    f"Backfilling week shift {week.week_shift}: {week.start.date()} to {week.end.date()},"
+    f" extracting from {week.fetch_start.date()}"
+  )
+
+  itemized: dict[StoreNum, ItemizedInvoiceDataType] = {}
+  if week.fetch_start < week.end:
+    itemized = query_all_stores_multithreaded(
+      queries={
+        "invoices": QueryPackage(
+          query=build_itemized_invoice_query(
+            week.fetch_start, week.end, dept_ids=REPORTED_DEPARTMENTS, columns=invoice_columns
+          ),
+          cols=invoice_columns,
+          schema=ItemizedInvoiceCols,
+        )
+      },
+    )["invoices"]
+
+  week_of = get_week_of(week.week_shift)
+  for storenum in raw_lines.keys() | itemized.keys():
+    store_lines = [lines for lines in (raw_lines.get(storenum), itemized.get(storenum)) if lines is not None]
+    raw_lines[storenum] = in_window(concat(store_lines, ignore_index=True), week.start)
+    if not raw_lines[storenum].empty:
+      write_item_lines(week_of, storenum, raw_lines[storenum])
+
+  with LiveCustom(console=RICH_CONSOLE) as live:
+    pbar = live.pbar
+
+    if itemized:
+      remaining_callable = live.init_remaining(({storenum: str(storenum) for storenum in itemized}, "Itemized Invoices"))
+      new_lines = process_new_days(pbar, remaining_callable, itemized, bulk_rates, sheet_data, week)
+      processed_lines = new_lines if processed_lines is None else concat([processed_lines, new_lines], ignore_index=True)
+
+    if processed_lines is None:
+      logger.warning(f"No invoice lines for week shift {week.week_shift}, skipping its scan data")
+    else:
+      for manufacturer in SETTINGS.manufacturers:
+        MANUFACTURER_VALIDATIONS[manufacturer](pbar, processed_lines, week_shift=week.week_shift)
+
+  # Lines before the next window are never read again
+  if index + 1 < len(weeks):
+    next_start = weeks[index + 1].start
+    processed_lines = None if processed_lines is None else in_window(processed_lines, next_start)
+    raw_lines = {storenum: in_window(lines, next_start) for storenum, lines in raw_lines.items()}
+  else:
+    processed_lines = None
+    raw_lines = {}
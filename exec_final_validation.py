@@ -10,25 +10,11 @@ from config import SETTINGS
 from dataframe_transformations import apply_model_to_df_transforming, apply_model_to_ftx, context_setup
 from dataframe_utils import fillnas
 from gsheet_data_processing import SheetCache
-from init_constants import (
-  ALT_ERR_OUTPUT_FILE,
-  ALT_FTX_ERR_OUTPUT_FILE,
-  ALT_SCAN_FILE_PATH,
-  ALTRIA_LOYALTY_TOTALS_FILE,
-  ALTRIA_MULTIUNIT_TOTALS_FILE,
-  FTX_ALT_SCAN_FILE_PATH,
-  FTX_ITG_SCAN_FILE_PATH,
-  FTX_RJR_SCAN_FILE_PATH,
-  ITG_ERR_OUTPUT_FILE,
-  ITG_FTX_ERR_OUTPUT_FILE,
-  ITG_SCAN_FILE_PATH,
-  RJR_ERR_OUTPUT_FILE,
-  RJR_FTX_ERR_OUTPUT_FILE,
-  RJR_SCAN_FILE_PATH,
-)
-from pandas import DataFrame, concat, read_csv
+from init_constants import week_output_paths
+from pandas import DataFrame, Series, concat, read_csv
 from reporting_validation_errs import assemble_validation_error_report
 from rich.progress import Progress
+from scan_row_cache import ScanRowCache
 from types_column_names import (
   AltriaScanHeaders,
   ItemizedInvoiceCols,
@@ -37,6 +23,7 @@ from types_column_names import (
   RJRNamesFinal,
   RJRScanHeaders,
 )
+from types_custom import RowErrPackage
 from utils import (
   alt_start_end_dates,
   decimal_converter,
@@ -53,13 +40,6 @@ from validation_result_rjr import FTXRJRValidationModel, RJRValidationModel
 logger = getLogger(__name__)
 
 
-# Monday - Sunday
-rjr_scan_start_date, rjr_scan_end_date = rjr_start_end_dates(SETTINGS.week_shift)
-itg_scan_start_date, itg_scan_end_date = itg_start_end_dates(SETTINGS.week_shift)
-# Sunday - Saturday
-altria_scan_start_date, altria_scan_end_date = alt_start_end_dates(SETTINGS.week_shift)
-
-
 STORES_CHECK_LIST = {
   1,
   2,
@@ -140,10 +120,64 @@ STORES_CHECK_LIST = {
 addr_data = SheetCache().info
 
 
+def validate_scan_rows(
+  pbar: Progress,
+  input_data: DataFrame,
+  model: type,
+  description: str,
+  cache_name: str,
+) -> tuple[list[Series], list[RowErrPackage]]:
+  """Validate the invoice lines of a manufacturer's week against its scan data model.
+
+  With ``PATCH_SCAN_OUTPUTS`` set, only the invoices changed since the last run of the week are validated
+  again, the rows of the rest being patched in from that run.
+
+  :param model: Scan data model of the manufacturer.
+  :type model: type
+  :param description: Description of the progress bar task.
+  :type description: str
+  :param cache_name: Name of the manufacturer's week among the cached validated rows.
+  :type cache_name: str
+  :return: Validated rows and the errors found, in the order of their invoice lines.
+  :rtype: tuple[list[Series], list[RowErrPackage]]
+  """
+
+  def validate(lines: DataFrame) -> tuple[list[Series], list[RowErrPackage]]:
+    new_rows = []
+    errors = []
+
+    lines.apply(
+      taskgen_whencalled(
+        pbar,
+        description,
+        len(lines),
+      )(
+        context_setup(
+          model=model,
+          errors=errors,
+        )(apply_model_to_df_transforming)
+      )(),
+      axis=1,
+      new_rows=new_rows,
+    )
+
+    return new_rows, errors
+
+  if not SETTINGS.patch_scan_outputs:
+    return validate(input_data)
+
+  return ScanRowCache(cache_name).validate(input_data, model, validate)
+
+
 def apply_rjr_validation(
   pbar: Progress,
   input_data: DataFrame,
+  week_shift: int = SETTINGS.week_shift,
 ):
+  # Monday - Sunday
+  rjr_scan_start_date, rjr_scan_end_date = rjr_start_end_dates(week_shift)
+  paths = week_output_paths(week_shift)
+
   input_data = input_data.copy(deep=True)
 
   input_data = input_data[
@@ -151,34 +185,22 @@ def apply_rjr_validation(
     & (input_data[ItemizedInvoiceCols.DateTime] < rjr_scan_end_date)
   ]
 
-  new_rows = []
-
-  rjr_errors = []
-
-  input_data.apply(
-    taskgen_whencalled(
-      pbar,
-      "Validating RJR scan data",
-      len(input_data),
-    )(
-      context_setup(
-        model=RJRValidationModel,
-        # xtra_rules=RJR_RULES,
-        errors=rjr_errors,
-      )(apply_model_to_df_transforming)
-    )(),
-    axis=1,
-    new_rows=new_rows,
+  new_rows, rjr_errors = validate_scan_rows(
+    pbar,
+    input_data,
+    model=RJRValidationModel,
+    description="Validating RJR scan data",
+    cache_name=f"RJR_{rjr_scan_start_date:%Y%m%d}",
   )
 
-  assemble_validation_error_report(pbar, rjr_errors, "RJR", RJR_ERR_OUTPUT_FILE)
+  assemble_validation_error_report(pbar, rjr_errors, "RJR", paths.rjr_err_output_file)
 
   rjr_scan = concat(new_rows, axis=1).T
 
   rjr_scan = rjr_scan[RJRScanHeaders.all_columns()]
 
   ftx_df = read_csv(
-    FTX_RJR_SCAN_FILE_PATH,
+    paths.ftx_rjr_scan_file,
     sep="|",
     header=None,
     names=RJRScanHeaders.all_columns(),
@@ -207,7 +229,7 @@ def apply_rjr_validation(
     addr_data=addr_data,
   )
 
-  assemble_validation_error_report(pbar, ftx_errs, "FTX RJR", RJR_FTX_ERR_OUTPUT_FILE)
+  assemble_validation_error_report(pbar, ftx_errs, "FTX RJR", paths.rjr_ftx_err_output_file)
 
   ftx_df = concat(ftx_rows, axis=1).T
 
@@ -235,13 +257,18 @@ def apply_rjr_validation(
     inplace=True,
   )
 
-  rjr_scan.to_csv(RJR_SCAN_FILE_PATH, sep="|", index=False)
+  rjr_scan.to_csv(paths.rjr_scan_file, sep="|", index=False)
 
 
 def apply_altria_validation(
   pbar: Progress,
   input_data: DataFrame,
+  week_shift: int = SETTINGS.week_shift,
 ):
+  # Sunday - Saturday
+  altria_scan_start_date, altria_scan_end_date = alt_start_end_dates(week_shift)
+  paths = week_output_paths(week_shift)
+
   input_data = input_data.copy(deep=True)
 
   input_data = input_data[
@@ -249,26 +276,15 @@ def apply_altria_validation(
     & (input_data[ItemizedInvoiceCols.DateTime] < altria_scan_end_date)
   ]
 
-  new_rows = []
-  altria_errors = []
-
-  input_data.apply(
-    taskgen_whencalled(
-      pbar,
-      "Validating Altria scan data",
-      len(input_data),
-    )(
-      context_setup(
-        model=AltriaValidationModel,
-        # xtra_rules=ALTRIA_RULES,
-        errors=altria_errors,
-      )(apply_model_to_df_transforming)
-    )(),
-    axis=1,
-    new_rows=new_rows,
+  new_rows, altria_errors = validate_scan_rows(
+    pbar,
+    input_data,
+    model=AltriaValidationModel,
+    description="Validating Altria scan data",
+    cache_name=f"Altria_{altria_scan_start_date:%Y%m%d}",
   )
 
-  assemble_validation_error_report(pbar, altria_errors, "Altria", ALT_ERR_OUTPUT_FILE)
+  assemble_validation_error_report(pbar, altria_errors, "Altria", paths.alt_err_output_file)
 
   altria_scan = concat(new_rows, axis=1).T
 
@@ -277,13 +293,13 @@ def apply_altria_validation(
   loyalty_sum = altria_scan[AltriaScanHeaders.LoyaltyDiscountAmt].sum()
   multipack_sum = altria_scan[AltriaScanHeaders.TotalMultiUnitDiscountAmt].sum()
 
-  with ALTRIA_LOYALTY_TOTALS_FILE.open("w") as loyalty_file:
+  with paths.altria_loyalty_totals_file.open("w") as loyalty_file:
     loyalty_file.write(f"Total Loyalty Discount Amount: {truncate_decimal(loyalty_sum)}\n")
-  with ALTRIA_MULTIUNIT_TOTALS_FILE.open("w") as multipack_file:
+  with paths.altria_multiunit_totals_file.open("w") as multipack_file:
     multipack_file.write(f"Total Multi-Unit Discount Amount: {truncate_decimal(multipack_sum)}\n")
 
   ftx_df = read_csv(
-    FTX_ALT_SCAN_FILE_PATH,
+    paths.ftx_alt_scan_file,
     sep="|",
     header=None,
     names=AltriaScanHeaders.all_columns(),
@@ -315,7 +331,7 @@ def apply_altria_validation(
     addr_data=addr_data,
   )
 
-  assemble_validation_error_report(pbar, ftx_errs, "FTX Altria", ALT_FTX_ERR_OUTPUT_FILE)
+  assemble_validation_error_report(pbar, ftx_errs, "FTX Altria", paths.alt_ftx_err_output_file)
 
   ftx_df = concat(ftx_rows, axis=1).T
 
@@ -347,14 +363,19 @@ def apply_altria_validation(
 
   altria_scan_new.to_csv(stream, sep="|", index=False, header=False)
 
-  with ALT_SCAN_FILE_PATH.open("w") as f:
+  with paths.alt_scan_file.open("w") as f:
     f.write(stream.getvalue())
 
 
 def apply_itg_validation(
   pbar: Progress,
   input_data: DataFrame,
+  week_shift: int = SETTINGS.week_shift,
 ):
+  # Monday - Sunday
+  itg_scan_start_date, itg_scan_end_date = itg_start_end_dates(week_shift)
+  paths = week_output_paths(week_shift)
+
   input_data = input_data.copy(deep=True)
 
   input_data = input_data[
@@ -362,34 +383,23 @@ def apply_itg_validation(
     & (input_data[ItemizedInvoiceCols.DateTime] < itg_scan_end_date)
   ]
 
-  new_rows = []
-  itg_errors = []
-
-  input_data.apply(
-    taskgen_whencalled(
-      pbar,
-      "Validating ITG scan data",
-      len(input_data),
-    )(
-      context_setup(
-        # model=ITGValidationModel,
-        model=RJRValidationModel,
-        # xtra_rules=ITG_RULES,
-        errors=itg_errors,
-      )(apply_model_to_df_transforming)
-    )(),
-    axis=1,
-    new_rows=new_rows,
+  new_rows, itg_errors = validate_scan_rows(
+    pbar,
+    input_data,
+    # model=ITGValidationModel,
+    model=RJRValidationModel,
+    description="Validating ITG scan data",
+    cache_name=f"ITG_{itg_scan_start_date:%Y%m%d}",
   )
 
-  assemble_validation_error_report(pbar, itg_errors, "ITG", ITG_ERR_OUTPUT_FILE)
+  assemble_validation_error_report(pbar, itg_errors, "ITG", paths.itg_err_output_file)
 
   itg_scan = concat(new_rows, axis=1).T
 
   itg_scan = itg_scan[ITGScanHeaders.all_columns()]
 
   ftx_df = read_csv(
-    FTX_ITG_SCAN_FILE_PATH,
+    paths.ftx_itg_scan_file,
     sep="|",
     header=None,
     names=ITGScanHeaders.all_columns(),
@@ -419,7 +429,7 @@ def apply_itg_validation(
     addr_data=addr_data,
   )
 
-  assemble_validation_error_report(pbar, ftx_errs, "FTX ITG", ITG_FTX_ERR_OUTPUT_FILE)
+  assemble_validation_error_report(pbar, ftx_errs, "FTX ITG", paths.itg_ftx_err_output_file)
 
   ftx_df = concat(ftx_rows, axis=1).T
 
@@ -446,7 +456,7 @@ def apply_itg_validation(
   )
 
   itg_scan.to_csv(
-    ITG_SCAN_FILE_PATH,
+    paths.itg_scan_file,
     sep="|",
     index=False,
     header=True,
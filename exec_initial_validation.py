@@ -7,15 +7,27 @@ from concurrent.futures import Future, ThreadPoolExecutor
 from logging import getLogger
 from typing import Annotated, Callable
 
+import promo_cache
 from config import SETTINGS
-from dataframe_transformations import bulk_rate_validation_pass, itemized_inv_first_validation_pass, process_item_lines
+from dataframe_transformations import (
+  apply_bulk_rates,
+  apply_buydowns,
+  apply_vap,
+  bulk_rate_validation_pass,
+  itemized_inv_first_validation_pass,
+  parse_mixnmatch_rate,
+  process_item_lines,
+)
 from gsheet_data_processing import SheetCache
 from pandas import DatetimeIndex, concat, date_range, to_datetime
+from promo_cache import PROMO_CODE_VERSION, PromoInvoiceCache
+from promo_engine import vectorized_promotions
+from result_cache import source_digest
 from rich.progress import Progress
 from sql_querying import CUR_WEEK
 from types_column_names import ItemizedInvoiceCols
 from types_custom import BulkDataPackage, BulkRateDataType, ItemizedDataPackage, ItemizedInvoiceDataType, StoreNum
-from utils import cached_for_testing, get_full_dates, taskgen_whencalled
+from utils import cached_result, get_full_dates, taskgen_whencalled
 
 logger = getLogger(__name__)
 
@@ -26,13 +38,23 @@ start_date, end_date = get_full_dates(SETTINGS.week_shift)
 
 EXPECTED_TRANSACTION_DATES = date_range(start=start_date, end=end_date, freq="D", inclusive="left")
 
+# The promotion passes and the per invoice cache in front of them
+PROMO_DATA_VERSION = f"{PROMO_CODE_VERSION}{source_digest(promo_cache)}"
+
 
 def validate_and_concat_itemized(
   pbar: Progress,
   remaining_pbar: Callable[[int], None],
   data: dict[StoreNum, ItemizedInvoiceDataType],
   empty: list[int],
+  expected_dates: DatetimeIndex = EXPECTED_TRANSACTION_DATES,
 ) -> ItemizedInvoiceDataType:
+  """Run the first validation pass over the invoices of every store and concatenate the results.
+
+  :param expected_dates: Days the invoices are expected to fall on, stores with lines outside of them are warned
+    about.
+  :type expected_dates: DatetimeIndex
+  """
   itemized_invoice_results = []
 
   first_validation_task = pbar.add_task("Validating Itemized Invoices", total=len(data))
@@ -46,7 +68,7 @@ def validate_and_concat_itemized(
     store_datetimes: DatetimeIndex = DatetimeIndex(
       to_datetime(result.itemized_invoice_data[ItemizedInvoiceCols.DateTime])
     ).normalize()
-    test = store_datetimes.difference(EXPECTED_TRANSACTION_DATES)
+    test = store_datetimes.difference(expected_dates)
     if not test.empty:
       logger.warning(
         f"Store {result.storenum} is missing expected transaction dates or has transaction dates outside the expected window.\n"
@@ -110,14 +132,29 @@ def validate_bulk(
   return bulk_results
 
 
-@cached_for_testing(date_for_sig=CUR_WEEK)
-def process_promo_data[T: ItemizedInvoiceDataType](
-  item_lines: Annotated[T, "ignore_for_sig"],
-  bulk_rates: Annotated[BulkRateDataType, "ignore_for_sig"],
-  pbar: Annotated[Progress, "ignore_for_sig"],
-  buydowns_data: Annotated[dict, "ignore_for_sig"],
-  vap_data: Annotated[dict, "ignore_for_sig"],
+def apply_promotions[T: ItemizedInvoiceDataType](
+  item_lines: T,
+  bulk_rates: BulkRateDataType,
+  pbar: Progress,
+  buydowns_data: dict,
+  vap_data: dict,
+  promo_engine: str,
 ) -> T:
+  if promo_engine == "vectorized":
+    if item_lines.index.is_unique:
+      return vectorized_promotions(item_lines, bulk_rates, buydowns_data, vap_data)
+    logger.warning("Invoice lines carry repeated index labels, applying promotions per invoice instead")
+
+  # VAP discounts, buydowns and bulk rates only depend on the line itself, they are joined onto every line at once.
+  # The scanned coupon pass only changes and drops coupon lines, so applying bulk rates ahead of it is the same
+  item_lines = apply_vap(item_lines, vap_data)
+  item_lines = apply_buydowns(item_lines, buydowns_data)
+  item_lines = apply_bulk_rates(item_lines, bulk_rates)
+  # Parses every distinct MixNMatchRate once up front, the multipack pass of each invoice then only looks them up
+  for rate in item_lines[ItemizedInvoiceCols.MixNMatchRate].dropna().unique():
+    if isinstance(rate, str):
+      parse_mixnmatch_rate(rate)
+
   store_invoice_groups = item_lines.groupby(
     by=[ItemizedInvoiceCols.Store_Number, ItemizedInvoiceCols.Invoice_Number],
     as_index=False,
@@ -131,9 +168,50 @@ def process_promo_data[T: ItemizedInvoiceDataType](
       description="Applying promotion data to invoices",
       total=len(store_invoice_groups),
     )(process_item_lines)(),
-    bulk_rate_data=bulk_rates,
+  )
+
+  return item_lines
+
+
+def process_promo_data[T: ItemizedInvoiceDataType](
+  item_lines: T,
+  bulk_rates: BulkRateDataType,
+  pbar: Progress,
+  buydowns_data: dict,
+  vap_data: dict,
+) -> T:
+  # The engine and the invoice cache settings are passed on so a cached result is only reused under the same settings
+  return _process_promo_data(
+    item_lines=item_lines,
+    bulk_rates=bulk_rates,
+    pbar=pbar,
     buydowns_data=buydowns_data,
     vap_data=vap_data,
+    promo_engine=SETTINGS.promo_engine,
+    promo_invoice_cache=SETTINGS.promo_invoice_cache,
   )
 
-  return item_lines
+
+@cached_result(date_for_sig=CUR_WEEK, version=PROMO_DATA_VERSION)
+def _process_promo_data[T: ItemizedInvoiceDataType](
+  item_lines: Annotated[T, "ignore_for_sig"],
+  bulk_rates: Annotated[BulkRateDataType, "ignore_for_sig"],
+  pbar: Annotated[Progress, "ignore_for_sig"],
+  buydowns_data: Annotated[dict, "ignore_for_sig"],
+  vap_data: Annotated[dict, "ignore_for_sig"],
+  promo_engine: str,
+  promo_invoice_cache: bool,
+) -> T:
+  if not promo_invoice_cache:
+    return apply_promotions(item_lines, bulk_rates, pbar, buydowns_data, vap_data, promo_engine)
+
+  # Only invoices whose lines or promotion data changed since the last run go through the promotion passes
+  return PromoInvoiceCache().process(
+    item_lines,
+    bulk_rates,
+    SheetCache(),
+    process=lambda changed_lines: apply_promotions(
+      changed_lines, bulk_rates, pbar, buydowns_data, vap_data, promo_engine
+    ),
+    variant=promo_engine,
+  )
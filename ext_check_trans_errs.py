@@ -1,13 +1,14 @@
 from logging import getLogger
 
 from config import SETTINGS
+from dataframe_transformations import REPORTED_DEPARTMENTS
 from exec_initial_validation import validate_and_concat_itemized
-from init_constants import CWD
+from item_lines_dataset import write_item_lines
 from logging_config import RICH_CONSOLE, configure_logging
 from pandas import DataFrame, concat
 from rich_custom import LiveCustom
 from sql_query_builders import build_employee_info_query, build_itemized_invoice_query
-from sql_querying import query_all_stores_multithreaded
+from sql_querying import CUR_WEEK, query_all_stores_multithreaded
 from types_column_names import ItemizedInvoiceCols
 from types_custom import ItemizedInvoiceDataType, QueryDict, QueryPackage, StoreNum
 from utils import rjr_start_end_dates, taskgen_whencalled
@@ -33,7 +34,10 @@ full_period_start, full_period_end = rjr_start_end_dates(SETTINGS.week_shift)
 
 
 queries: QueryDict = {
-  "invoices": QueryPackage(query=build_itemized_invoice_query(full_period_start, full_period_end), cols=ItemizedInvoiceCols),
+  "invoices": QueryPackage(
+    query=build_itemized_invoice_query(full_period_start, full_period_end, dept_ids=REPORTED_DEPARTMENTS),
+    cols=ItemizedInvoiceCols,
+  ),
   "employees": QueryPackage(build_employee_info_query(), cols=["Cashier_ID", "EmpName"]),
 }
 
@@ -129,12 +133,8 @@ employee_info = concat(
 #   verify_integrity=True,
 # )
 
-PRECOMBINATION_ITEM_LINES_FOLDER = CWD / "item_lines"
-PRECOMBINATION_ITEM_LINES_FOLDER.mkdir(exist_ok=True)
-
 for storenum, invoices in itemized.items():
-  sorted_invoices = invoices.sort_values(ItemizedInvoiceCols.Invoice_Number)
-  sorted_invoices.to_csv(PRECOMBINATION_ITEM_LINES_FOLDER / f"{storenum:0>3}.csv", index=False)
+  write_item_lines(CUR_WEEK, storenum, invoices)
 
 
 empty = []
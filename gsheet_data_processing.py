@@ -3,21 +3,26 @@ if __name__ == "__main__":
 
   configure_logging()
 
+import os
+from datetime import timedelta
+from hashlib import sha256
 from itertools import chain
 from logging import getLogger
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional
 
+from config import SETTINGS
 from dataframe_transformations import apply_model_to_df, context_setup
-from dataframe_utils import NULL_VALUES
+from dataframe_utils import NULL_VALUES, grouped_row_hashes
 from gspread import service_account
 from gspread.http_client import BackOffHTTPClient
 from gspread.utils import ValueRenderOption, to_records
 from gspread.worksheet import Worksheet
 from pandas import DataFrame
+from result_cache import frame_fingerprint
 from types_column_names import GSheetsBuydownsCols, GSheetsStoreInfoCols, GSheetsUnitsOfMeasureCols, GSheetsVAPDiscountsCols
 from types_custom import AddressInfoType, BuydownsDataType, UnitOfMeasureDataType, VAPDataType
-from utils import SingletonType, cached_for_testing
+from utils import SingletonType, cached_result, dump_versioned_pickle, load_versioned_pickle
 from validation_gsheetdata import BuydownsModel, StoreInfoModel, UnitsOfMeasureModel, VAPDiscountsModel
 
 logger = getLogger(__name__)
@@ -44,6 +49,10 @@ VAP_DISCOUNTS_SHEETNAME = "Sheet1"
 MANUFACTURER_BUYDOWNS_SHEET_ID = "1-ha62QWkAYPPWL6ATc_we1uErqeNA9GBAyBTk8gRa6o"
 MANUFACTURER_BUYDOWNS_SHEETNAME = "Buydowns"
 
+SHEET_SNAPSHOTS_FOLDER = CWD / "sheet_snapshots"
+# Versions of the promotion sheets kept around to diff the current ones against
+MAX_SHEET_SNAPSHOTS = 20
+
 SCANNABLE_COUPONS_SHEET_ID = "19s8xwxmMqbN6Me3rGzvIQbODRAUX9iXe_cMaEaKJKGw"
 SCANNABLE_COUPONS_SHEETNAME = "Sheet1"
 
@@ -67,18 +76,92 @@ def get_all_records(
   return to_records(keys, values)
 
 
+class SheetChanges(NamedTuple):
+  # UPCs whose VAP discount rows were added, removed or edited
+  vap_upcs: frozenset
+  # States and UPCs whose buydown rows were added, removed or edited
+  buydown_keys: frozenset
+
+  @property
+  def empty(self) -> bool:
+    return not self.vap_upcs and not self.buydown_keys
+
+
+def changed_keys(previous: DataFrame, current: DataFrame, by: list[str]) -> frozenset:
+  """Values of ``by`` whose rows differ between two versions of a table, including rows only one version has."""
+  previous_hashes = grouped_row_hashes(previous, by)
+  current_hashes = grouped_row_hashes(current, by)
+
+  keys = previous_hashes.index.union(current_hashes.index)
+  differs = previous_hashes.reindex(keys, fill_value=0).to_numpy() != current_hashes.reindex(keys, fill_value=0).to_numpy()
+
+  return frozenset(keys[differs].tolist())
+
+
+def promo_data_version(bds: BuydownsDataType, vap: VAPDataType) -> str:
+  return sha256(f"{frame_fingerprint(bds)}{frame_fingerprint(vap)}".encode()).hexdigest()
+
+
+def save_sheet_snapshot(version: str, bds: BuydownsDataType, vap: VAPDataType) -> None:
+  SHEET_SNAPSHOTS_FOLDER.mkdir(exist_ok=True)
+  path = SHEET_SNAPSHOTS_FOLDER / f"{version}.pkl"
+
+  if path.exists():
+    os.utime(path)
+  else:
+    dump_versioned_pickle(path, version, (bds, vap))
+
+  snapshots = sorted(SHEET_SNAPSHOTS_FOLDER.glob("*.pkl"), key=lambda snapshot: snapshot.stat().st_mtime, reverse=True)
+  for snapshot in snapshots[MAX_SHEET_SNAPSHOTS:]:
+    snapshot.unlink(missing_ok=True)
+
+
+def load_sheet_snapshot(version: str) -> tuple[BuydownsDataType, VAPDataType] | None:
+  return load_versioned_pickle(SHEET_SNAPSHOTS_FOLDER / f"{version}.pkl", version)
+
+
 class SheetCache(metaclass=SingletonType):
   def __init__(self):
     info, bds, vap, uom = self.caching_passthru()
 
     self.info: AddressInfoType = info.set_index(GSheetsStoreInfoCols.StoreNum)
-    # self.bds = bds.set_index(GSheetsBuydownsCols.UPC)
     self.bds: BuydownsDataType = bds
+    # Buydowns apply by the State of the store and the UPC of the item
+    self.bds_by_state_upc: BuydownsDataType = bds.set_index([GSheetsBuydownsCols.State, GSheetsBuydownsCols.UPC])
     # self.vap: VAPDataType = vap.set_index(GSheetsVAPDiscountsCols.UPC)
     self.vap: VAPDataType = vap
     self.uom: UnitOfMeasureDataType = uom.set_index(GSheetsUnitsOfMeasureCols.UPC)
 
-  @cached_for_testing(pickle_path_override="caching_passthru")
+    # Every version of the buydowns and VAP sheets is kept, so results computed against an older version can be
+    # brought up to date by recomputing only what changed since
+    self.promo_version = promo_data_version(self.bds, self.vap)
+    save_sheet_snapshot(self.promo_version, self.bds, self.vap)
+    self._changes: dict[str, SheetChanges | None] = {}
+
+  def changes_since(self, version: str) -> SheetChanges | None:
+    """Diff the buydowns and VAP sheets against the version they were at when ``version`` was current.
+
+    :param version: ``promo_version`` of an earlier run.
+    :type version: str
+    :return: Keys of the rows that changed since, None if that version is no longer known.
+    :rtype: SheetChanges | None
+    """
+    if version == self.promo_version:
+      return SheetChanges(vap_upcs=frozenset(), buydown_keys=frozenset())
+
+    if version not in self._changes:
+      if (snapshot := load_sheet_snapshot(version)) is None:
+        self._changes[version] = None
+      else:
+        previous_bds, previous_vap = snapshot
+        self._changes[version] = SheetChanges(
+          vap_upcs=changed_keys(previous_vap, self.vap, [GSheetsVAPDiscountsCols.UPC]),
+          buydown_keys=changed_keys(previous_bds, self.bds, [GSheetsBuydownsCols.State, GSheetsBuydownsCols.UPC]),
+        )
+
+    return self._changes[version]
+
+  @cached_result(key_override="caching_passthru", max_age=timedelta(hours=SETTINGS.sheet_cache_max_age_hours))
   def caching_passthru(self):
     store_info_sheet = SERVICE_ACCOUNT.open_by_key(STORE_INFO_SHEET_ID).worksheet(STORE_INFO_SHEETNAME)
     bds_sheet = SERVICE_ACCOUNT.open_by_key(MANUFACTURER_BUYDOWNS_SHEET_ID).worksheet(MANUFACTURER_BUYDOWNS_SHEETNAME)
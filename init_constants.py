@@ -6,6 +6,7 @@ if __name__ == "__main__":
 from datetime import datetime, timedelta
 from logging import getLogger
 from pathlib import Path
+from typing import NamedTuple
 
 from config import SETTINGS
 from utils import alt_start_end_dates, itg_start_end_dates, rjr_start_end_dates
@@ -25,70 +26,107 @@ ITG_SCAN_MAIN_FILENAME_FORMAT = "SweetFireTobacco_{date:%m%d%Y}.csv"
 ITG_SCAN_TEST_FILENAME_FORMAT = "SweetFireTobacco_{date:%m%d%Y}_TEST.csv"
 
 
-# Monday - Sunday
-rjr_scan_start_date, rjr_scan_end_date = rjr_start_end_dates(SETTINGS.week_shift)
-itg_scan_start_date, itg_scan_end_date = itg_start_end_dates(SETTINGS.week_shift)
-# Sunday - Saturday
-altria_scan_start_date, altria_scan_end_date = alt_start_end_dates(SETTINGS.week_shift)
-
-shifted_rjr_end_date = rjr_scan_end_date - timedelta(days=1)
-shifted_alt_end_date = altria_scan_end_date - timedelta(days=1)
-shifted_itg_end_date = itg_scan_end_date - timedelta(days=1)
-
-
-week_ending_date_str = "Week Ending {month:0>2}-{daymain:0>2}({dayalt:0>2})-{year:0>4}".format(
-  month=shifted_alt_end_date.month,
-  daymain=shifted_alt_end_date.day,
-  dayalt=shifted_rjr_end_date.day,
-  year=shifted_alt_end_date.year,
-)
+class WeekOutputPaths(NamedTuple):
+  rjr_scan_file: Path
+  alt_scan_file: Path
+  itg_scan_file: Path
+  ftx_rjr_scan_file: Path
+  ftx_alt_scan_file: Path
+  ftx_itg_scan_file: Path
+  alt_err_output_file: Path
+  rjr_err_output_file: Path
+  itg_err_output_file: Path
+  alt_ftx_err_output_file: Path
+  rjr_ftx_err_output_file: Path
+  itg_ftx_err_output_file: Path
+  altria_loyalty_totals_file: Path
+  altria_multiunit_totals_file: Path
 
 
 RJR_OUTPUT_FOLDER = CWD / "Output RJR Scan Data"
 ALT_OUTPUT_FOLDER = CWD / "Output Altria Scan Data"
 ITG_OUTPUT_FOLDER = CWD / "Output ITG Scan Data"
 
-
-rjr_res_folder = RJR_OUTPUT_FOLDER / "New" / f"Week Ending {shifted_rjr_end_date:%m-%d-%y}"
-rjr_res_folder.mkdir(exist_ok=True, parents=True)
-
-RJR_SCAN_FILE_PATH = rjr_res_folder / RJR_SCAN_FILENAME_FORMAT.format(datetime=datetime.now())
-ALT_SCAN_FILE_PATH = ALT_OUTPUT_FOLDER / ALT_SCAN_FILENAME_FORMAT.format(date=shifted_alt_end_date)
-ITG_SCAN_FILE_PATH = (
-  (ITG_OUTPUT_FOLDER / ITG_SCAN_TEST_FILENAME_FORMAT.format(date=shifted_itg_end_date))
-  if SETTINGS.test_file
-  else (ITG_OUTPUT_FOLDER / ITG_SCAN_MAIN_FILENAME_FORMAT.format(date=shifted_itg_end_date))
-)
-
-rjr_sub_folder = RJR_OUTPUT_FOLDER / "submissions" / f"Week Ending {shifted_rjr_end_date:%m-%d-%y}"
-alt_sub_folder = ALT_OUTPUT_FOLDER / "submissions" / f"Week Ending {shifted_alt_end_date:%m-%d-%y}"
-itg_sub_folder = ITG_OUTPUT_FOLDER / "submissions" / f"Week Ending {shifted_itg_end_date:%m-%d-%y}"
-rjr_sub_folder.mkdir(exist_ok=True, parents=True)
-alt_sub_folder.mkdir(exist_ok=True, parents=True)
-itg_sub_folder.mkdir(exist_ok=True, parents=True)
-
-
 FTX_SCANDATA_INPUT_FOLDER = CWD / "Input FTX Scan Data"
 FTX_SCANDATA_INPUT_FOLDER.mkdir(exist_ok=True)
 
-FTX_RJR_SCAN_FILE_PATH = FTX_SCANDATA_INPUT_FOLDER / f"ftx_rjr_{shifted_rjr_end_date:%Y%m%d}.dat"
-FTX_ALT_SCAN_FILE_PATH = FTX_SCANDATA_INPUT_FOLDER / f"ftx_alt_{shifted_alt_end_date:%Y%m%d}.txt"
-FTX_ITG_SCAN_FILE_PATH = FTX_SCANDATA_INPUT_FOLDER / f"ftx_itg_{shifted_itg_end_date:%Y%m%d}.txt"
-
-
-ERR_OUTPUT_FOLDER = CWD / "Validation Errors Output" / week_ending_date_str
-ERR_OUTPUT_FOLDER.mkdir(exist_ok=True, parents=True)
-
-ALT_ERR_OUTPUT_FILE = ERR_OUTPUT_FOLDER / "ALTScanErrors.csv"
-RJR_ERR_OUTPUT_FILE = ERR_OUTPUT_FOLDER / "RJRScanErrors.csv"
-ITG_ERR_OUTPUT_FILE = ERR_OUTPUT_FOLDER / "ITGScanErrors.csv"
-ALT_FTX_ERR_OUTPUT_FILE = ERR_OUTPUT_FOLDER / "FTXAltScanErrors.csv"
-RJR_FTX_ERR_OUTPUT_FILE = ERR_OUTPUT_FOLDER / "FTXRJRScanErrors.csv"
-ITG_FTX_ERR_OUTPUT_FILE = ERR_OUTPUT_FOLDER / "FTXITGScanErrors.csv"
-
-
-REPORTING_FOLDER = CWD / "Generation Reports" / week_ending_date_str
-REPORTING_FOLDER.mkdir(exist_ok=True, parents=True)
 
-ALTRIA_LOYALTY_TOTALS_FILE = REPORTING_FOLDER / "Altria_Loyalty_Totals.csv"
-ALTRIA_MULTIUNIT_TOTALS_FILE = REPORTING_FOLDER / "Altria_MultiUnit_Totals.csv"
+def week_output_paths(week_shift: int = SETTINGS.week_shift) -> WeekOutputPaths:
+  """Input and output files of the scan data generated for the week ``week_shift`` weeks from the current one.
+
+  Every folder the files go in is created.
+  """
+  # Monday - Sunday
+  _, rjr_scan_end_date = rjr_start_end_dates(week_shift)
+  _, itg_scan_end_date = itg_start_end_dates(week_shift)
+  # Sunday - Saturday
+  _, altria_scan_end_date = alt_start_end_dates(week_shift)
+
+  shifted_rjr_end_date = rjr_scan_end_date - timedelta(days=1)
+  shifted_alt_end_date = altria_scan_end_date - timedelta(days=1)
+  shifted_itg_end_date = itg_scan_end_date - timedelta(days=1)
+
+  week_ending_date_str = "Week Ending {month:0>2}-{daymain:0>2}({dayalt:0>2})-{year:0>4}".format(
+    month=shifted_alt_end_date.month,
+    daymain=shifted_alt_end_date.day,
+    dayalt=shifted_rjr_end_date.day,
+    year=shifted_alt_end_date.year,
+  )
+
+  rjr_res_folder = RJR_OUTPUT_FOLDER / "New" / f"Week Ending {shifted_rjr_end_date:%m-%d-%y}"
+  rjr_res_folder.mkdir(exist_ok=True, parents=True)
+
+  rjr_sub_folder = RJR_OUTPUT_FOLDER / "submissions" / f"Week Ending {shifted_rjr_end_date:%m-%d-%y}"
+  alt_sub_folder = ALT_OUTPUT_FOLDER / "submissions" / f"Week Ending {shifted_alt_end_date:%m-%d-%y}"
+  itg_sub_folder = ITG_OUTPUT_FOLDER / "submissions" / f"Week Ending {shifted_itg_end_date:%m-%d-%y}"
+  rjr_sub_folder.mkdir(exist_ok=True, parents=True)
+  alt_sub_folder.mkdir(exist_ok=True, parents=True)
+  itg_sub_folder.mkdir(exist_ok=True, parents=True)
+
+  err_output_folder = CWD / "Validation Errors Output" / week_ending_date_str
+  err_output_folder.mkdir(exist_ok=True, parents=True)
+
+  reporting_folder = CWD / "Generation Reports" / week_ending_date_str
+  reporting_folder.mkdir(exist_ok=True, parents=True)
+
+  return WeekOutputPaths(
+    rjr_scan_file=rjr_res_folder / RJR_SCAN_FILENAME_FORMAT.format(datetime=datetime.now()),
+    alt_scan_file=ALT_OUTPUT_FOLDER / ALT_SCAN_FILENAME_FORMAT.format(date=shifted_alt_end_date),
+    itg_scan_file=(
+      (ITG_OUTPUT_FOLDER / ITG_SCAN_TEST_FILENAME_FORMAT.format(date=shifted_itg_end_date))
+      if SETTINGS.test_file
+      else (ITG_OUTPUT_FOLDER / ITG_SCAN_MAIN_FILENAME_FORMAT.format(date=shifted_itg_end_date))
+    ),
+    ftx_rjr_scan_file=FTX_SCANDATA_INPUT_FOLDER / f"ftx_rjr_{shifted_rjr_end_date:%Y%m%d}.dat",
+    ftx_alt_scan_file=FTX_SCANDATA_INPUT_FOLDER / f"ftx_alt_{shifted_alt_end_date:%Y%m%d}.txt",
+    ftx_itg_scan_file=FTX_SCANDATA_INPUT_FOLDER / f"ftx_itg_{shifted_itg_end_date:%Y%m%d}.txt",
+    alt_err_output_file=err_output_folder / "ALTScanErrors.csv",
+    rjr_err_output_file=err_output_folder / "RJRScanErrors.csv",
+    itg_err_output_file=err_output_folder / "ITGScanErrors.csv",
+    alt_ftx_err_output_file=err_output_folder / "FTXAltScanErrors.csv",
+    rjr_ftx_err_output_file=err_output_folder / "FTXRJRScanErrors.csv",
+    itg_ftx_err_output_file=err_output_folder / "FTXITGScanErrors.csv",
+    altria_loyalty_totals_file=reporting_folder / "Altria_Loyalty_Totals.csv",
+    altria_multiunit_totals_file=reporting_folder / "Altria_MultiUnit_Totals.csv",
+  )
+
+
+CURRENT_WEEK_PATHS = week_output_paths(SETTINGS.week_shift)
+
+RJR_SCAN_FILE_PATH = CURRENT_WEEK_PATHS.rjr_scan_file
+ALT_SCAN_FILE_PATH = CURRENT_WEEK_PATHS.alt_scan_file
+ITG_SCAN_FILE_PATH = CURRENT_WEEK_PATHS.itg_scan_file
+
+FTX_RJR_SCAN_FILE_PATH = CURRENT_WEEK_PATHS.ftx_rjr_scan_file
+FTX_ALT_SCAN_FILE_PATH = CURRENT_WEEK_PATHS.ftx_alt_scan_file
+FTX_ITG_SCAN_FILE_PATH = CURRENT_WEEK_PATHS.ftx_itg_scan_file
+
+ALT_ERR_OUTPUT_FILE = CURRENT_WEEK_PATHS.alt_err_output_file
+RJR_ERR_OUTPUT_FILE = CURRENT_WEEK_PATHS.rjr_err_output_file
+ITG_ERR_OUTPUT_FILE = CURRENT_WEEK_PATHS.itg_err_output_file
+ALT_FTX_ERR_OUTPUT_FILE = CURRENT_WEEK_PATHS.alt_ftx_err_output_file
+RJR_FTX_ERR_OUTPUT_FILE = CURRENT_WEEK_PATHS.rjr_ftx_err_output_file
+ITG_FTX_ERR_OUTPUT_FILE = CURRENT_WEEK_PATHS.itg_ftx_err_output_file
+
+ALTRIA_LOYALTY_TOTALS_FILE = CURRENT_WEEK_PATHS.altria_loyalty_totals_file
+ALTRIA_MULTIUNIT_TOTALS_FILE = CURRENT_WEEK_PATHS.altria_multiunit_totals_file
@@ -0,0 +1,228 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+import json
+from datetime import datetime, timedelta
+from logging import getLogger
+from pathlib import Path
+from typing import NotRequired, TypedDict
+
+import pyarrow.parquet as pq
+from config import SETTINGS
+from item_lines_dataset import ITEM_LINES_COMPRESSION
+from pandas import DataFrame, concat, isna
+from result_cache import frame_to_table, table_to_frame
+from types_column_names import ItemizedInvoiceCols
+from types_custom import ItemizedInvoiceDataType, StoreNum
+from utils import atomic_write
+
+logger = getLogger(__name__)
+
+
+CWD = Path.cwd()
+
+
+INVOICE_STORE_FOLDER = CWD / "invoice_store"
+
+
+class StoreWatermark(TypedDict):
+  # Earliest invoice datetime the local copy is complete from, lines before it are pruned
+  covered_from: str
+  # Latest Invoice_Totals.DateTime seen in the local copy
+  high_water: str
+  # Columns the local copy holds for every invoice since covered_from, every column when missing
+  columns: NotRequired[list[str]]
+
+
+class LocalInvoiceStore:
+  """Local copy of every store's itemized invoice lines, keyed by store and ``Invoice_Number``.
+
+  Each store keeps a high-water mark on ``Invoice_Totals.DateTime`` so only invoices newer than the
+  last pull, plus a re-read window of ``reread`` for invoices edited after the fact, need to be queried.
+
+  Every store is stored as a parquet file, and lines older than ``retention_weeks`` weeks before the scan
+  period are pruned whenever the store is merged.
+  """
+
+  def __init__(
+    self,
+    folder: Path = INVOICE_STORE_FOLDER,
+    reread: timedelta = timedelta(hours=SETTINGS.invoice_reread_hours),
+    retention_weeks: int = SETTINGS.invoice_store_retention_weeks,
+  ):
+    self.folder = folder
+    self.folder.mkdir(exist_ok=True, parents=True)
+    self.reread = reread
+    self.retention_weeks = retention_weeks
+    self.watermarks_path = self.folder / "watermarks.json"
+
+    self.watermarks: dict[str, StoreWatermark] = {}
+    if self.watermarks_path.exists():
+      with self.watermarks_path.open("r") as file:
+        self.watermarks = json.load(file)
+
+  def _store_path(self, storenum: StoreNum) -> Path:
+    return self.folder / f"{storenum:0>3}.parquet"
+
+  def fetch_start(self, storenum: StoreNum, period_start: datetime, columns: list[str] | None = None) -> datetime:
+    """Earliest invoice datetime that has to be queried from ``storenum`` to cover ``period_start`` onwards.
+
+    :param storenum: Store to be queried.
+    :type storenum: StoreNum
+    :param period_start: Start of the period the scan files are generated for.
+    :type period_start: datetime
+    :param columns: Columns that will be selected, all columns if not given.
+    :type columns: list[str] | None
+    :return: ``period_start`` when the local copy does not already cover it or lacks some of ``columns``,
+      otherwise the store's high-water mark less the re-read window.
+    :rtype: datetime
+    """
+    if (watermark := self.watermarks.get(str(storenum))) is None or not self._store_path(storenum).exists():
+      return period_start
+
+    if datetime.fromisoformat(watermark["covered_from"]) > period_start:
+      return period_start
+
+    if not self._covers_columns(watermark, columns):
+      return period_start
+
+    return max(period_start, datetime.fromisoformat(watermark["high_water"]) - self.reread)
+
+  @staticmethod
+  def _covers_columns(watermark: StoreWatermark, columns: list[str] | None) -> bool:
+    if (held := watermark.get("columns")) is None:
+      return True
+    return columns is not None and set(columns).issubset(held)
+
+  def load(self, storenum: StoreNum) -> ItemizedInvoiceDataType | None:
+    if not (path := self._store_path(storenum)).exists():
+      return None
+    return table_to_frame(pq.read_table(path, memory_map=True))
+
+  def merge(
+    self,
+    storenum: StoreNum,
+    fetched: ItemizedInvoiceDataType,
+    fetched_from: datetime,
+    keep_from: datetime | None = None,
+  ) -> ItemizedInvoiceDataType:
+    """Merge freshly queried invoice lines into the local copy of ``storenum`` and advance its watermark.
+
+    Every invoice present in ``fetched`` replaces the local version of that invoice, and local invoices
+    dated inside the re-queried window that are missing from ``fetched`` are dropped as deleted. Lines dated
+    before ``keep_from`` are pruned.
+
+    :param storenum: Store the invoice lines were queried from.
+    :type storenum: StoreNum
+    :param fetched: Invoice lines returned for ``DateTime >= fetched_from``.
+    :type fetched: ItemizedInvoiceDataType
+    :param fetched_from: Start of the window that was queried.
+    :type fetched_from: datetime
+    :param keep_from: Oldest invoice datetime to keep, every line is kept if not given.
+    :type keep_from: datetime | None
+    :return: The merged local copy.
+    :rtype: ItemizedInvoiceDataType
+    """
+    existing = self.load(storenum)
+    watermark = self.watermarks.get(str(storenum))
+
+    if (
+      existing is None
+      or watermark is None
+      or datetime.fromisoformat(watermark["covered_from"]) > fetched_from
+      or not self._covers_columns(watermark, list(fetched.columns))
+    ):
+      # Nothing usable locally, or the pull reached further back or selected more columns than the local copy
+      # holds, start over from the pull
+      merged = fetched
+      covered_from = fetched_from
+    else:
+      stale = existing[ItemizedInvoiceCols.Invoice_Number].isin(fetched[ItemizedInvoiceCols.Invoice_Number]) | (
+        existing[ItemizedInvoiceCols.DateTime] >= fetched_from
+      )
+      merged = concat([existing.loc[~stale], fetched], ignore_index=True) if len(fetched) else existing.loc[~stale]
+      covered_from = datetime.fromisoformat(watermark["covered_from"])
+
+    if keep_from is not None and keep_from > covered_from:
+      merged = merged.loc[merged[ItemizedInvoiceCols.DateTime] >= keep_from]
+      covered_from = keep_from
+
+    merged = merged.sort_values(
+      [ItemizedInvoiceCols.Invoice_Number, ItemizedInvoiceCols.LineNum],
+      ignore_index=True,
+    )
+
+    high_water = merged[ItemizedInvoiceCols.DateTime].max()
+    high_water = fetched_from if isna(high_water) else high_water.to_pydatetime()
+
+    if not self._write_store(storenum, merged):
+      # Without a local copy the next run pulls the whole period again
+      self.watermarks.pop(str(storenum), None)
+      self._write_watermarks()
+      return merged
+
+    self.watermarks[str(storenum)] = StoreWatermark(
+      covered_from=covered_from.isoformat(),
+      high_water=high_water.isoformat(),
+      columns=list(fetched.columns),
+    )
+    self._write_watermarks()
+
+    logger.debug(f"SFT {storenum:0>3}: Merged {len(fetched)} fetched invoice lines, local copy holds {len(merged)} lines")
+
+    return merged
+
+  def refresh(
+    self,
+    fetched: dict[StoreNum, ItemizedInvoiceDataType],
+    fetch_starts: dict[StoreNum, datetime],
+    period_start: datetime,
+    period_end: datetime,
+  ) -> dict[StoreNum, ItemizedInvoiceDataType]:
+    """Merge the fetched invoice lines of every store and read the scan period back out of the local store.
+
+    Stores missing from ``fetched`` failed to be queried and are left out of the result, as they would be
+    for a full pull. Lines older than ``retention_weeks`` weeks before ``period_start`` are pruned from the
+    merged stores.
+
+    :param fetched: Invoice lines queried per store.
+    :type fetched: dict[StoreNum, ItemizedInvoiceDataType]
+    :param fetch_starts: Start of the window that was queried per store, as given by :meth:`fetch_start`.
+    :type fetch_starts: dict[StoreNum, datetime]
+    :param period_start: Start of the scan period. Inclusive
+    :type period_start: datetime
+    :param period_end: End of the scan period. Exclusive
+    :type period_end: datetime
+    :return: Invoice lines of the scan period per store.
+    :rtype: dict[StoreNum, ItemizedInvoiceDataType]
+    """
+    period_invoices = {}
+    keep_from = period_start - timedelta(weeks=self.retention_weeks)
+
+    for storenum, store_fetched in fetched.items():
+      merged = self.merge(storenum, store_fetched, fetch_starts[storenum], keep_from)
+
+      in_period = (merged[ItemizedInvoiceCols.DateTime] >= period_start) & (merged[ItemizedInvoiceCols.DateTime] < period_end)
+      period_invoices[storenum] = merged.loc[in_period].reset_index(drop=True)
+
+    return period_invoices
+
+  def _write_store(self, storenum: StoreNum, data: DataFrame) -> bool:
+    path = self._store_path(storenum)
+    # Left behind by earlier versions of the store
+    path.with_suffix(".pkl").unlink(missing_ok=True)
+
+    # Decimal columns are stored as their string representation, a fixed scale parquet decimal would change
+    # the exponent of every value
+    if (table := frame_to_table(data)) is None:
+      logger.warning(f"SFT {storenum:0>3}: Invoice lines cannot be stored as parquet, dropping the local copy")
+      path.unlink(missing_ok=True)
+      return False
+
+    atomic_write(path, lambda temp_path: pq.write_table(table, temp_path, compression=ITEM_LINES_COMPRESSION))
+    return True
+
+  def _write_watermarks(self) -> None:
+    atomic_write(self.watermarks_path, lambda temp_path: temp_path.write_text(json.dumps(self.watermarks, indent=2)))
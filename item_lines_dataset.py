@@ -0,0 +1,178 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+from datetime import date, datetime
+from logging import getLogger
+from pathlib import Path
+
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from dataframe_utils import normalize_column_values
+from init_constants import PRECOMBINATION_ITEM_LINES_FOLDER
+from pandas import DataFrame, Int64Dtype
+from pyarrow import ArrowException, Table, array, date32, decimal128, int16, int64, schema, string, timestamp
+from pyarrow.fs import LocalFileSystem
+from types_column_names import ItemizedInvoiceCols
+from types_custom import ColNameEnum, ItemizedInvoiceDataType, PhysicalDtype, StoreNum
+from utils import atomic_write
+
+logger = getLogger(__name__)
+
+
+ITEM_LINES_FILENAME = "part-0.parquet"
+ITEM_LINES_COMPRESSION = "zstd"
+
+PARTITIONING = ds.partitioning(schema([("week", date32()), ("store", int16())]), flavor="hive")
+
+ARROW_TYPES = {
+  PhysicalDtype.INT: int64(),
+  PhysicalDtype.DATETIME: timestamp("ns"),
+  # Categories are written as plain strings and restored on read, parquet dictionary encodes them regardless
+  PhysicalDtype.CATEGORY: string(),
+  PhysicalDtype.DECIMAL: decimal128(38, 8),
+  PhysicalDtype.TEXT: string(),
+}
+
+
+def item_lines_partition(week: date | datetime, storenum: StoreNum, folder: Path = PRECOMBINATION_ITEM_LINES_FOLDER) -> Path:
+  if isinstance(week, datetime):
+    week = week.date()
+  return folder / f"week={week:%Y-%m-%d}" / f"store={storenum}"
+
+
+def to_arrow_table(data: DataFrame, cols: type[ColNameEnum] = ItemizedInvoiceCols) -> Table:
+  """Convert a query frame to an Arrow table, storing every column with a declared physical dtype in its Arrow type.
+
+  Columns whose values cannot be represented in their Arrow type are left for Arrow to infer.
+  """
+  dtypes = cols.physical_dtypes()
+  arrays = {}
+
+  for column in data.columns:
+    values = data[column]
+    if (arrow_type := ARROW_TYPES.get(dtypes.get(column))) is not None:
+      if dtypes[column] is PhysicalDtype.CATEGORY:
+        values = values.astype(object)
+      try:
+        arrays[column] = array(values, type=arrow_type, from_pandas=True)
+        continue
+      except (ArrowException, TypeError, ValueError):
+        logger.debug(f"Unable to store {column} as {arrow_type}, letting arrow infer its type")
+
+    arrays[column] = array(values, from_pandas=True)
+
+  return Table.from_pydict(arrays)
+
+
+def write_item_lines(
+  week: date | datetime,
+  storenum: StoreNum,
+  data: ItemizedInvoiceDataType,
+  folder: Path = PRECOMBINATION_ITEM_LINES_FOLDER,
+) -> Path:
+  """Write one store's invoice lines for ``week`` to its partition of the item lines dataset.
+
+  The partition is replaced atomically, a reader never sees a partially written file.
+
+  :param week: Week the invoice lines were extracted for.
+  :type week: date | datetime
+  :param storenum: Store the invoice lines belong to.
+  :type storenum: StoreNum
+  :param data: Invoice lines as returned by the itemized invoice query.
+  :type data: ItemizedInvoiceDataType
+  :param folder: Root folder of the dataset.
+  :type folder: Path
+  :return: Path of the written parquet file.
+  :rtype: Path
+  """
+  partition = item_lines_partition(week, storenum, folder)
+  partition.mkdir(exist_ok=True, parents=True)
+
+  path = partition / ITEM_LINES_FILENAME
+  table = to_arrow_table(data.sort_values(ItemizedInvoiceCols.Invoice_Number, ignore_index=True))
+  atomic_write(
+    path,
+    lambda temp_path: pq.write_table(table, temp_path, compression=ITEM_LINES_COMPRESSION),
+    # Dot prefixed files are skipped by dataset discovery
+    temp_path=partition / f".{ITEM_LINES_FILENAME}.tmp",
+  )
+
+  return path
+
+
+def read_item_lines(
+  weeks: list[date | datetime] | None = None,
+  storenums: list[StoreNum] | None = None,
+  start: datetime | None = None,
+  end: datetime | None = None,
+  dept_ids: list[str] | None = None,
+  columns: list[str] | None = None,
+  folder: Path = PRECOMBINATION_ITEM_LINES_FOLDER,
+) -> ItemizedInvoiceDataType:
+  """Read invoice lines back out of the item lines dataset.
+
+  Files are memory mapped, and every filter is pushed down to the partition and row group level so only
+  matching partitions and row groups are read.
+
+  :param weeks: Extraction weeks to read, all weeks if not given.
+  :type weeks: list[date | datetime] | None
+  :param storenums: Stores to read, all stores if not given.
+  :type storenums: list[StoreNum] | None
+  :param start: Only read invoice lines with a DateTime at or after this. Inclusive
+  :type start: datetime | None
+  :param end: Only read invoice lines with a DateTime before this. Exclusive
+  :type end: datetime | None
+  :param dept_ids: Only read invoice lines of these departments.
+  :type dept_ids: list[str] | None
+  :param columns: Columns to read, all columns if not given. The ``week`` and ``store`` partition
+    columns can be selected like any other column.
+  :type columns: list[str] | None
+  :param folder: Root folder of the dataset.
+  :type folder: Path
+  :return: The matching invoice lines.
+  :rtype: ItemizedInvoiceDataType
+  """
+  if not folder.exists() or not any(folder.glob(f"week=*/store=*/{ITEM_LINES_FILENAME}")):
+    return DataFrame(columns=columns)
+
+  dataset = ds.dataset(
+    str(folder),
+    format="parquet",
+    partitioning=PARTITIONING,
+    filesystem=LocalFileSystem(use_mmap=True),
+  )
+
+  filters = []
+  if weeks is not None:
+    filters.append(pc.field("week").isin([week.date() if isinstance(week, datetime) else week for week in weeks]))
+  if storenums is not None:
+    filters.append(pc.field("store").isin(storenums))
+  if start is not None:
+    filters.append(pc.field(ItemizedInvoiceCols.DateTime) >= start)
+  if end is not None:
+    filters.append(pc.field(ItemizedInvoiceCols.DateTime) < end)
+  if dept_ids is not None:
+    filters.append(pc.field(ItemizedInvoiceCols.Dept_ID).isin(dept_ids))
+
+  expression = None
+  for filter_ in filters:
+    expression = filter_ if expression is None else expression & filter_
+
+  table = dataset.to_table(columns=columns, filter=expression)
+
+  item_lines = table.to_pandas(types_mapper={int64(): Int64Dtype()}.get)
+
+  for column, dtype in ItemizedInvoiceCols.physical_dtypes().items():
+    if column not in item_lines.columns:
+      continue
+    match dtype:
+      case PhysicalDtype.CATEGORY:
+        item_lines[column] = item_lines[column].astype("category")
+      case PhysicalDtype.DECIMAL:
+        # Zeros come back out of the fixed scale decimal column as 0E-8
+        item_lines[column] = normalize_column_values(item_lines[column].to_numpy(dtype=object, copy=True), dtype)
+
+  return item_lines
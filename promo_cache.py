@@ -0,0 +1,213 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+from collections.abc import Callable
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+from typing import NamedTuple
+
+import dataframe_transformations
+import dataframe_utils
+import promo_engine
+import utils
+from dataframe_transformations import index_bulk_rates
+from dataframe_utils import INVOICE_COLUMNS, grouped_row_hashes, invoice_keys
+from gsheet_data_processing import SheetCache
+from pandas import DataFrame, MultiIndex, Series, concat
+from reference_index import InvoiceReferenceIndex
+from result_cache import source_digest
+from types_column_names import BulkRateCols, ItemizedInvoiceCols
+from types_custom import BulkRateDataType, ItemizedInvoiceDataType, StoreNum
+from utils import dump_versioned_pickle, load_versioned_pickle
+
+logger = getLogger(__name__)
+
+
+CWD = Path.cwd()
+
+
+PROMO_CACHE_FOLDER = CWD / "promo_cache"
+
+# Position of a processed line among the lines of its invoice before processing
+OFFSET_COLUMN = "_Line_Offset"
+
+# The promotion passes and the helpers they call, a change to any of them invalidates every cached invoice
+PROMO_CODE_VERSION = sha256(
+  "".join(source_digest(module) for module in (dataframe_transformations, dataframe_utils, promo_engine, utils)).encode()
+).hexdigest()
+
+
+class StorePromoEntry(NamedTuple):
+  version: str
+  # ``SheetCache.promo_version`` the invoices were processed against
+  sheet_version: str
+  # Key of every invoice of the store, including invoices the promotion passes dropped entirely
+  keys: dict
+  # Processed lines, with their ``OFFSET_COLUMN``
+  rows: DataFrame
+
+
+def promo_invoice_keys(
+  item_lines: ItemizedInvoiceDataType,
+  positions: Series,
+  bulk_rates: dict[StoreNum, BulkRateDataType],
+) -> Series:
+  """Key every invoice by its lines and the bulk rate rows its lines look up.
+
+  Edits of the buydowns and VAP sheets are tracked by diffing the sheets instead, see ``SheetCache.changes_since``.
+
+  :param positions: Position of every line within its invoice.
+  :type positions: Series
+  :return: Key per invoice, indexed by store and invoice number.
+  :rtype: Series
+  """
+  bulk_hashes = (
+    concat(
+      {
+        storenum: grouped_row_hashes(index_bulk_rates(bulk).reset_index(), [BulkRateCols.ItemNum])
+        for storenum, bulk in bulk_rates.items()
+      }
+    )
+    if bulk_rates
+    else Series(dtype="uint64")
+  )
+
+  return invoice_keys(
+    item_lines,
+    positions,
+    bulk=bulk_hashes.reindex(
+      MultiIndex.from_arrays(
+        [item_lines[ItemizedInvoiceCols.Store_Number].to_numpy(), item_lines[ItemizedInvoiceCols.ItemNum].to_numpy()]
+      ),
+      fill_value=0,
+    ).to_numpy()
+    if not bulk_hashes.empty
+    else 0,
+  )
+
+
+class PromoInvoiceCache:
+  """Processed invoice lines of every store, keyed per invoice, so reruns only process new or changed invoices."""
+
+  def __init__(self, folder: Path = PROMO_CACHE_FOLDER):
+    self.folder = folder
+    self.folder.mkdir(exist_ok=True, parents=True)
+
+  def _store_path(self, storenum: StoreNum) -> Path:
+    return self.folder / f"{storenum:0>3}.pkl"
+
+  def load(self, storenum: StoreNum, version: str) -> StorePromoEntry | None:
+    return load_versioned_pickle(self._store_path(storenum), version)
+
+  def update(self, storenum: StoreNum, entry: StorePromoEntry) -> None:
+    dump_versioned_pickle(self._store_path(storenum), entry.version, entry)
+
+  def process(
+    self,
+    item_lines: ItemizedInvoiceDataType,
+    bulk_rates: dict[StoreNum, BulkRateDataType],
+    sheets: SheetCache,
+    process: Callable[[ItemizedInvoiceDataType], ItemizedInvoiceDataType],
+    variant: str = "",
+  ) -> ItemizedInvoiceDataType:
+    """Apply the promotion passes to ``item_lines``, reusing the processed lines of every unchanged invoice.
+
+    An invoice is processed again when its lines or the bulk rates they look up changed, or when the buydowns
+    or VAP rows of one of its UPCs were edited since it was last processed.
+
+    The result matches running ``process`` over all of ``item_lines``: the same lines under the same index
+    labels, in the order the invoice groupby returns them.
+
+    :param sheets: Current buydowns and VAP sheets.
+    :type sheets: SheetCache
+    :param process: Applies the promotion passes to the lines of whole invoices.
+    :type process: Callable[[ItemizedInvoiceDataType], ItemizedInvoiceDataType]
+    :param variant: Names how ``process`` applies the passes, invoices processed under another variant are redone.
+    :type variant: str
+    :return: Processed invoice lines.
+    :rtype: ItemizedInvoiceDataType
+    """
+    version = sha256(f"{PROMO_CODE_VERSION}{variant}{list(item_lines.columns)!r}".encode()).hexdigest()
+
+    positions = item_lines.groupby(INVOICE_COLUMNS, sort=False, dropna=False).cumcount()
+    keys = promo_invoice_keys(item_lines, positions, bulk_rates)
+    line_invoices = MultiIndex.from_arrays([item_lines[column] for column in INVOICE_COLUMNS])
+
+    reused: dict[StoreNum, DataFrame] = {}
+    hits: set[tuple] = set()
+    up_to_date: set[StoreNum] = set()
+    store_keys = {storenum: store_keys.droplevel(0).to_dict() for storenum, store_keys in keys.groupby(level=0)}
+    reference_index: InvoiceReferenceIndex | None = None
+
+    for storenum, current_keys in store_keys.items():
+      if (entry := self.load(storenum, version)) is None:
+        continue
+
+      if (changes := sheets.changes_since(entry.sheet_version)) is None:
+        logger.debug(f"SFT {storenum:0>3}: Promotion sheets changed beyond the known versions, processing every invoice")
+        continue
+
+      affected = set()
+      if not changes.empty:
+        if reference_index is None:
+          reference_index = InvoiceReferenceIndex(item_lines)
+        affected = reference_index.affected(changes)
+      elif entry.sheet_version == sheets.promo_version:
+        up_to_date.add(storenum)
+
+      store_hits = [
+        invoice
+        for invoice, key in current_keys.items()
+        if entry.keys.get(invoice) == key and (storenum, invoice) not in affected
+      ]
+      hits.update((storenum, invoice) for invoice in store_hits)
+
+      rows = entry.rows[entry.rows[ItemizedInvoiceCols.Invoice_Number].isin(store_hits)].copy()
+      # Cached lines take the labels their invoice lines carry in this run
+      store_mask = item_lines[ItemizedInvoiceCols.Store_Number] == storenum
+      labels = Series(
+        item_lines.index[store_mask],
+        index=MultiIndex.from_arrays([item_lines.loc[store_mask, ItemizedInvoiceCols.Invoice_Number], positions[store_mask]]),
+      )
+      rows.index = labels.reindex(
+        MultiIndex.from_arrays([rows[ItemizedInvoiceCols.Invoice_Number], rows[OFFSET_COLUMN]])
+      ).to_numpy()
+      reused[storenum] = rows
+
+    changed_lines = item_lines[~line_invoices.isin(hits)]
+    logger.info(
+      f"Reusing the promotions of {len(hits)} of {len(keys)} invoices, processing {keys.size - len(hits)} new or changed"
+    )
+
+    processed = process(changed_lines) if not changed_lines.empty else item_lines.iloc[:0]
+    processed = processed.assign(**{OFFSET_COLUMN: positions.reindex(processed.index).to_numpy()})
+    cacheable = processed.index.is_unique and processed.index.isin(positions.index).all()
+    if not cacheable:
+      logger.warning("Promotion passes returned lines not in their input, not caching the processed invoices")
+
+    merged = concat([*reused.values(), processed])
+    merged.sort_values(by=[*INVOICE_COLUMNS, OFFSET_COLUMN], kind="stable", inplace=True)
+
+    if cacheable:
+      processed_by_store = dict(tuple(processed.groupby(ItemizedInvoiceCols.Store_Number)))
+      for storenum, current_keys in store_keys.items():
+        if storenum in up_to_date and all((storenum, invoice) in hits for invoice in current_keys):
+          # Every invoice of the store was reused, the cached entry already holds them
+          continue
+        rows = concat(
+          [processed.iloc[:0], *(frame for frame in (reused.get(storenum), processed_by_store.get(storenum)) if frame is not None)]
+        )
+        self.update(
+          storenum,
+          StorePromoEntry(
+            version=version,
+            sheet_version=sheets.promo_version,
+            keys=current_keys,
+            rows=rows.reset_index(drop=True),
+          ),
+        )
+
+    return merged.drop(columns=OFFSET_COLUMN)
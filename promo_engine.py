@@ -0,0 +1,328 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+from decimal import Decimal
+from logging import getLogger
+
+from dataframe_transformations import (
+  ALL_COUPON_DEPARTMENTS,
+  COUPON_IDENTIFIER_CODES,
+  LOYALTY_IDENTIFIERS,
+  MULTIPACK_IDENTIFIERS,
+  REGULAR_COUPON_DEPARTMENTS,
+  apply_bulk_rates,
+  apply_buydowns,
+  apply_mixnmatch_rates,
+  apply_vap,
+)
+from dataframe_utils import INVOICE_COLUMNS, distribute_discounts
+from numpy import int64, zeros
+from pandas import DataFrame, MultiIndex, Series
+from types_column_names import ItemizedInvoiceCols
+from types_custom import BulkRateDataType, BuydownsDataType, ItemizedInvoiceDataType, StoreNum, VAPDataType
+
+logger = getLogger(__name__)
+
+
+# Coupons whose value is the percentage in PricePer rather than the line price
+PERCENTAGE_COUPONS = ["EmployeeDisc10", "VeteranDisc10"]
+
+INVOICE = "_Invoice"
+COUPON = "_Coupon"
+RANK = "_Rank"
+COUPON_ID = "_Coupon_Id"
+
+
+def vectorized_promotions[T: ItemizedInvoiceDataType](
+  item_lines: T,
+  bulk_rates: dict[StoreNum, BulkRateDataType],
+  buydowns_data: BuydownsDataType,
+  vap_data: VAPDataType,
+) -> T:
+  """Apply the promotion passes to every invoice at once.
+
+  Produces the same lines as grouping ``item_lines`` by invoice and applying ``process_item_lines`` to every
+  invoice: the same values under the same labels, in the order the invoice groupby returns them. The labels of
+  ``item_lines`` have to be unique.
+
+  :param item_lines: Invoice lines of any number of stores and invoices.
+  :type item_lines: ItemizedInvoiceDataType
+  :param bulk_rates: Bulk rates per store.
+  :type bulk_rates: dict[StoreNum, BulkRateDataType]
+  :param buydowns_data: Buydowns sheet.
+  :type buydowns_data: BuydownsDataType
+  :param vap_data: VAP sheet.
+  :type vap_data: VAPDataType
+  :return: Processed invoice lines.
+  :rtype: ItemizedInvoiceDataType
+  """
+  labels = item_lines.index
+
+  # Lines are addressed by position, the invoice of every line is a column until the lines are returned
+  lines = item_lines.reset_index(drop=True)
+  lines[INVOICE] = lines.groupby(INVOICE_COLUMNS, sort=False, dropna=False).ngroup()
+
+  lines = apply_vap(lines, vap_data)
+  lines = apply_buydowns(lines, buydowns_data)
+  lines = apply_bulk_rates(lines, bulk_rates)
+
+  lines = drop_coupon_only_invoices(lines)
+  lines = apply_scanned_coupons(lines)
+  lines = apply_mixnmatch_rates(lines)
+  lines = apply_multiunit_coupons(lines)
+  lines = apply_loyalty_coupons(lines)
+
+  lines.sort_values(by=INVOICE_COLUMNS, kind="stable", inplace=True)
+  lines.index = labels[lines.index.to_numpy()]
+
+  return lines.drop(columns=INVOICE)
+
+
+def drop_coupon_only_invoices(lines: DataFrame) -> DataFrame:
+  """Drop the invoices holding nothing but coupons, they contain no item that needs to be reported."""
+  is_any_coupon = lines[ItemizedInvoiceCols.Dept_ID].isin(ALL_COUPON_DEPARTMENTS)
+  return lines[~is_any_coupon.groupby(lines[INVOICE]).transform("all")]
+
+
+def apply_scanned_coupons(lines: DataFrame) -> DataFrame:
+  """Spread the biggest scanned coupon of every invoice over its items, dropping the coupon lines.
+
+  Repeated coupons are first combined into the first of them, as ``combine_same_coupons`` does.
+  """
+  dept_ids = lines[ItemizedInvoiceCols.Dept_ID]
+  is_coupon = dept_ids.isin(REGULAR_COUPON_DEPARTMENTS)
+  is_coupon_applicable = ~dept_ids.isin(ALL_COUPON_DEPARTMENTS)
+
+  has_coupon = is_coupon.groupby(lines[INVOICE]).transform("any")
+  if not has_coupon.any():
+    return lines
+
+  item_keys = [INVOICE, ItemizedInvoiceCols.ItemNum]
+  first_coupons = lines[is_coupon & ~lines.duplicated(item_keys, keep="first")]
+
+  # Every other line sharing the item number of a coupon is folded into that coupon
+  line_keys = MultiIndex.from_frame(lines[item_keys])
+  coupon_keys = MultiIndex.from_frame(first_coupons[item_keys])
+  is_combined = line_keys.isin(coupon_keys) & ~lines.index.isin(first_coupons.index)
+
+  if is_combined.any():
+    sum_columns = [ItemizedInvoiceCols.Inv_Price, ItemizedInvoiceCols.Quantity]
+    totals = lines[line_keys.isin(coupon_keys)].groupby(item_keys, sort=False)[sum_columns].sum()
+    repeated = first_coupons[coupon_keys.isin(line_keys[is_combined])]
+
+    lines = lines[~is_combined].copy()
+    lines.loc[repeated.index, sum_columns] = totals.reindex(MultiIndex.from_frame(repeated[item_keys])).to_numpy()
+
+  is_coupon = is_coupon.reindex(lines.index)
+  coupons = lines[is_coupon]
+
+  # The first of the most valuable coupons of every invoice is applied
+  biggest_price = coupons.groupby(INVOICE)[ItemizedInvoiceCols.Inv_Price].transform("max")
+  biggest = coupons[coupons[ItemizedInvoiceCols.Inv_Price] == biggest_price].drop_duplicates(INVOICE)
+  biggest_values = [
+    abs(price_per) if itemnum in PERCENTAGE_COUPONS else price
+    for itemnum, price, price_per in zip(
+      biggest[ItemizedInvoiceCols.ItemNum], biggest[ItemizedInvoiceCols.Inv_Price], biggest[ItemizedInvoiceCols.PricePer]
+    )
+  ]
+
+  lines = lines.drop(index=first_coupons.index)
+
+  applicable = lines[is_coupon_applicable.reindex(lines.index) & lines[INVOICE].isin(biggest[INVOICE])]
+  coupon_values = Series(biggest_values, index=biggest[INVOICE].to_numpy(), dtype=object)
+  coupon_names = Series(biggest[ItemizedInvoiceCols.ItemName].to_numpy(), index=biggest[INVOICE].to_numpy())
+
+  distributed = distribute_discounts(
+    applicable[ItemizedInvoiceCols.Inv_Price],
+    applicable[ItemizedInvoiceCols.Quantity],
+    applicable[INVOICE],
+    coupon_values,
+  )
+
+  lines.loc[applicable.index, ItemizedInvoiceCols.Acct_Promo_Name] = coupon_names.reindex(applicable[INVOICE]).to_numpy()
+  lines.loc[distributed.index, ItemizedInvoiceCols.Acct_Discount_Amt] = distributed
+
+  return lines
+
+
+def collect_invoice_coupons(lines: DataFrame, identifiers: dict[str, list[str]]) -> DataFrame:
+  """Total every coupon of ``identifiers`` per invoice, as the multiunit and loyalty passes do.
+
+  :return: Per invoice and coupon item number, the summed quantity, the price and code of the last of its
+    lines and the order of the coupon among the coupons of its invoice.
+  :rtype: DataFrame
+  """
+  coupon_lines = lines[lines[ItemizedInvoiceCols.ItemNum].isin(identifiers.keys())]
+  coupon_keys = [INVOICE, ItemizedInvoiceCols.ItemNum]
+
+  coupons = coupon_lines.drop_duplicates(coupon_keys, keep="last").set_index(coupon_keys)
+  quantities = coupon_lines.groupby(coupon_keys, sort=False)[ItemizedInvoiceCols.Quantity].sum()
+
+  # Coupons are applied in the order they first appear on their invoice
+  order = coupon_lines.drop_duplicates(coupon_keys, keep="first")
+  order = Series(order.groupby(INVOICE).cumcount().to_numpy(), index=MultiIndex.from_frame(order[coupon_keys]))
+
+  codes = [
+    COUPON_IDENTIFIER_CODES[itemnum] if itemnum in COUPON_IDENTIFIER_CODES else extra
+    for itemnum, extra in zip(
+      coupons.index.get_level_values(ItemizedInvoiceCols.ItemNum), coupons[ItemizedInvoiceCols.ItemName_Extra]
+    )
+  ]
+
+  return DataFrame(
+    {
+      ItemizedInvoiceCols.Quantity: quantities.reindex(coupons.index).to_numpy(),
+      ItemizedInvoiceCols.PricePer: coupons[ItemizedInvoiceCols.PricePer].to_numpy(),
+      "code": codes,
+      RANK: order.reindex(coupons.index).to_numpy(),
+    },
+    index=coupons.index.rename([INVOICE, COUPON]),
+  ).reset_index()
+
+
+def applicable_lines(lines: DataFrame, coupons: DataFrame, identifiers: dict[str, list[str]], column: str) -> DataFrame:
+  """Pair every coupon with the lines of its invoice whose ``column`` is among those the coupon applies to.
+
+  :return: Line position, as ``"line"``, next to the columns of its coupon and the label of its coupon in
+    ``coupons``, as ``COUPON_ID``, in line order.
+  :rtype: DataFrame
+  """
+  eligible = MultiIndex.from_tuples(
+    [(coupon, value) for coupon, values in identifiers.items() for value in values], names=[COUPON, column]
+  )
+
+  pairs = (
+    lines[[INVOICE, column]]
+    .rename_axis("line")
+    .reset_index()
+    .merge(coupons.rename_axis(COUPON_ID).reset_index(), on=INVOICE)
+  )
+  pairs = pairs[MultiIndex.from_frame(pairs[[COUPON, column]]).isin(eligible)]
+
+  return pairs.sort_values("line", kind="stable")
+
+
+def round_robin_quantities(capacities: Series, groups: Series, totals: Series) -> Series:
+  """Hand out the units of every group one at a time over its lines, as ``distribute_multipack`` does.
+
+  Every pass over the lines of a group gives one unit to each line, in order, that can still take one, until the
+  group has none left.
+
+  :param capacities: Units every line can take.
+  :type capacities: Series
+  :param groups: Group of every line.
+  :type groups: Series
+  :param totals: Units to hand out, indexed by group.
+  :type totals: Series
+  :return: Units given to every line, indexed like ``capacities``.
+  :rtype: Series
+  """
+  group_ids = groups.to_numpy()
+  capacity = capacities.to_numpy().astype(int64)
+  remaining = totals.reindex(group_ids).to_numpy().astype(int64)
+  given = zeros(len(capacity), dtype=int64)
+
+  # distribute_multipack never returns for a group with more units than its lines can take
+  if (totals > Series(capacity.clip(0)).groupby(group_ids).sum().reindex(totals.index, fill_value=0)).any():
+    logger.warning("Multipack coupons exceed the quantity of the items they apply to, handing out what fits")
+
+  for unit in range(1, int(capacity.max(initial=0)) + 1):
+    takes = (capacity >= unit) & (remaining > 0)
+    if not takes.any():
+      break
+    takes &= Series(takes).groupby(group_ids).cumsum().to_numpy() <= remaining
+    given += takes
+    remaining -= Series(takes.astype(int64)).groupby(group_ids).transform("sum").to_numpy()
+
+  return Series(given, index=capacities.index)
+
+
+def apply_multiunit_coupons(lines: DataFrame) -> DataFrame:
+  """Apply the multiunit coupons of every invoice to the items they cover, dropping the coupon lines."""
+  coupons = collect_invoice_coupons(lines, MULTIPACK_IDENTIFIERS)
+  if coupons.empty:
+    return lines
+
+  lines = lines[~lines[ItemizedInvoiceCols.ItemNum].isin(MULTIPACK_IDENTIFIERS.keys())].copy()
+
+  for rank in range(int(coupons[RANK].max()) + 1):
+    rank_coupons = coupons[coupons[RANK] == rank]
+    pairs = applicable_lines(lines, rank_coupons, MULTIPACK_IDENTIFIERS, ItemizedInvoiceCols.ItemNum)
+
+    missing = rank_coupons[~rank_coupons[INVOICE].isin(pairs[INVOICE])]
+    for invoice, coupon in zip(missing[INVOICE], missing[COUPON]):
+      invoice_line = lines.loc[lines[INVOICE] == invoice].iloc[0]
+      logger.error(
+        f"No applicable items found for multipack coupon {coupon} "
+        f"in invoice {invoice_line[ItemizedInvoiceCols.Invoice_Number]} for store {invoice_line[ItemizedInvoiceCols.Store_Number]}"
+      )
+
+    if pairs.empty:
+      continue
+
+    positions = pairs["line"].to_numpy()
+    coupon_values = pairs[ItemizedInvoiceCols.PricePer].map(abs)
+
+    lines.loc[positions, ItemizedInvoiceCols.Manufacturer_Multipack_Desc] = pairs["code"].to_numpy()
+    lines.loc[positions, ItemizedInvoiceCols.Manufacturer_Multipack_Discount_Amt] = (coupon_values / 2).to_numpy()
+    lines.loc[positions, ItemizedInvoiceCols.Manufacturer_Multipack_Quantity] = 2
+
+    # Two units per coupon, each worth half of it
+    quantities = round_robin_quantities(
+      lines.loc[positions, ItemizedInvoiceCols.Quantity],
+      pairs.set_index("line")[INVOICE],
+      rank_coupons.set_index(INVOICE)[ItemizedInvoiceCols.Quantity] * 2,
+    )
+    discounts = [
+      Decimal("0.00") + abs(value / 2) * given if given else Decimal("0.00")
+      for value, given in zip(coupon_values, quantities)
+    ]
+
+    lines.loc[positions, ItemizedInvoiceCols.Altria_Manufacturer_Multipack_Discount_Amt] = Series(
+      discounts, index=positions, dtype="object"
+    )
+    lines.loc[positions, ItemizedInvoiceCols.Altria_Manufacturer_Multipack_Quantity] = quantities.astype("int")
+
+  return lines
+
+
+def apply_loyalty_coupons(lines: DataFrame) -> DataFrame:
+  """Spread the loyalty coupons of every invoice over the items of their departments, dropping the coupon lines."""
+  coupons = collect_invoice_coupons(lines, LOYALTY_IDENTIFIERS)
+  if coupons.empty:
+    return lines
+
+  lines = lines[~lines[ItemizedInvoiceCols.ItemNum].isin(LOYALTY_IDENTIFIERS.keys())].copy()
+
+  # Every coupon is spread over its lines at once, later coupons of an invoice then overwrite earlier ones
+  pairs = applicable_lines(lines, coupons, LOYALTY_IDENTIFIERS, ItemizedInvoiceCols.Dept_ID)
+  quantities = lines.loc[pairs["line"], ItemizedInvoiceCols.Quantity].set_axis(pairs.index)
+  distributed = distribute_discounts(
+    lines.loc[pairs["line"], ItemizedInvoiceCols.Inv_Price].set_axis(pairs.index),
+    quantities,
+    pairs[COUPON_ID],
+    Series(
+      [
+        abs(price_per * quantity)
+        for price_per, quantity in zip(coupons[ItemizedInvoiceCols.PricePer], coupons[ItemizedInvoiceCols.Quantity])
+      ],
+      index=coupons.index,
+      dtype="object",
+    ),
+  )
+  pid_discounts = distributed / quantities
+
+  for rank in range(int(coupons[RANK].max()) + 1):
+    is_rank = (pairs[RANK] == rank).to_numpy()
+    if not is_rank.any():
+      continue
+
+    positions = pairs.loc[is_rank, "line"].to_numpy()
+
+    lines.loc[positions, ItemizedInvoiceCols.loyalty_disc_desc] = pairs.loc[is_rank, "code"].to_numpy()
+    lines.loc[positions, ItemizedInvoiceCols.PID_Coupon_Discount_Amt] = pid_discounts[is_rank].to_numpy()
+    lines.loc[positions, ItemizedInvoiceCols.LoyaltyDiscountAmt] = distributed[is_rank].to_numpy()
+
+  return lines
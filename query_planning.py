@@ -0,0 +1,93 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+from collections.abc import Iterable
+from logging import getLogger
+
+from pydantic import AliasChoices
+from types_column_names import ItemizedInvoiceCols
+from validation_config import CustomBaseModel
+from validation_result_alt import AltriaValidationModel
+from validation_result_rjr import RJRValidationModel
+
+logger = getLogger(__name__)
+
+
+# Result models validated for each manufacturer the scan data is generated for
+MANUFACTURER_MODELS: dict[str, type[CustomBaseModel]] = {
+  "RJR": RJRValidationModel,
+  "Altria": AltriaValidationModel,
+  "ITG": RJRValidationModel,
+}
+
+# Invoice line columns the promotion passes read regardless of manufacturer
+PROMO_COLUMNS = frozenset(
+  {
+    ItemizedInvoiceCols.Invoice_Number,
+    ItemizedInvoiceCols.CustNum,
+    ItemizedInvoiceCols.ItemNum,
+    ItemizedInvoiceCols.ItemName,
+    ItemizedInvoiceCols.ItemName_Extra,
+    ItemizedInvoiceCols.Dept_ID,
+    ItemizedInvoiceCols.Unit_Type,
+    ItemizedInvoiceCols.DateTime,
+    ItemizedInvoiceCols.Quantity,
+    ItemizedInvoiceCols.PricePer,
+    ItemizedInvoiceCols.Inv_Price,
+    ItemizedInvoiceCols.MixNMatchRate,
+  }
+)
+
+# Columns the local invoice store and the item lines dataset key and sort on
+KEY_COLUMNS = frozenset(
+  {
+    ItemizedInvoiceCols.Invoice_Number,
+    ItemizedInvoiceCols.LineNum,
+    ItemizedInvoiceCols.DateTime,
+  }
+)
+
+
+def model_input_names(model: type[CustomBaseModel]) -> set[str]:
+  """Every input key ``model`` reads a field from, its aliases as well as its field names."""
+  names = set()
+
+  for field_name, field in model.model_fields.items():
+    names.add(field_name)
+    for alias in (field.alias, field.validation_alias):
+      if isinstance(alias, str):
+        names.add(alias)
+      elif isinstance(alias, AliasChoices):
+        names.update(choice for choice in alias.choices if isinstance(choice, str))
+
+  return names
+
+
+def plan_itemized_invoice_columns(manufacturers: Iterable[str]) -> list[str]:
+  """Minimal list of itemized invoice columns to select for generating the scan data of ``manufacturers``.
+
+  The list is the union of the key columns, the columns the promotion passes read, and every column the result
+  models of ``manufacturers`` read. The first validation pass only checks the columns selected, see
+  ``itemized_invoice_model``.
+
+  :param manufacturers: Manufacturers the scan data is generated for, keys of ``MANUFACTURER_MODELS``.
+  :type manufacturers: Iterable[str]
+  :raises KeyError: If a manufacturer has no result model.
+  :return: Column names in the order of ``ItemizedInvoiceCols``.
+  :rtype: list[str]
+  """
+  needed = set(KEY_COLUMNS | PROMO_COLUMNS)
+
+  for manufacturer in manufacturers:
+    needed.update(model_input_names(MANUFACTURER_MODELS[manufacturer]))
+
+  columns = [column for column in ItemizedInvoiceCols.init_columns() if column in needed]
+
+  logger.debug(
+    f"Selecting {len(columns)} of {len(ItemizedInvoiceCols.init_columns())} itemized invoice columns:"
+    f" {", ".join(columns)}"
+  )
+
+  return columns
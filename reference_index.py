@@ -0,0 +1,52 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+from collections import defaultdict
+from logging import getLogger
+
+from gsheet_data_processing import SheetChanges
+from types_column_names import ItemizedInvoiceCols
+from types_custom import ItemizedInvoiceDataType
+
+logger = getLogger(__name__)
+
+
+type InvoiceId = tuple
+
+
+class InvoiceReferenceIndex:
+  """Invoices containing every UPC, and every UPC per state, of a set of invoice lines.
+
+  Looks up the invoices an edit of the buydowns or VAP sheets can affect, VAP discounts apply by UPC and
+  buydowns by the state of the store and UPC.
+  """
+
+  def __init__(self, item_lines: ItemizedInvoiceDataType):
+    self.by_upc: defaultdict[str, set[InvoiceId]] = defaultdict(set)
+    self.by_state_upc: defaultdict[tuple[str, str], set[InvoiceId]] = defaultdict(set)
+
+    lines = item_lines[
+      [
+        ItemizedInvoiceCols.Store_Number,
+        ItemizedInvoiceCols.Invoice_Number,
+        ItemizedInvoiceCols.Store_State,
+        ItemizedInvoiceCols.ItemNum,
+      ]
+    ].drop_duplicates()
+
+    for storenum, invoice_number, state, upc in lines.itertuples(index=False, name=None):
+      self.by_upc[upc].add((storenum, invoice_number))
+      self.by_state_upc[state, upc].add((storenum, invoice_number))
+
+  def affected(self, changes: SheetChanges) -> set[InvoiceId]:
+    """Invoices holding a line whose VAP discount or buydown is among ``changes``."""
+    invoices = set()
+
+    for upc in changes.vap_upcs:
+      invoices.update(self.by_upc.get(upc, ()))
+    for state, upc in changes.buydown_keys:
+      invoices.update(self.by_state_upc.get((state, upc), ()))
+
+    return invoices
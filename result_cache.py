@@ -0,0 +1,431 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+import atexit
+import inspect
+import json
+import os
+import pickle
+import shutil
+import sys
+from collections.abc import Callable, Mapping
+from datetime import datetime, timedelta
+from decimal import Decimal
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from types import ModuleType
+from typing import Any, NamedTuple
+from uuid import uuid4
+
+import pyarrow as pa
+from config import SETTINGS
+from pandas import CategoricalDtype, DataFrame, Index, RangeIndex, Series
+from pandas.api.types import infer_dtype
+from pandas.util import hash_pandas_object
+from pyarrow import ArrowException
+
+logger = getLogger(__name__)
+
+
+CWD = Path.cwd()
+
+
+RESULT_CACHE_FOLDER = CWD / "_result_cache"
+
+# Bumped whenever the layout of an entry changes, entries of other versions are never read
+CACHE_FORMAT_VERSION = 1
+
+RESULT_FILENAME = "result.pickle"
+MANIFEST_FILENAME = "manifest.json"
+FRAME_SUFFIX = ".arrow"
+
+DECIMAL_COLUMNS_METADATA = b"result_cache.decimal_columns"
+
+# Object columns Arrow stores without changing their values
+ARROW_SAFE_OBJECT_KINDS = frozenset({"string", "empty", "decimal"})
+
+
+class CacheStats(NamedTuple):
+  hits: int
+  misses: int
+  stores: int
+  evictions: int
+  entries: int
+  size_bytes: int
+
+
+class CacheEntry(NamedTuple):
+  size_bytes: int
+  created: datetime
+  last_used: float
+
+
+def source_digest(obj: Callable | ModuleType) -> str:
+  """Digest of the source of a function or module, so entries are not read back once it changes."""
+  try:
+    source = inspect.getsource(obj)
+  except (OSError, TypeError):
+    # Frozen builds ship without sources, a module is then versioned by the build it ships in
+    if isinstance(obj, ModuleType):
+      source = f"{obj.__name__}:{Path(sys.executable).stat().st_mtime_ns}"
+    else:
+      source = obj.__code__.co_code.hex()
+  return sha256(source.encode()).hexdigest()
+
+
+def collect_frames(value: Any, found: list[DataFrame | Series]) -> None:
+  """Gather every DataFrame and Series held by ``value``, walking into mappings, lists and tuples."""
+  if isinstance(value, (DataFrame, Series)):
+    found.append(value)
+  elif isinstance(value, Mapping):
+    for key in sorted(value.keys(), key=str):
+      collect_frames(value[key], found)
+  elif isinstance(value, (list, tuple)):
+    for item in value:
+      collect_frames(item, found)
+
+
+def frame_fingerprint(frame: DataFrame | Series) -> str:
+  """Digest of the content of ``frame``, its labels, dtypes and values."""
+  digest = sha256()
+  columns = frame.columns if isinstance(frame, DataFrame) else [frame.name]
+  dtypes = frame.dtypes.astype(str).tolist() if isinstance(frame, DataFrame) else [str(frame.dtype)]
+  digest.update(repr(list(columns)).encode())
+  digest.update(repr(dtypes).encode())
+  try:
+    digest.update(hash_pandas_object(frame, index=True).to_numpy().tobytes())
+  except TypeError:
+    # Cells holding unhashable values
+    digest.update(pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL))
+  return digest.hexdigest()
+
+
+def _arrow_safe(values: Series | Index) -> bool:
+  if isinstance(values.dtype, CategoricalDtype):
+    return infer_dtype(values.dtype.categories, skipna=True) in ("string", "empty")
+  if values.dtype != object:
+    return True
+  if infer_dtype(values, skipna=True) not in ARROW_SAFE_OBJECT_KINDS:
+    return False
+  # Arrow has a single null, NaN and None would both come back as None
+  return all(value is None for value in values[values.isna()])
+
+
+def frame_to_table(frame: DataFrame) -> pa.Table | None:
+  """Convert ``frame`` to an Arrow table that converts back to the same frame, None if it has no such table.
+
+  Decimal columns are stored as their string representation, Arrow would otherwise rescale every value of a
+  column to a common exponent.
+  """
+  if frame.columns.has_duplicates or not all(isinstance(column, str) for column in frame.columns):
+    return None
+  if not isinstance(frame.index, RangeIndex) and not all(
+    _arrow_safe(frame.index.get_level_values(level)) for level in range(frame.index.nlevels)
+  ):
+    return None
+  if not all(_arrow_safe(frame[column]) for column in frame.columns):
+    return None
+
+  decimal_columns = [
+    column
+    for column in frame.columns
+    if frame[column].dtype == object and infer_dtype(frame[column], skipna=True) == "decimal"
+  ]
+  if decimal_columns:
+    frame = frame.assign(**{column: frame[column].map(str, na_action="ignore") for column in decimal_columns})
+
+  try:
+    table = pa.Table.from_pandas(frame)
+  except (ArrowException, TypeError, ValueError):
+    return None
+
+  return table.replace_schema_metadata(
+    {**(table.schema.metadata or {}), DECIMAL_COLUMNS_METADATA: json.dumps(decimal_columns).encode()}
+  )
+
+
+def table_to_frame(table: pa.Table, split_blocks: bool = False) -> DataFrame:
+  """Convert a table made by ``frame_to_table`` back to its frame."""
+  decimal_columns = json.loads((table.schema.metadata or {}).get(DECIMAL_COLUMNS_METADATA, b"[]"))
+
+  frame = table.to_pandas(split_blocks=split_blocks)
+  for column in decimal_columns:
+    frame[column] = frame[column].map(Decimal, na_action="ignore").astype(object)
+
+  return frame
+
+
+def read_frame(path: Path, copy: bool = True) -> DataFrame:
+  """Read a frame written by ``write_frame``, memory mapping the file.
+
+  Without ``copy`` the numeric columns of the frame are backed by the mapped file and cannot be written to.
+  """
+  table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+  frame = table_to_frame(table, split_blocks=not copy)
+  return frame.copy(deep=True) if copy else frame
+
+
+def write_frame(frame: DataFrame, path: Path) -> bool:
+  """Write ``frame`` to ``path`` in the Arrow IPC file format, if ``frame_to_table`` finds it a table.
+
+  :return: Whether the frame was written.
+  :rtype: bool
+  """
+  if (table := frame_to_table(frame)) is None:
+    return False
+
+  with pa.OSFile(str(path), "wb") as file, pa.ipc.new_file(file, table.schema) as writer:
+    writer.write_table(table)
+
+  return True
+
+
+class _FramePickler(pickle.Pickler):
+  """Pickler writing every DataFrame it meets to its own Arrow file next to the pickle."""
+
+  def __init__(self, file, entry_dir: Path):
+    super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+    self.entry_dir = entry_dir
+    self.written: dict[int, str] = {}
+    self.unwritable: set[int] = set()
+    # Keeps the frames alive while pickling, so their ids are not reused
+    self.frames: list[DataFrame] = []
+
+  def persistent_id(self, obj):
+    if type(obj) is not DataFrame or id(obj) in self.unwritable:
+      return None
+    if (name := self.written.get(id(obj))) is None:
+      name = f"frame-{len(self.frames)}{FRAME_SUFFIX}"
+      if not write_frame(obj, self.entry_dir / name):
+        # Pickled along with the rest of the result instead
+        self.unwritable.add(id(obj))
+        self.frames.append(obj)
+        return None
+      self.written[id(obj)] = name
+      self.frames.append(obj)
+    return ("frame", name)
+
+
+class _FrameUnpickler(pickle.Unpickler):
+  def __init__(self, file, entry_dir: Path, copy_frames: bool):
+    super().__init__(file)
+    self.entry_dir = entry_dir
+    self.copy_frames = copy_frames
+    self.loaded: dict[str, DataFrame] = {}
+
+  def persistent_load(self, pid):
+    kind, name = pid
+    if kind != "frame":
+      raise pickle.UnpicklingError(f"Unknown persistent id {pid}")
+    if (frame := self.loaded.get(name)) is None:
+      frame = self.loaded[name] = read_frame(self.entry_dir / name, copy=self.copy_frames)
+    return frame
+
+
+class ResultCache:
+  """Content addressed store of function results on disk.
+
+  Every entry is a directory named by its key, holding the pickled result with the DataFrames it contains
+  stored alongside as Arrow files, and a manifest. Entries are written to a temporary directory first and
+  moved into place, a reader never sees a partial entry. Once the cache grows past ``max_bytes`` the least
+  recently used entries are evicted.
+  """
+
+  def __init__(
+    self,
+    folder: Path = RESULT_CACHE_FOLDER,
+    max_bytes: int = int(SETTINGS.result_cache_max_mb * 1024**2),
+    max_age_hours: float | None = SETTINGS.result_cache_max_age_hours,
+  ):
+    self.folder = folder
+    self.max_bytes = max_bytes
+    self.max_age = None if max_age_hours is None else timedelta(hours=max_age_hours)
+    self.temp_folder = folder / ".tmp"
+
+    self._lock = Lock()
+    self._entries: dict[str, CacheEntry] = {}
+    self._hits = 0
+    self._misses = 0
+    self._stores = 0
+    self._evictions = 0
+
+    # Leftovers of runs that died mid write
+    shutil.rmtree(self.temp_folder, ignore_errors=True)
+    self.temp_folder.mkdir(exist_ok=True, parents=True)
+
+    for manifest_path in self.folder.glob(f"*/*/{MANIFEST_FILENAME}"):
+      if (entry := self._read_manifest(manifest_path)) is not None:
+        self._entries[manifest_path.parent.name] = entry
+
+  @staticmethod
+  def make_key(*parts: Any) -> str:
+    digest = sha256(str(CACHE_FORMAT_VERSION).encode())
+    for part in parts:
+      digest.update(b"\x00")
+      digest.update(f"{type(part).__name__}:{part}".encode())
+    return digest.hexdigest()
+
+  @property
+  def stats(self) -> CacheStats:
+    with self._lock:
+      return CacheStats(
+        hits=self._hits,
+        misses=self._misses,
+        stores=self._stores,
+        evictions=self._evictions,
+        entries=len(self._entries),
+        size_bytes=sum(entry.size_bytes for entry in self._entries.values()),
+      )
+
+  def _entry_dir(self, key: str) -> Path:
+    return self.folder / key[:2] / key
+
+  def _read_manifest(self, manifest_path: Path) -> CacheEntry | None:
+    try:
+      with manifest_path.open("r") as file:
+        manifest = json.load(file)
+      if manifest["version"] != CACHE_FORMAT_VERSION:
+        return None
+      return CacheEntry(
+        size_bytes=sum(manifest["files"].values()),
+        created=datetime.fromisoformat(manifest["created"]),
+        last_used=manifest_path.stat().st_mtime,
+      )
+    except (OSError, ValueError, KeyError, TypeError):
+      return None
+
+  def _count_miss(self):
+    with self._lock:
+      self._misses += 1
+
+  def get(self, key: str, copy_frames: bool = True, max_age: timedelta | None = None) -> tuple[bool, Any]:
+    """Look up the result stored under ``key``.
+
+    :param copy_frames: Whether DataFrames are copied out of their memory mapped files. Frames that are not
+      copied are read only.
+    :type copy_frames: bool
+    :param max_age: Age past which the entry is dropped, if shorter than the cache wide limit.
+    :type max_age: timedelta | None
+    :return: Whether the result was found, and the result.
+    :rtype: tuple[bool, Any]
+    """
+    entry_dir = self._entry_dir(key)
+    manifest_path = entry_dir / MANIFEST_FILENAME
+
+    if (entry := self._read_manifest(manifest_path)) is None:
+      self._count_miss()
+      return False, None
+
+    max_age = min((age for age in (self.max_age, max_age) if age is not None), default=None)
+    if max_age is not None and datetime.now() - entry.created > max_age:
+      logger.debug(f"Result cache entry {key} expired")
+      self._remove(key)
+      self._count_miss()
+      return False, None
+
+    try:
+      with manifest_path.open("r") as file:
+        files: dict[str, int] = json.load(file)["files"]
+      for name, size in files.items():
+        if (entry_dir / name).stat().st_size != size:
+          raise ValueError(f"{name} is not the size it was written at")
+
+      with (entry_dir / RESULT_FILENAME).open("rb") as file:
+        result = _FrameUnpickler(file, entry_dir, copy_frames).load()
+    except Exception as e:
+      # Whatever a damaged entry raises, the result is computed again
+      logger.warning(f"Dropping unreadable result cache entry {key}: {e!r}")
+      self._remove(key)
+      self._count_miss()
+      return False, None
+
+    os.utime(manifest_path)
+    with self._lock:
+      self._hits += 1
+      self._entries[key] = entry._replace(last_used=datetime.now().timestamp())
+
+    return True, result
+
+  def put(self, key: str, value: Any, label: str = "") -> None:
+    """Store ``value`` under ``key``, then evict the least recently used entries over the size limit.
+
+    Results that cannot be pickled are not cached.
+    """
+    entry_dir = self._entry_dir(key)
+    temp_dir = self.temp_folder / f"{key}.{uuid4().hex}"
+    temp_dir.mkdir(parents=True)
+
+    try:
+      with (temp_dir / RESULT_FILENAME).open("wb") as file:
+        _FramePickler(file, temp_dir).dump(value)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+      logger.warning(f"Unable to cache the result of {label}: {e!r}")
+      shutil.rmtree(temp_dir, ignore_errors=True)
+      return
+
+    created = datetime.now()
+    files = {path.name: path.stat().st_size for path in temp_dir.iterdir()}
+    with (temp_dir / MANIFEST_FILENAME).open("w") as file:
+      json.dump({"version": CACHE_FORMAT_VERSION, "label": label, "created": created.isoformat(), "files": files}, file)
+
+    entry_dir.parent.mkdir(exist_ok=True)
+    try:
+      os.replace(temp_dir, entry_dir)
+    except OSError:
+      # Another thread stored the same result first
+      shutil.rmtree(temp_dir, ignore_errors=True)
+      return
+
+    with self._lock:
+      self._stores += 1
+      self._entries[key] = CacheEntry(size_bytes=sum(files.values()), created=created, last_used=created.timestamp())
+
+    self.evict(keep=key)
+
+  def _remove(self, key: str) -> bool:
+    try:
+      shutil.rmtree(self._entry_dir(key))
+    except FileNotFoundError:
+      pass
+    except OSError as e:
+      # Files still memory mapped cannot be removed on Windows
+      logger.debug(f"Unable to remove result cache entry {key}: {e!r}")
+      return False
+
+    with self._lock:
+      self._entries.pop(key, None)
+    return True
+
+  def evict(self, keep: str | None = None) -> None:
+    with self._lock:
+      size_bytes = sum(entry.size_bytes for entry in self._entries.values())
+      if size_bytes <= self.max_bytes:
+        return
+      candidates = sorted(
+        ((entry.last_used, key, entry.size_bytes) for key, entry in self._entries.items() if key != keep)
+      )
+
+    for _, key, entry_size in candidates:
+      if size_bytes <= self.max_bytes:
+        break
+      if self._remove(key):
+        size_bytes -= entry_size
+        with self._lock:
+          self._evictions += 1
+
+  def log_stats(self) -> None:
+    stats = self.stats
+    if stats.hits or stats.misses:
+      logger.info(
+        f"Result cache: {stats.hits} hits, {stats.misses} misses, {stats.stores} stored, {stats.evictions} evicted,"
+        f" {stats.entries} entries using {stats.size_bytes / 1024**2:.1f} MB"
+      )
+
+
+RESULT_CACHE = ResultCache()
+atexit.register(RESULT_CACHE.log_stats)
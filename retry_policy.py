@@ -0,0 +1,110 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+from enum import StrEnum
+from logging import getLogger
+from random import uniform
+from threading import Lock
+from time import monotonic
+
+from config import SETTINGS
+from types_custom import StoreNum
+
+logger = getLogger(__name__)
+
+
+class RetryPolicy:
+  """Exponential backoff with full jitter between attempts of a store query."""
+
+  def __init__(
+    self,
+    max_attempts: int = SETTINGS.sql_retry_attempts,
+    base_delay: float = SETTINGS.sql_retry_base_delay,
+    max_delay: float = SETTINGS.sql_retry_max_delay,
+  ):
+    self.max_attempts = max_attempts
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+
+  def should_retry(self, attempt: int) -> bool:
+    return attempt < self.max_attempts
+
+  def delay(self, attempt: int) -> float:
+    """Seconds to wait before the attempt following ``attempt``, drawn uniformly up to the exponential cap."""
+    return uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitState(StrEnum):
+  CLOSED = "closed"
+  OPEN = "open"
+  HALF_OPEN = "half open"
+
+
+class CircuitBreaker:
+  """Stops querying a store after ``failure_threshold`` consecutive failures.
+
+  Once open, every attempt is refused until ``reset_timeout`` seconds have passed. A single trial attempt
+  is then let through, closing the circuit if it succeeds and reopening it if it fails.
+  """
+
+  def __init__(
+    self,
+    storenum: StoreNum,
+    failure_threshold: int = SETTINGS.sql_breaker_threshold,
+    reset_timeout: float = SETTINGS.sql_breaker_reset_timeout,
+  ):
+    self.storenum = storenum
+    self.failure_threshold = failure_threshold
+    self.reset_timeout = reset_timeout
+
+    self.state = CircuitState.CLOSED
+    self.failures = 0
+    self.opened_at = 0.0
+
+    self._lock = Lock()
+
+  def allow(self) -> bool:
+    with self._lock:
+      match self.state:
+        case CircuitState.CLOSED:
+          return True
+        case CircuitState.OPEN if monotonic() - self.opened_at >= self.reset_timeout:
+          self.state = CircuitState.HALF_OPEN
+          return True
+        case _:
+          return False
+
+  def retry_after(self) -> float:
+    """Seconds until the circuit lets a trial attempt through, 0 if it already would."""
+    with self._lock:
+      if self.state is not CircuitState.OPEN:
+        return 0.0
+      return max(0.0, self.reset_timeout - (monotonic() - self.opened_at))
+
+  def record_success(self) -> None:
+    with self._lock:
+      self.state = CircuitState.CLOSED
+      self.failures = 0
+
+  def record_failure(self) -> None:
+    with self._lock:
+      self.failures += 1
+      if self.state is CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+        if self.state is not CircuitState.OPEN:
+          logger.warning(f"SFT {self.storenum:0>3}: {self.failures} consecutive failures, pausing queries to this store")
+        self.state = CircuitState.OPEN
+        self.opened_at = monotonic()
+
+
+class StoreCircuitBreakers:
+  def __init__(self):
+    self._lock = Lock()
+    self._breakers: dict[StoreNum, CircuitBreaker] = {}
+
+  def for_store(self, storenum: StoreNum) -> CircuitBreaker:
+    with self._lock:
+      if (breaker := self._breakers.get(storenum)) is None:
+        breaker = self._breakers[storenum] = CircuitBreaker(storenum)
+      return breaker
@@ -0,0 +1,138 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+from collections.abc import Callable
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+from sys import modules
+from typing import NamedTuple
+
+import dataframe_transformations
+import utils
+import validation_config
+import validators_shared
+from dataframe_utils import INVOICE_COLUMNS, invoice_keys
+from pandas import DataFrame, MultiIndex, Series
+from result_cache import source_digest
+from types_custom import RowErrPackage
+from utils import dump_versioned_pickle, load_versioned_pickle
+
+logger = getLogger(__name__)
+
+
+CWD = Path.cwd()
+
+
+SCAN_ROW_CACHE_FOLDER = CWD / "scan_row_cache"
+
+
+type InvoiceId = tuple
+
+
+class InvoiceScanRows(NamedTuple):
+  key: str
+  # Validated row per position of the line within its invoice, lines the model removed have none
+  rows: dict[int, Series]
+  errors: list[tuple[int, RowErrPackage]]
+
+
+class ScanRowEntry(NamedTuple):
+  version: str
+  invoices: dict[InvoiceId, InvoiceScanRows]
+
+
+def model_version(model: type, columns: list[str]) -> str:
+  """Digest of a validation model, the modules its validators live in and the columns it is applied to."""
+  digests = [
+    source_digest(module)
+    for module in (modules[model.__module__], validation_config, validators_shared, dataframe_transformations, utils)
+  ]
+  return sha256(f"{model.__qualname__}{''.join(digests)}{columns!r}".encode()).hexdigest()
+
+
+class ScanRowCache:
+  """Validated scan rows of every invoice of a manufacturer's week, so reruns only validate changed invoices."""
+
+  def __init__(self, name: str, folder: Path = SCAN_ROW_CACHE_FOLDER):
+    self.path = folder / f"{name}.pkl"
+    folder.mkdir(exist_ok=True, parents=True)
+
+  def load(self, version: str) -> dict[InvoiceId, InvoiceScanRows]:
+    return load_versioned_pickle(self.path, version) or {}
+
+  def update(self, entry: ScanRowEntry) -> None:
+    dump_versioned_pickle(self.path, entry.version, entry.invoices)
+
+  def validate(
+    self,
+    input_data: DataFrame,
+    model: type,
+    validate: Callable[[DataFrame], tuple[list[Series], list[RowErrPackage]]],
+  ) -> tuple[list[Series], list[RowErrPackage]]:
+    """Validate the lines of every new or changed invoice of ``input_data``, reusing the rows of the rest.
+
+    The result matches running ``validate`` over all of ``input_data``: the validated rows and the errors in
+    the order of their input lines, under the labels of their input lines.
+
+    :param input_data: Invoice lines to validate.
+    :type input_data: DataFrame
+    :param model: Validation model ``validate`` applies.
+    :type model: type
+    :param validate: Validates the given lines, returning the validated rows and the errors found.
+    :type validate: Callable[[DataFrame], tuple[list[Series], list[RowErrPackage]]]
+    :return: Validated rows and errors.
+    :rtype: tuple[list[Series], list[RowErrPackage]]
+    """
+    if input_data.empty or not input_data.index.is_unique:
+      # Rows are matched back to their lines by label
+      return validate(input_data)
+
+    version = model_version(model, list(input_data.columns))
+    cached = self.load(version)
+
+    positions = input_data.groupby(INVOICE_COLUMNS, sort=False, dropna=False).cumcount()
+    keys = invoice_keys(input_data, positions).to_dict()
+    line_invoices = list(zip(*(input_data[column] for column in INVOICE_COLUMNS)))
+
+    hits = {invoice for invoice, key in keys.items() if invoice in cached and cached[invoice].key == key}
+    changed = input_data[~MultiIndex.from_tuples(line_invoices, names=INVOICE_COLUMNS).isin(hits)]
+    logger.info(f"Reusing the validated rows of {len(hits)} of {len(keys)} invoices")
+
+    new_rows, new_errors = validate(changed) if not changed.empty else ([], [])
+    rows_by_label = {row.name: row for row in new_rows}
+    errors_by_label: dict = {}
+    for err in new_errors:
+      errors_by_label.setdefault(err.row.name, []).append(err)
+
+    invoices = {invoice: cached[invoice] for invoice in hits}
+    for invoice in keys.keys() - hits:
+      invoices[invoice] = InvoiceScanRows(key=keys[invoice], rows={}, errors=[])
+
+    rows: list[Series] = []
+    errors: list[RowErrPackage] = []
+    for label, invoice, position in zip(input_data.index, line_invoices, positions):
+      if invoice in hits:
+        if (row := invoices[invoice].rows.get(position)) is not None:
+          rows.append(row.rename(label))
+        errors.extend(
+          err._replace(row=input_data.loc[label].copy(deep=True))
+          for err_position, err in invoices[invoice].errors
+          if err_position == position
+        )
+      else:
+        if (row := rows_by_label.get(label)) is not None:
+          rows.append(row)
+          invoices[invoice].rows[position] = row
+        for err in errors_by_label.get(label, ()):
+          errors.append(err)
+          invoices[invoice].errors.append((position, err))
+
+    if len(new_rows) == len(rows_by_label):
+      self.update(ScanRowEntry(version=version, invoices=invoices))
+    else:
+      logger.warning("Validation returned rows under repeated labels, not caching the validated rows")
+
+    return rows, errors
@@ -3,114 +3,418 @@ if __name__ == "__main__":
 
   configure_logging()
 
+from collections.abc import Callable, Iterable
 from datetime import date, datetime
+from functools import cache, partial
 from logging import getLogger
+from threading import Lock
+from typing import Any, NamedTuple, Self
 
 from config import SETTINGS
-from pypika.queries import Database, Query, QueryBuilder, Schema, Table
+from pypika import functions as fn
+from pypika.enums import Equality, SqlTypes
+from pypika.queries import Database, Query, QueryBuilder, Table
+from pypika.terms import AggregateFunction, BasicCriterion, ContainsCriterion, Field, Function, Parameter
 from utils import rjr_start_end_dates
 
 logger = getLogger(__name__)
 
 
-_DATABASE_CRESQL = Database("cresql")
-_schema: Schema = _DATABASE_CRESQL.dbo
-_table_itemized_invoices: Table = _schema.Invoice_Itemized
-_table_inventory: Table = _schema.Inventory
-_table_inventory_coupon: Table = _schema.Inventory_Coupon
-_table_invoice_totals: Table = _schema.Invoice_Totals
-_table_inventory_bulk_info: Table = _schema.Inventory_Bulk_Info
-_table_customer: Table = _schema.Customer
-_table_employee: Table = _schema.Employee
+DEFAULT_DATABASE_NAME = "cresql"
 
+# Name of the single column returned by fingerprint queries
+FINGERPRINT_COLUMN = "Fingerprint"
 
-def update_database_name(new_db_name: str) -> None:
-  if new_db_name != _schema._parent._name:
-    _schema._parent = Database(new_db_name)
+# Columns returned by the daily line counts query
+DAY_COLUMN = "Day"
+LINES_COLUMN = "Lines"
 
 
-def build_itemized_invoice_query(start_date: date | datetime, end_date: date | datetime) -> QueryBuilder:
+class StoreTables(NamedTuple):
+  itemized_invoices: Table
+  inventory: Table
+  inventory_coupon: Table
+  invoice_totals: Table
+  inventory_bulk_info: Table
+  customer: Table
+  employee: Table
+
+  @classmethod
+  def of(cls, db_name: str) -> Self:
+    schema = Database(db_name).dbo
+    return cls(
+      itemized_invoices=schema.Invoice_Itemized,
+      inventory=schema.Inventory,
+      inventory_coupon=schema.Inventory_Coupon,
+      invoice_totals=schema.Invoice_Totals,
+      inventory_bulk_info=schema.Inventory_Bulk_Info,
+      customer=schema.Customer,
+      employee=schema.Employee,
+    )
+
+
+class QueryTemplate:
+  """A query whose SQL is rendered once per store database name and reused for every store sharing that name.
+
+  Values that change between runs, like date ranges, are left as ``?`` placeholders in the SQL and bound
+  as ``params`` when the query is executed.
+
+  A template with a ``version`` has its results cached by the answer of that query, see ``with_version``.
+  """
+
+  def __init__(
+    self,
+    build: Callable[[StoreTables], QueryBuilder],
+    params: tuple[Any, ...] = (),
+    version: "QueryTemplate | None" = None,
+  ):
+    self.build = build
+    self.params = params
+    self.version = version
+    self._rendered: dict[str, str] = {}
+    self._lock = Lock()
+
+  def render(self, db_name: str = DEFAULT_DATABASE_NAME) -> str:
+    if (sql := self._rendered.get(db_name)) is None:
+      sql = self.build(StoreTables.of(db_name)).get_sql()
+      with self._lock:
+        sql = self._rendered.setdefault(db_name, sql)
+    return sql
+
+  def with_params(self, *params: Any) -> "QueryTemplate":
+    """Bind a new set of parameters, sharing the rendered SQL cache with this template.
+
+    The version is not carried over, it was bound to the previous parameters.
+    """
+    template = QueryTemplate(self.build, params)
+    template._rendered = self._rendered
+    template._lock = self._lock
+    return template
+
+  def with_version(self, version: "QueryTemplate") -> "QueryTemplate":
+    """Version this template by ``version``, a query answering with a single ``FINGERPRINT_COLUMN`` value that
+    changes whenever the rows of this one do.
+
+    Store results are only served from the result cache while the version query gives the same answer.
+    """
+    template = self.with_params(*self.params)
+    template.version = version
+    return template
+
+  def cache_signature(self) -> list[str]:
+    return [self.render(), *(str(param) for param in self.params)]
+
+
+def _to_param_date(value: date | datetime, keep_time: bool = False) -> date | datetime:
+  if isinstance(value, datetime) and not keep_time:
+    return value.date()
+  return value
+
+
+# Source table and column of every column the itemized invoice query can select, in select order
+ITEMIZED_INVOICE_SOURCES: dict[str, tuple[str, str]] = {
+  "Invoice_Number": ("itemized_invoices", "Invoice_Number"),
+  "CustNum": ("invoice_totals", "CustNum"),
+  "Phone_1": ("customer", "Phone_1"),
+  "AgeVerificationMethod": ("invoice_totals", "AgeVerificationMethod"),
+  "AgeVerification": ("invoice_totals", "AgeVerification"),
+  "LineNum": ("itemized_invoices", "LineNum"),
+  "Cashier_ID": ("invoice_totals", "Cashier_ID"),
+  "Station_ID": ("invoice_totals", "Station_ID"),
+  "ItemNum": ("itemized_invoices", "ItemNum"),
+  "ItemName": ("inventory", "ItemName"),
+  "ItemName_Extra": ("inventory", "ItemName_Extra"),
+  "DiffItemName": ("itemized_invoices", "DiffItemName"),
+  "Dept_ID": ("inventory", "Dept_ID"),
+  "Unit_Type": ("inventory", "Unit_Type"),
+  "Unit_Size": ("inventory", "Unit_Size"),
+  "DateTime": ("invoice_totals", "DateTime"),
+  "Quantity": ("itemized_invoices", "Quantity"),
+  "CostPer": ("itemized_invoices", "CostPer"),
+  "PricePer": ("itemized_invoices", "PricePer"),
+  "Tax1Per": ("itemized_invoices", "Tax1Per"),
+  "Inv_Cost": ("inventory", "Cost"),
+  "Inv_Price": ("inventory", "Price"),
+  "Inv_Retail_Price": ("inventory", "Retail_Price"),
+  "Coupon_Flat_Percent": ("inventory_coupon", "Coupon_Flat_Percent"),
+  # "Kit_ItemNum": ("itemized_invoices", "Kit_ItemNum"),
+  # "Store_ID": ("itemized_invoices", "Store_ID"),
+  "origPricePer": ("itemized_invoices", "origPricePer"),
+  # "Special_Price_Lock": ("itemized_invoices", "Special_Price_Lock"),
+  "MixNMatchRate": ("itemized_invoices", "BulkRate"),
+  "SalePricePer": ("itemized_invoices", "SalePricePer"),
+  # "KitchenQuantityPrinted": ("itemized_invoices", "KitchenQuantityPrinted"),
+  "PricePerBeforeDiscount": ("itemized_invoices", "PricePerBeforeDiscount"),
+  # "OrigPriceSetBy": ("itemized_invoices", "OrigPriceSetBy"),
+  "PriceChangedBy": ("itemized_invoices", "PriceChangedBy"),
+  # "Kit_Override": ("itemized_invoices", "Kit_Override"),
+  # "KitTotal": ("itemized_invoices", "KitTotal"),
+}
+
+
+def _source_field(tables: StoreTables, name: str, alias: bool = True) -> Field:
+  table_name, column = ITEMIZED_INVOICE_SOURCES[name]
+  field = getattr(tables, table_name).field(column)
+  return field.as_(name) if alias and column != name else field
+
+
+def _checksum(*fields: Field) -> AggregateFunction:
+  return AggregateFunction("CHECKSUM_AGG", Function("BINARY_CHECKSUM", *fields))
+
+
+def _changed_since(fingerprint_query: QueryBuilder) -> BasicCriterion:
+  """Criterion that only holds while the result of ``fingerprint_query`` differs from a bound fingerprint."""
+  return BasicCriterion(Equality.ne, fingerprint_query, Parameter("?"))
+
+
+def _itemized_invoice_selected(columns: tuple[str, ...] | None) -> list[str]:
+  return [name for name in ITEMIZED_INVOICE_SOURCES if columns is None or name in columns]
+
+
+def _in_departments(tables: StoreTables, dept_ids: tuple[str, ...]) -> ContainsCriterion:
+  """Criterion keeping itemized lines of items in ``dept_ids``, a semi-join that brings no Inventory column in."""
+  return tables.itemized_invoices.ItemNum.isin(
+    Query.from_(tables.inventory).select(tables.inventory.ItemNum).where(tables.inventory.Dept_ID.isin(dept_ids))
+  )
+
+
+def _itemized_invoice_from(
+  tables: StoreTables,
+  dept_ids: tuple[str, ...] | None,
+  selected: list[str],
+) -> QueryBuilder:
+  joined = {ITEMIZED_INVOICE_SOURCES[name][0] for name in selected}
+
+  query = Query.from_(tables.itemized_invoices)
+  if "inventory" in joined:
+    query = query.left_join(tables.inventory).on(tables.itemized_invoices.ItemNum == tables.inventory.ItemNum)
+  # Invoice_Totals holds the DateTime every query filters on
+  query = query.left_join(tables.invoice_totals).on(
+    tables.itemized_invoices.Invoice_Number == tables.invoice_totals.Invoice_Number
+  )
+  if "customer" in joined:
+    query = query.left_join(tables.customer).on(tables.invoice_totals.CustNum == tables.customer.CustNum)
+  if "inventory_coupon" in joined:
+    query = query.left_join(tables.inventory_coupon).on(
+      tables.itemized_invoices.ItemNum == tables.inventory_coupon.ItemNum
+    )
+
+  query = query.where(tables.invoice_totals.DateTime >= Parameter("?")).where(
+    tables.invoice_totals.DateTime < Parameter("?")
+  )
+
+  if dept_ids is not None:
+    query = query.where(_in_departments(tables, dept_ids))
+
+  return query
+
+
+def _itemized_invoice_query(
+  tables: StoreTables,
+  dept_ids: tuple[str, ...] | None = None,
+  columns: tuple[str, ...] | None = None,
+) -> QueryBuilder:
+  selected = _itemized_invoice_selected(columns)
+  return _itemized_invoice_from(tables, dept_ids, selected).select(*(_source_field(tables, name) for name in selected))
+
+
+def _itemized_invoice_fingerprint_query(
+  tables: StoreTables,
+  dept_ids: tuple[str, ...] | None = None,
+  columns: tuple[str, ...] | None = None,
+) -> QueryBuilder:
+  selected = _itemized_invoice_selected(columns)
+  return _itemized_invoice_from(tables, dept_ids, selected).select(
+    _checksum(*(_source_field(tables, name, alias=False) for name in selected)).as_(FINGERPRINT_COLUMN)
+  )
+
+
+@cache
+def _itemized_invoice_template(dept_ids: tuple[str, ...] | None, columns: tuple[str, ...] | None) -> QueryTemplate:
+  return QueryTemplate(partial(_itemized_invoice_query, dept_ids=dept_ids, columns=columns))
+
+
+@cache
+def _itemized_invoice_fingerprint_template(
+  dept_ids: tuple[str, ...] | None, columns: tuple[str, ...] | None
+) -> QueryTemplate:
+  return QueryTemplate(partial(_itemized_invoice_fingerprint_query, dept_ids=dept_ids, columns=columns))
+
+
+def build_itemized_invoice_query(
+  start_date: date | datetime,
+  end_date: date | datetime,
+  keep_time: bool = False,
+  dept_ids: Iterable[str] | None = None,
+  columns: Iterable[str] | None = None,
+) -> QueryTemplate:
   """Build a query to retrieve itemized invoices between two dates.
 
   :param start_date: Start date to filter invoices. Inclusive
   :type start_date: date | datetime
   :param end_date: End date to filter invoices. Exclusive
   :type end_date: date | datetime
-  :return: QueryBuilder to retrieve itemized invoices between two dates.
-  :rtype: QueryBuilder
+  :param keep_time: Filter on the full datetime instead of truncating to the day.
+  :type keep_time: bool
+  :param dept_ids: Only retrieve lines of items in these departments, all departments if not given. Filtering
+    happens on the server through an ``ItemNum`` subquery on Inventory, no Inventory column is joined in for it.
+  :type dept_ids: Iterable[str] | None
+  :param columns: Only select these columns, all columns if not given. Selected columns are always returned
+    in the order of ``ITEMIZED_INVOICE_SOURCES``, and tables none of them come from are not joined.
+  :type columns: Iterable[str] | None
+  :return: QueryTemplate to retrieve itemized invoices between two dates, versioned by a checksum of the lines.
+  :rtype: QueryTemplate
   """
-  if isinstance(start_date, datetime):
-    start_date = start_date.date()
-  if isinstance(end_date, datetime):
-    end_date = end_date.date()
+  if columns is not None:
+    columns = set(columns)
+    if unknown := columns.difference(ITEMIZED_INVOICE_SOURCES):
+      raise ValueError(f"Unknown itemized invoice columns: {", ".join(sorted(unknown))}")
+    columns = tuple(name for name in ITEMIZED_INVOICE_SOURCES if name in columns)
 
+  dept_ids = None if dept_ids is None else tuple(sorted(dept_ids))
+  params = (_to_param_date(start_date, keep_time), _to_param_date(end_date, keep_time))
   return (
-    (
-      Query.from_(_table_itemized_invoices)
-      .left_join(_table_inventory)
-      .on(_table_itemized_invoices.ItemNum == _table_inventory.ItemNum)
-      .left_join(_table_invoice_totals)
-      .on(_table_itemized_invoices.Invoice_Number == _table_invoice_totals.Invoice_Number)
-      .left_join(_table_customer)
-      .on(_table_invoice_totals.CustNum == _table_customer.CustNum)
-      .left_join(_table_inventory_coupon)
-      .on(_table_itemized_invoices.ItemNum == _table_inventory_coupon.ItemNum)
-    )
-    .select(
-      _table_itemized_invoices.Invoice_Number,
-      _table_invoice_totals.CustNum,
-      _table_customer.Phone_1,
-      _table_invoice_totals.AgeVerificationMethod,
-      _table_invoice_totals.AgeVerification,
-      _table_itemized_invoices.LineNum,
-      _table_invoice_totals.Cashier_ID,
-      _table_invoice_totals.Station_ID,
-      _table_itemized_invoices.ItemNum,
-      _table_inventory.ItemName,
-      _table_inventory.ItemName_Extra,
-      _table_itemized_invoices.DiffItemName,
-      _table_inventory.Dept_ID,
-      _table_inventory.Unit_Type,
-      _table_inventory.Unit_Size,
-      _table_invoice_totals.DateTime,
-      _table_itemized_invoices.Quantity,
-      _table_itemized_invoices.CostPer,
-      _table_itemized_invoices.PricePer,
-      _table_itemized_invoices.Tax1Per,
-      _table_inventory.Cost.as_("Inv_Cost"),
-      _table_inventory.Price.as_("Inv_Price"),
-      _table_inventory.Retail_Price.as_("Inv_Retail_Price"),
-      _table_inventory_coupon.Coupon_Flat_Percent,
-      # _table_itemized_invoices.Kit_ItemNum,
-      # _table_itemized_invoices.Store_ID,
-      _table_itemized_invoices.origPricePer,
-      # _table_itemized_invoices.Special_Price_Lock,
-      _table_itemized_invoices.BulkRate,
-      _table_itemized_invoices.SalePricePer,
-      # _table_itemized_invoices.KitchenQuantityPrinted,
-      _table_itemized_invoices.PricePerBeforeDiscount,
-      # _table_itemized_invoices.OrigPriceSetBy,
-      _table_itemized_invoices.PriceChangedBy,
-      # _table_itemized_invoices.Kit_Override,
-      # _table_itemized_invoices.KitTotal
+    _itemized_invoice_template(dept_ids, columns)
+    .with_params(*params)
+    .with_version(_itemized_invoice_fingerprint_template(dept_ids, columns).with_params(*params))
+  )
+
+
+def _daily_line_counts_query(tables: StoreTables, dept_ids: tuple[str, ...] | None = None) -> QueryBuilder:
+  day = fn.Cast(tables.invoice_totals.DateTime, SqlTypes.DATE)
+
+  query = (
+    Query.from_(tables.itemized_invoices)
+    .left_join(tables.invoice_totals)
+    .on(tables.itemized_invoices.Invoice_Number == tables.invoice_totals.Invoice_Number)
+    .select(day.as_(DAY_COLUMN), fn.Count("*").as_(LINES_COLUMN))
+    .where(tables.invoice_totals.DateTime >= Parameter("?"))
+    .where(tables.invoice_totals.DateTime < Parameter("?"))
+  )
+
+  if dept_ids is not None:
+    query = query.where(_in_departments(tables, dept_ids))
+
+  return query.groupby(fn.Cast(tables.invoice_totals.DateTime, SqlTypes.DATE))
+
+
+@cache
+def _daily_line_counts_template(dept_ids: tuple[str, ...] | None) -> QueryTemplate:
+  return QueryTemplate(partial(_daily_line_counts_query, dept_ids=dept_ids))
+
+
+def build_daily_line_counts_query(
+  start_date: date | datetime,
+  end_date: date | datetime,
+  keep_time: bool = False,
+  dept_ids: Iterable[str] | None = None,
+) -> QueryTemplate:
+  """Build a query counting the itemized invoice lines of every day between two dates.
+
+  Counts the same lines :func:`build_itemized_invoice_query` would retrieve for the same arguments, returned
+  as one ``DAY_COLUMN``, ``LINES_COLUMN`` row per day that has lines.
+
+  :param start_date: Start date to filter invoices. Inclusive
+  :type start_date: date | datetime
+  :param end_date: End date to filter invoices. Exclusive
+  :type end_date: date | datetime
+  :param keep_time: Filter on the full datetime instead of truncating to the day.
+  :type keep_time: bool
+  :param dept_ids: Only count lines of items in these departments, all departments if not given.
+  :type dept_ids: Iterable[str] | None
+  :return: QueryTemplate to count itemized invoice lines per day between two dates. It is left without a
+    version, the counts are only useful fresh.
+  :rtype: QueryTemplate
+  """
+  template = _daily_line_counts_template(None if dept_ids is None else tuple(sorted(dept_ids)))
+  return template.with_params(_to_param_date(start_date, keep_time), _to_param_date(end_date, keep_time))
+
+
+# Tables of the inventory dimension, every itemized invoice column sourced from them depends only on ItemNum
+INVENTORY_DIMENSION_TABLES = frozenset({"inventory", "inventory_coupon"})
+
+
+def inventory_dimension_columns(columns: Iterable[str] | None = None) -> list[str]:
+  """Itemized invoice columns among ``columns`` that come from the inventory dimension, all of them if not given."""
+  return [
+    name
+    for name, (table_name, _) in ITEMIZED_INVOICE_SOURCES.items()
+    if table_name in INVENTORY_DIMENSION_TABLES and (columns is None or name in columns)
+  ]
+
+
+def _inventory_dimension_from(tables: StoreTables, columns: tuple[str, ...]) -> QueryBuilder:
+  query = Query.from_(tables.inventory)
+  if any(ITEMIZED_INVOICE_SOURCES[name][0] == "inventory_coupon" for name in columns):
+    query = query.left_join(tables.inventory_coupon).on(tables.inventory.ItemNum == tables.inventory_coupon.ItemNum)
+  return query
+
+
+def _inventory_fingerprint_query(tables: StoreTables, columns: tuple[str, ...]) -> QueryBuilder:
+  return _inventory_dimension_from(tables, columns).select(
+    _checksum(tables.inventory.ItemNum, *(_source_field(tables, name, alias=False) for name in columns)).as_(
+      FINGERPRINT_COLUMN
     )
-    .where(_table_invoice_totals.DateTime >= start_date)
-    .where(_table_invoice_totals.DateTime < end_date)
   )
 
 
-def build_bulk_info_query() -> QueryBuilder:
-  """Build a query to retrieve bulk info for all items.
+def _inventory_dimension_query(tables: StoreTables, columns: tuple[str, ...], changed_only: bool = False) -> QueryBuilder:
+  query = _inventory_dimension_from(tables, columns).select(
+    tables.inventory.ItemNum,
+    *(_source_field(tables, name) for name in columns),
+  )
+
+  if changed_only:
+    query = query.where(_changed_since(_inventory_fingerprint_query(tables, columns)))
+
+  return query
+
+
+@cache
+def _inventory_fingerprint_template(columns: tuple[str, ...]) -> QueryTemplate:
+  return QueryTemplate(partial(_inventory_fingerprint_query, columns=columns))
+
 
-  :return: QueryBuilder to retrieve bulk info for all items.
-  :rtype: QueryBuilder
+@cache
+def _inventory_dimension_template(columns: tuple[str, ...], changed_only: bool) -> QueryTemplate:
+  return QueryTemplate(partial(_inventory_dimension_query, columns=columns, changed_only=changed_only))
+
+
+def build_inventory_fingerprint_query(columns: Iterable[str] | None = None) -> QueryTemplate:
+  """Build a query returning a checksum of the inventory dimension rows, in a single ``FINGERPRINT_COLUMN`` column.
+
+  :param columns: Inventory dimension columns the checksum covers, all of them if not given.
+  :type columns: Iterable[str] | None
+  :return: QueryTemplate to retrieve the fingerprint of the inventory dimension.
+  :rtype: QueryTemplate
   """
+  return _inventory_fingerprint_template(tuple(inventory_dimension_columns(columns)))
+
+
+def build_inventory_dimension_query(columns: Iterable[str] | None = None, known_fingerprint: int | None = None) -> QueryTemplate:
+  """Build a query to retrieve the inventory dimension, one row per item keyed by ``ItemNum``.
 
-  return Query.from_(_table_inventory_bulk_info).select(
-    _table_inventory_bulk_info.ItemNum,
+  :param columns: Inventory dimension columns to select alongside ``ItemNum``, all of them if not given.
+  :type columns: Iterable[str] | None
+  :param known_fingerprint: Fingerprint of the locally cached dimension. When given, the query returns no
+    rows unless the dimension has changed since that fingerprint was taken.
+  :type known_fingerprint: int | None
+  :return: QueryTemplate to retrieve the inventory dimension.
+  :rtype: QueryTemplate
+  """
+  columns = tuple(inventory_dimension_columns(columns))
+  template = _inventory_dimension_template(columns, known_fingerprint is not None)
+  if known_fingerprint is None:
+    return template.with_version(_inventory_fingerprint_template(columns))
+  return template.with_params(known_fingerprint)
+
+
+def _bulk_info_fields(tables: StoreTables) -> list[Field]:
+  return [
+    tables.inventory_bulk_info.ItemNum,
     # _TABLE_INVENTORY_BULK_INFO.Store_ID,
-    _table_inventory_bulk_info.Bulk_Price,
-    _table_inventory_bulk_info.Bulk_Quan,
+    tables.inventory_bulk_info.Bulk_Price,
+    tables.inventory_bulk_info.Bulk_Quan,
     # _TABLE_INVENTORY_BULK_INFO.Description,
     # _TABLE_INVENTORY_BULK_INFO.Price_Type,
     # _TABLE_INVENTORY_BULK_INFO.InsertOriginatorId,
@@ -119,153 +423,217 @@ def build_bulk_info_query() -> QueryBuilder:
     # _TABLE_INVENTORY_BULK_INFO.ModifiedDate,
     # _TABLE_INVENTORY_BULK_INFO.CreateDate,
     # _TABLE_INVENTORY_BULK_INFO.CreateTimestamp,
+  ]
+
+
+def _bulk_info_fingerprint_query(tables: StoreTables) -> QueryBuilder:
+  return Query.from_(tables.inventory_bulk_info).select(_checksum(*_bulk_info_fields(tables)).as_(FINGERPRINT_COLUMN))
+
+
+def _bulk_info_query(tables: StoreTables, changed_only: bool = False) -> QueryBuilder:
+  query = Query.from_(tables.inventory_bulk_info).select(*_bulk_info_fields(tables))
+
+  if changed_only:
+    query = query.where(_changed_since(_bulk_info_fingerprint_query(tables)))
+
+  return query
+
+
+BULK_INFO_TEMPLATE = QueryTemplate(_bulk_info_query)
+BULK_INFO_CHANGED_TEMPLATE = QueryTemplate(partial(_bulk_info_query, changed_only=True))
+BULK_INFO_FINGERPRINT_TEMPLATE = QueryTemplate(_bulk_info_fingerprint_query)
+
+
+def build_bulk_info_query(known_fingerprint: int | None = None) -> QueryTemplate:
+  """Build a query to retrieve bulk info for all items.
+
+  :param known_fingerprint: Fingerprint of the locally cached bulk info. When given, the query returns no
+    rows unless the bulk info has changed since that fingerprint was taken.
+  :type known_fingerprint: int | None
+  :return: QueryTemplate to retrieve bulk info for all items.
+  :rtype: QueryTemplate
+  """
+  if known_fingerprint is None:
+    return BULK_INFO_TEMPLATE.with_version(BULK_INFO_FINGERPRINT_TEMPLATE)
+  return BULK_INFO_CHANGED_TEMPLATE.with_params(known_fingerprint)
+
+
+def build_bulk_info_fingerprint_query() -> QueryTemplate:
+  """Build a query returning a checksum of the bulk info rows, in a single ``FINGERPRINT_COLUMN`` column.
+
+  :return: QueryTemplate to retrieve the fingerprint of the bulk info.
+  :rtype: QueryTemplate
+  """
+  return BULK_INFO_FINGERPRINT_TEMPLATE
+
+
+def _custnums_query(tables: StoreTables) -> QueryBuilder:
+  return Query.from_(tables.customer).select(
+    tables.customer.CustNum,
+    tables.customer.First_Name,
+    tables.customer.Last_Name,
+    tables.customer.Company,
+    tables.customer.Address_1,
+    tables.customer.Address_2,
+    tables.customer.City,
+    tables.customer.State,
+    tables.customer.Zip_Code,
+    tables.customer.Phone_1,
+    tables.customer.Phone_2,
+    # tables.customer.CC_Type,
+    # tables.customer.CC_Num,
+    # tables.customer.CC_Exp,
+    # tables.customer.Discount_Level,
+    # tables.customer.Discount_Percent,
+    # tables.customer.Acct_Open_Date,
+    # tables.customer.Acct_Close_Date,
+    # tables.customer.Acct_Balance,
+    # tables.customer.Acct_Max_Balance,
+    # tables.customer.Bonus_Plan_Member,
+    # tables.customer.Bonus_Points,
+    # tables.customer.Tax_Exempt,
+    # tables.customer.Member_Exp,
+    # tables.customer.Dirty,
+    tables.customer.Phone_3,
+    # tables.customer.Phone_4,
+    tables.customer.EMail,
+    # tables.customer.County,
+    # tables.customer.Def_SP,
+    tables.customer.CreateDate,
+    # tables.customer.Referral,
+    tables.customer.Birthday,
+    # tables.customer.Last_Birthday_Bonus,
+    tables.customer.Last_Visit,
+    # tables.customer.Require_PONum,
+    # tables.customer.Max_Charge_NumDays,
+    # tables.customer.Max_Charge_Amount,
+    # tables.customer.License_Num,
+    # tables.customer.ID_Last_Checked,
+    # tables.customer.Next_Start_Date,
+    # tables.customer.Checking_AcctNum,
+    # tables.customer.PrintNotes,
+    # tables.customer.Loyalty_Plan_ID,
+    # tables.customer.Tax_Rate_ID,
+    # tables.customer.Bill_To_Name,
+    # tables.customer.Contact_1,
+    # tables.customer.Contact_2,
+    # tables.customer.Terms,
+    # tables.customer.Resale_Num,
+    # tables.customer.Last_Coupon,
+    # tables.customer.Account_Type,
+    # tables.customer.ChargeAtCost,
+    # tables.customer.Disabled,
+    # tables.customer.ImagePath,
+    # tables.customer.License_ExpDate,
+    # tables.customer.TaxID,
+    # tables.customer.SecretCode,
+    # tables.customer.OnlineUserName,
+    # tables.customer.OnlinePassword,
+    # tables.customer.Token,
+    # tables.customer.MaskedCardNumber,
+    # tables.customer.InsertOriginatorId,
+    # tables.customer.UpdateOriginatorId,
+    # tables.customer.UpdateTimestamp,
+    # tables.customer.ModifiedDate,
+    # tables.customer.CreateTimestamp,
+    # tables.customer.Attn,
+    # tables.customer.DueDate,
   )
 
 
-def build_custnums_query() -> QueryBuilder:
+CUSTNUMS_TEMPLATE = QueryTemplate(_custnums_query)
+
+
+def build_custnums_query() -> QueryTemplate:
   """Build a query to retrieve all customer numbers.
 
-  :return: QueryBuilder to retrieve all customer numbers.
-  :rtype: QueryBuilder
+  :return: QueryTemplate to retrieve all customer numbers.
+  :rtype: QueryTemplate
   """
-  return Query.from_(_table_customer).select(
-    _table_customer.CustNum,
-    _table_customer.First_Name,
-    _table_customer.Last_Name,
-    _table_customer.Company,
-    _table_customer.Address_1,
-    _table_customer.Address_2,
-    _table_customer.City,
-    _table_customer.State,
-    _table_customer.Zip_Code,
-    _table_customer.Phone_1,
-    _table_customer.Phone_2,
-    # _table_customer.CC_Type,
-    # _table_customer.CC_Num,
-    # _table_customer.CC_Exp,
-    # _table_customer.Discount_Level,
-    # _table_customer.Discount_Percent,
-    # _table_customer.Acct_Open_Date,
-    # _table_customer.Acct_Close_Date,
-    # _table_customer.Acct_Balance,
-    # _table_customer.Acct_Max_Balance,
-    # _table_customer.Bonus_Plan_Member,
-    # _table_customer.Bonus_Points,
-    # _table_customer.Tax_Exempt,
-    # _table_customer.Member_Exp,
-    # _table_customer.Dirty,
-    _table_customer.Phone_3,
-    # _table_customer.Phone_4,
-    _table_customer.EMail,
-    # _table_customer.County,
-    # _table_customer.Def_SP,
-    _table_customer.CreateDate,
-    # _table_customer.Referral,
-    _table_customer.Birthday,
-    # _table_customer.Last_Birthday_Bonus,
-    _table_customer.Last_Visit,
-    # _table_customer.Require_PONum,
-    # _table_customer.Max_Charge_NumDays,
-    # _table_customer.Max_Charge_Amount,
-    # _table_customer.License_Num,
-    # _table_customer.ID_Last_Checked,
-    # _table_customer.Next_Start_Date,
-    # _table_customer.Checking_AcctNum,
-    # _table_customer.PrintNotes,
-    # _table_customer.Loyalty_Plan_ID,
-    # _table_customer.Tax_Rate_ID,
-    # _table_customer.Bill_To_Name,
-    # _table_customer.Contact_1,
-    # _table_customer.Contact_2,
-    # _table_customer.Terms,
-    # _table_customer.Resale_Num,
-    # _table_customer.Last_Coupon,
-    # _table_customer.Account_Type,
-    # _table_customer.ChargeAtCost,
-    # _table_customer.Disabled,
-    # _table_customer.ImagePath,
-    # _table_customer.License_ExpDate,
-    # _table_customer.TaxID,
-    # _table_customer.SecretCode,
-    # _table_customer.OnlineUserName,
-    # _table_customer.OnlinePassword,
-    # _table_customer.Token,
-    # _table_customer.MaskedCardNumber,
-    # _table_customer.InsertOriginatorId,
-    # _table_customer.UpdateOriginatorId,
-    # _table_customer.UpdateTimestamp,
-    # _table_customer.ModifiedDate,
-    # _table_customer.CreateTimestamp,
-    # _table_customer.Attn,
-    # _table_customer.DueDate,
+  return CUSTNUMS_TEMPLATE
+
+
+def _inventory_data_query(tables: StoreTables) -> QueryBuilder:
+  return Query.from_(tables.inventory).select(
+    tables.inventory.ItemNum,
+    tables.inventory.ItemName,
+    tables.inventory.Cost,
+    tables.inventory.Price,
+    tables.inventory.Retail_Price,
+    tables.inventory.In_Stock,
+    tables.inventory.Dept_ID,
+    tables.inventory.ItemName_Extra,
   )
 
 
-def build_inventory_data_query() -> QueryBuilder:
+INVENTORY_DATA_TEMPLATE = QueryTemplate(_inventory_data_query)
+
+
+def build_inventory_data_query() -> QueryTemplate:
   """Build a query to retrieve all inventory data.
 
-  :return: QueryBuilder to retrieve all inventory data.
-  :rtype: QueryBuilder
+  :return: QueryTemplate to retrieve all inventory data.
+  :rtype: QueryTemplate
   """
-  return Query.from_(_table_inventory).select(
-    _table_inventory.ItemNum,
-    _table_inventory.ItemName,
-    _table_inventory.Cost,
-    _table_inventory.Price,
-    _table_inventory.Retail_Price,
-    _table_inventory.In_Stock,
-    _table_inventory.Dept_ID,
-    _table_inventory.ItemName_Extra,
+  return INVENTORY_DATA_TEMPLATE
+
+
+def _volume_report_query(tables: StoreTables) -> QueryBuilder:
+  return (
+    (
+      Query.from_(tables.itemized_invoices)
+      .left_join(tables.inventory)
+      .on(tables.itemized_invoices.ItemNum == tables.inventory.ItemNum)
+      .left_join(tables.invoice_totals)
+      .on(tables.itemized_invoices.Invoice_Number == tables.invoice_totals.Invoice_Number)
+      .left_join(tables.customer)
+      .on(tables.invoice_totals.CustNum == tables.customer.CustNum)
+      .left_join(tables.inventory_coupon)
+      .on(tables.itemized_invoices.ItemNum == tables.inventory_coupon.ItemNum)
+    )
+    .select(
+      tables.itemized_invoices.Invoice_Number,
+      tables.itemized_invoices.ItemNum,
+      tables.inventory.ItemName,
+      tables.inventory.Dept_ID,
+      tables.invoice_totals.DateTime,
+      tables.itemized_invoices.Quantity,
+    )
+    .where(tables.invoice_totals.DateTime >= Parameter("?"))
+    .where(tables.invoice_totals.DateTime < Parameter("?"))
   )
 
 
-def build_volume_report_query(start_date: date | datetime, end_date: date | datetime) -> QueryBuilder:
+VOLUME_REPORT_TEMPLATE = QueryTemplate(_volume_report_query)
+
+
+def build_volume_report_query(start_date: date | datetime, end_date: date | datetime) -> QueryTemplate:
   """Build a query to retrieve itemized invoices between two dates.
 
   :param start_date: Start date to filter invoices. Inclusive
   :type start_date: date | datetime
   :param end_date: End date to filter invoices. Exclusive
   :type end_date: date | datetime
-  :return: QueryBuilder to retrieve itemized invoices between two dates.
-  :rtype: QueryBuilder
+  :return: QueryTemplate to retrieve itemized invoices between two dates.
+  :rtype: QueryTemplate
   """
-  if isinstance(start_date, datetime):
-    start_date = start_date.date()
-  if isinstance(end_date, datetime):
-    end_date = end_date.date()
+  return VOLUME_REPORT_TEMPLATE.with_params(_to_param_date(start_date), _to_param_date(end_date))
 
-  return (
-    (
-      Query.from_(_table_itemized_invoices)
-      .left_join(_table_inventory)
-      .on(_table_itemized_invoices.ItemNum == _table_inventory.ItemNum)
-      .left_join(_table_invoice_totals)
-      .on(_table_itemized_invoices.Invoice_Number == _table_invoice_totals.Invoice_Number)
-      .left_join(_table_customer)
-      .on(_table_invoice_totals.CustNum == _table_customer.CustNum)
-      .left_join(_table_inventory_coupon)
-      .on(_table_itemized_invoices.ItemNum == _table_inventory_coupon.ItemNum)
-    )
-    .select(
-      _table_itemized_invoices.Invoice_Number,
-      _table_itemized_invoices.ItemNum,
-      _table_inventory.ItemName,
-      _table_inventory.Dept_ID,
-      _table_invoice_totals.DateTime,
-      _table_itemized_invoices.Quantity,
-    )
-    .where(_table_invoice_totals.DateTime >= start_date)
-    .where(_table_invoice_totals.DateTime < end_date)
+
+def _employee_info_query(tables: StoreTables) -> QueryBuilder:
+  return Query.from_(tables.employee).select(
+    tables.itemized_invoices.Cashier_ID,
+    tables.itemized_invoices.EmpName,
   )
 
 
-def build_employee_info_query() -> QueryBuilder:
+EMPLOYEE_INFO_TEMPLATE = QueryTemplate(_employee_info_query)
+
+
+def build_employee_info_query() -> QueryTemplate:
   """Build a query to retrieve employee info.
 
-  :return: QueryBuilder to retrieve employee info.
-  :rtype: QueryBuilder
+  :return: QueryTemplate to retrieve employee info.
+  :rtype: QueryTemplate
   """
-  return Query.from_(_table_employee).select(
-    _table_itemized_invoices.Cashier_ID,
-    _table_itemized_invoices.EmpName,
-  )
+  return EMPLOYEE_INFO_TEMPLATE
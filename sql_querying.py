@@ -3,33 +3,51 @@ if __name__ == "__main__":
 
   configure_logging()
 
+import atexit
 import inspect
 import json
-from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from itertools import product
 from logging import INFO, getLogger
 from pathlib import Path
-from threading import Lock
-from typing import Literal, cast
+from threading import BoundedSemaphore, Lock
+from time import monotonic, perf_counter
+from typing import Literal, NamedTuple, cast
 
+import dataframe_utils
 from config import SETTINGS
+from dataframe_utils import (
+  concat_column_chunks,
+  concat_slices,
+  materialize_column,
+  materialize_columns,
+  normalize_column_values,
+)
 from logging_config import RICH_CONSOLE
+from numpy import empty, ndarray
 from pandas import DataFrame
-from pyodbc import Connection, Error, OperationalError, connect
+from pandas.api.extensions import ExtensionArray
+from pyodbc import Connection, Cursor, Error, OperationalError, connect
+from result_cache import source_digest
+from retry_policy import RetryPolicy, StoreCircuitBreakers
 from rich_custom import LiveCustom
-from sql_query_builders import update_database_name
+from sql_query_builders import FINGERPRINT_COLUMN, QueryTemplate
+from store_scheduler import AdaptiveStoreScheduler
 from types_custom import (
   ColNameEnum,
+  PhysicalDtype,
   QueryDict,
   QueryName,
   QueryPackage,
+  QueryResultColumns,
   QueryResultsPackage,
   SQLCreds,
   SQLHostName,
   StoreNum,
   StoreResultsPackage,
 )
-from utils import DoNotCacheException, cached_for_testing, get_week_of
+from utils import DoNotCacheException, atomic_write, cached_result, get_week_of
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
@@ -44,6 +62,7 @@ LAST_USED_DB_QUERYFILE = (CWD / __file__).with_name("last used database name.sql
 PCA_SQL_CREDS_PATH = (CWD / __file__).with_name("store_sql_creds.json")
 DIRECT_IP_ADDRESS_LOOKUP_JSON = (CWD / __file__).with_name("store_ip_address_lookup.json")
 STORE_SQL_CREDS_OVERRIDE_PATH = CWD / "store_sql_creds_override.json"
+STORE_ROUTE_CACHE_PATH = CWD / "store_route_cache.json"
 
 SQL_DRIVER_DEFAULT = "{ODBC Driver 18 for SQL Server}"
 
@@ -101,62 +120,95 @@ class StoreSQLConn:
     "TrustServerCertificate=yes;"
   )
 
-  def __init__(self, storenum: StoreNum):
+  def __init__(self, storenum: StoreNum, pool: "StoreConnectionPool | None" = None):
     self.storenum = storenum
+    self.pool = pool
     self.cred_data = load_sql_creds()
-    try:
-      self.hostname = get_store_sql_hostname(storenum, hostname_lookup_method="IP")
-    except ValueError:
-      self.hostname = get_store_sql_hostname(storenum, hostname_lookup_method="DNS")
+
+    self.routes: dict[Literal["DNS", "IP"], SQLHostName] = {}
+    for method in SQL_HOSTNAME_METHODS:
+      try:
+        self.routes[method] = get_store_sql_hostname(storenum, hostname_lookup_method=method)
+      except ValueError:
+        continue
+
+    # Try the route that won last time first, the IP lookup otherwise
+    preferred = STORE_ROUTE_CACHE.get(storenum) or "IP"
+    self.routes = dict(sorted(self.routes.items(), key=lambda route: route[0] != preferred))
+    self.hostname = next(iter(self.routes.values()))
+
+  def connect_to(self, hostname: SQLHostName) -> Connection:
+    conn = connect(
+      self._conn_string_template.format(
+        driver=self.cred_data["DRIVER"],
+        hostname=hostname,
+        uid=self.cred_data["UID"],
+        pwd=self.cred_data["PWD"],
+      ),
+      readonly=True,
+      timeout=10,
+    )
+
+    if conn is None:
+      raise NoConnectionError(f"Failed to connect to store {self.storenum} SQL server")
+
+    return conn
 
   def establish_connection(self) -> Connection:
-    try:
-      conn = connect(
-        self._conn_string_template.format(
-          driver=self.cred_data["DRIVER"],
-          hostname=self.hostname,
-          uid=self.cred_data["UID"],
-          pwd=self.cred_data["PWD"],
-        ),
-        readonly=True,
-        timeout=10,
-      )
+    """Race a connection over every known route to the store, keeping whichever connects first.
 
-      if conn is None:
-        raise NoConnectionError(f"Failed to connect to store {self.storenum} SQL server")
+    The preferred route starts first, each following route starts ``SQL_CONNECT_STAGGER`` seconds later
+    or as soon as the previous one fails. Connections that lose the race are closed once they complete.
+    The winning route is remembered in the route cache for the next run.
+    """
+    routes = list(self.routes.items())
+    if len(routes) == 1:
+      return self.connect_to(self.hostname)
 
-    except Exception as e:
-      exc_type, exc_val, exc_tb = type(e), e, e.__traceback__
-      # if exc_type inhereits from Error or is Error
-      sqlstate = exc_val.args[0]
-      if (exc_type is OperationalError and sqlstate == "08001") or exc_type is NoConnectionError:
-        logger.debug(
-          f"SFT {self.storenum}: Connection to store  SQL server timed out",
-          exc_info=(exc_type, exc_val, exc_tb),
-          stack_info=True,
-        )
-        try:
-          self.hostname = get_store_sql_hostname(self.storenum, hostname_lookup_method="DNS")
-        except ValueError as exc:
-          raise NoConnectionError(f"Failed to connect to store {self.storenum} SQL server") from exc
-        try:
-          conn = connect(
-            self._conn_string_template.format(
-              driver=self.cred_data["DRIVER"],
-              hostname=self.hostname,
-              uid=self.cred_data["UID"],
-              pwd=self.cred_data["PWD"],
-            ),
-            readonly=True,
-            timeout=10,
-          )
-        except Exception as e:
-          raise e
+    executor = ThreadPoolExecutor(max_workers=len(routes), thread_name_prefix=f"connect_{self.storenum:0>3}")
+    attempts: dict[Future, Literal["DNS", "IP"]] = {}
+    winner: Connection | None = None
+    last_exc: BaseException | None = None
 
-    return conn
+    try:
+      while winner is None and (routes or attempts):
+        if routes:
+          method, hostname = routes.pop(0)
+          attempts[executor.submit(self.connect_to, hostname)] = method
+
+        done, _ = wait(attempts, timeout=SETTINGS.sql_connect_stagger if routes else None, return_when=FIRST_COMPLETED)
+
+        for future in done:
+          method = attempts.pop(future)
+          try:
+            conn = future.result()
+          except Exception as e:
+            logger.debug(f"SFT {self.storenum:0>3}: Connecting over {method} failed", exc_info=e)
+            last_exc = e
+            continue
+
+          if winner is None:
+            winner = conn
+            self.hostname = self.routes[method]
+            STORE_ROUTE_CACHE.set(self.storenum, method)
+            logger.debug(f"SFT {self.storenum:0>3}: Connected over {method}")
+          else:
+            StoreConnectionPool._close(conn)
+    finally:
+      for future in attempts:
+        future.add_done_callback(_close_connect_attempt)
+      executor.shutdown(wait=False)
+
+    if winner is None:
+      raise last_exc
+
+    return winner
 
   def __enter__(self) -> Connection:
-    self.conn = self.establish_connection()
+    if self.pool is None:
+      self.conn = self.establish_connection()
+    else:
+      self.conn = self.pool.acquire(self.storenum, connect=self.establish_connection)
 
     if self.conn is None:
       raise NoConnectionError(f"Failed to connect to store {self.storenum} SQL server")
@@ -176,6 +228,7 @@ class StoreSQLConn:
             exc_info=(exc_type, exc_val, exc_tb),
             stack_info=True,
           )
+        self.release_connection(discard=True)
         return True
       elif exc_type is NoConnectionError:
         logger.error(
@@ -183,6 +236,7 @@ class StoreSQLConn:
           exc_info=(exc_type, exc_val, exc_tb),
           stack_info=True,
         )
+        self.release_connection(discard=True)
         return True
       else:
         logger.error(
@@ -191,41 +245,323 @@ class StoreSQLConn:
           stack_info=True,
         )
 
-    if hasattr(self, "conn"):
+    self.release_connection(discard=exc_type is not None)
+
+  def release_connection(self, discard: bool = False) -> None:
+    if not hasattr(self, "conn"):
+      return
+
+    if self.pool is None:
       self.conn.close()
+    else:
+      self.pool.release(self.storenum, self.conn, discard=discard)
+
+    del self.conn
+
+
+def _close_connect_attempt(future: Future) -> None:
+  if future.exception() is None:
+    StoreConnectionPool._close(future.result())
+
+
+class StoreRouteCache:
+  """Remembers which route, IP lookup or Tailscale DNS, last connected to each store."""
+
+  def __init__(self, path: Path):
+    self.path = path
+    self._lock = Lock()
+    self.routes: dict[str, Literal["DNS", "IP"]] = {}
+    if path.exists():
+      with path.open("r") as file:
+        self.routes = json.load(file)
+
+  def get(self, storenum: StoreNum) -> Literal["DNS", "IP"] | None:
+    return self.routes.get(str(storenum))
+
+  def set(self, storenum: StoreNum, method: Literal["DNS", "IP"]) -> None:
+    with self._lock:
+      if self.routes.get(str(storenum)) == method:
+        return
+      self.routes[str(storenum)] = method
+      atomic_write(self.path, lambda temp_path: temp_path.write_text(json.dumps(self.routes, indent=2)))
+
+
+STORE_ROUTE_CACHE = StoreRouteCache(STORE_ROUTE_CACHE_PATH)
+
+
+class _IdleConnection(NamedTuple):
+  conn: Connection
+  released_at: float
+
+
+class StoreConnectionPool:
+  """Keeps warm readonly connections per store and hands them out to every query for that store.
+
+  With one connection per store, the scheduler runs the jobs of a store one after another and every job
+  after the first reuses the connection the first one opened. Raising ``max_per_store`` lets the jobs of a
+  store, like the slices of a large store, run side by side on connections of their own.
+
+  Idle connections are health checked before they are reused and closed once they have sat unused
+  for longer than ``idle_timeout`` seconds. Connect latency is recorded per store.
+  """
+
+  _health_check_query = "SELECT 1"
+
+  def __init__(
+    self,
+    max_per_store: int = SETTINGS.sql_pool_size,
+    idle_timeout: float = SETTINGS.sql_pool_idle_timeout,
+  ):
+    self.max_per_store = max_per_store
+    self.idle_timeout = idle_timeout
+    self.connect_latency: dict[StoreNum, list[float]] = {}
+
+    self._lock = Lock()
+    self._idle: dict[StoreNum, list[_IdleConnection]] = {}
+    self._slots: dict[StoreNum, BoundedSemaphore] = {}
+
+  def _store_slots(self, storenum: StoreNum) -> BoundedSemaphore:
+    with self._lock:
+      return self._slots.setdefault(storenum, BoundedSemaphore(self.max_per_store))
+
+  def _is_healthy(self, storenum: StoreNum, conn: Connection) -> bool:
+    try:
+      with conn.cursor() as cursor:
+        cursor.execute(self._health_check_query).fetchone()
+    except Error:
+      logger.debug(f"SFT {storenum:0>3}: Pooled connection failed health check, discarding")
+      return False
+    return True
+
+  def _checkout_idle(self, storenum: StoreNum) -> Connection | None:
+    while True:
+      with self._lock:
+        idle = self._idle.get(storenum)
+        if not idle:
+          return None
+        conn, released_at = idle.pop()
+
+      if monotonic() - released_at > self.idle_timeout or not self._is_healthy(storenum, conn):
+        self._close(conn)
+        continue
+
+      return conn
+
+  def acquire(self, storenum: StoreNum, connect: Callable[[], Connection]) -> Connection:
+    """Check out a connection for ``storenum``, blocking while the store is at ``max_per_store`` connections.
+
+    :param storenum: Store to connect to.
+    :type storenum: StoreNum
+    :param connect: Callable used to open a new connection when no healthy idle one is available.
+    :type connect: Callable[[], Connection]
+    :return: An open readonly connection. Must be handed back with :meth:`release`.
+    :rtype: Connection
+    """
+    slots = self._store_slots(storenum)
+    slots.acquire()
+    try:
+      if (conn := self._checkout_idle(storenum)) is not None:
+        return conn
+
+      start = perf_counter()
+      conn = connect()
+      elapsed = perf_counter() - start
 
+      with self._lock:
+        self.connect_latency.setdefault(storenum, []).append(elapsed)
+      logger.debug(f"SFT {storenum:0>3}: Connected to store SQL server in {elapsed:.2f}s")
 
-_QUERY_THREADING_LOCK = Lock()
+      return conn
+    except BaseException:
+      slots.release()
+      raise
+
+  def release(self, storenum: StoreNum, conn: Connection, discard: bool = False) -> None:
+    """Hand a connection back to the pool. Discarded connections are closed instead of kept warm."""
+    try:
+      if discard:
+        self._close(conn)
+      else:
+        with self._lock:
+          self._idle.setdefault(storenum, []).append(_IdleConnection(conn, monotonic()))
+    finally:
+      self._store_slots(storenum).release()
+
+    self.close_idle()
+
+  def close_idle(self, max_idle: float | None = None) -> None:
+    """Close every idle connection that has been unused for longer than ``max_idle`` seconds."""
+    max_idle = self.idle_timeout if max_idle is None else max_idle
+    now = monotonic()
+    expired: list[Connection] = []
+
+    with self._lock:
+      for storenum, idle in self._idle.items():
+        keep = [entry for entry in idle if now - entry.released_at <= max_idle]
+        expired.extend(entry.conn for entry in idle if now - entry.released_at > max_idle)
+        self._idle[storenum] = keep
+
+    for conn in expired:
+      self._close(conn)
+
+  def close_all(self) -> None:
+    self.close_idle(max_idle=-1)
+
+  def latency_summary(self) -> dict[StoreNum, float]:
+    """Mean connect latency in seconds per store."""
+    with self._lock:
+      return {storenum: sum(latencies) / len(latencies) for storenum, latencies in self.connect_latency.items() if latencies}
+
+  @staticmethod
+  def _close(conn: Connection) -> None:
+    try:
+      conn.close()
+    except Error:
+      pass
+
+
+# Slices of a store run side by side up to SQL_SLICE_POOL_SIZE, its other jobs share SQL_POOL_SIZE connections
+SLICES_PER_STORE = max(SETTINGS.sql_pool_size, SETTINGS.sql_slice_pool_size)
+
+STORE_CONNECTION_POOL = StoreConnectionPool(max_per_store=SLICES_PER_STORE)
+atexit.register(STORE_CONNECTION_POOL.close_all)
+
+RETRY_POLICY = RetryPolicy()
+STORE_CIRCUIT_BREAKERS = StoreCircuitBreakers()
+
+
+def resolve_query_columns(cols: type[ColNameEnum] | list[str]) -> list[str]:
+  if not isinstance(cols, list) and issubclass(cols, ColNameEnum):
+    return cols.init_columns()
+  return cols
+
+
+def resolve_query_dtypes(
+  cols: type[ColNameEnum] | list[str], schema: type[ColNameEnum] | None = None
+) -> dict[str, PhysicalDtype] | None:
+  if schema is not None:
+    return schema.physical_dtypes()
+  if not isinstance(cols, list) and issubclass(cols, ColNameEnum):
+    return cols.physical_dtypes()
+  return None
+
+
+def stream_query_batches(
+  cursor: Cursor, columns: list[str], batch_size: int = SETTINGS.sql_fetch_batch_size
+) -> Iterator[QueryResultColumns]:
+  """Yield the pending result set of ``cursor`` as ``fetchmany`` batches split into per-column arrays.
+
+  Only one batch of driver rows is alive at a time, so callers that consume the batches as they arrive
+  hold memory proportional to ``batch_size`` rather than to the size of the result.
+
+  :param cursor: Cursor that has just executed a query.
+  :type cursor: Cursor
+  :param columns: Names to give the result columns, in select order.
+  :type columns: list[str]
+  :param batch_size: Number of rows to pull from the driver per round trip.
+  :type batch_size: int
+  :raises ValueError: If the result does not have exactly one column per name in ``columns``.
+  :yield: A mapping of column name to an object array holding that column's values for the batch.
+  :rtype: Iterator[QueryResultColumns]
+  """
+  if len(cursor.description) != len(columns):
+    raise ValueError(f"Query returned {len(cursor.description)} columns but {len(columns)} column names were given")
+
+  while batch := cursor.fetchmany(batch_size):
+    batch_columns = {}
+    for column, values in zip(columns, zip(*batch)):
+      column_values = empty(len(values), dtype=object)
+      column_values[:] = values
+      batch_columns[column] = column_values
+
+    del batch
+    yield batch_columns
+    del batch_columns
+
+
+def fetch_columnar(
+  cursor: Cursor,
+  columns: list[str],
+  dtypes: dict[str, PhysicalDtype] | None = None,
+  batch_size: int = SETTINGS.sql_fetch_batch_size,
+) -> QueryResultColumns:
+  """Fetch the pending result set of ``cursor`` straight into one array per column.
+
+  When ``dtypes`` is given, every batch gets the ``0E-8`` Decimal fix and NULL normalization as it arrives
+  and is stored in its physical dtype right away, see :func:`materialize_column`. Only the compact typed
+  chunks outlive their batch, the object arrays of a batch are released before the next one is fetched.
+  """
+  chunks: dict[str, list[ndarray | ExtensionArray]] = {column: [] for column in columns}
+
+  for batch_columns in stream_query_batches(cursor, columns, batch_size):
+    for column, values in batch_columns.items():
+      if dtypes is not None:
+        dtype = dtypes.get(column)
+        values = materialize_column(column, normalize_column_values(values, dtype), dtype)
+      chunks[column].append(values)
+    del batch_columns
+
+  return {
+    column: concat_column_chunks(column_chunks)
+    if column_chunks
+    else materialize_column(column, empty(0, dtype=object), None if dtypes is None else dtypes.get(column))
+    for column, column_chunks in chunks.items()
+  }
 
 
 def query_store(storenum: StoreNum, queries: QueryDict) -> QueryResultsPackage:
   static_queries = {}
   results = QueryResultsPackage(storenum=storenum)
-  with StoreSQLConn(storenum) as conn:
+  with StoreSQLConn(storenum, pool=STORE_CONNECTION_POOL) as conn:
     with conn.cursor() as cursor:
       if not (db_name := get_db_name_override(storenum)):
         db_name = cursor.execute(LAST_USED_DB_QUERYFILE.read_text()).fetchone()[0]
-      with _QUERY_THREADING_LOCK:
-        update_database_name(db_name)
 
-        for query_name, (query, _) in queries.items():
-          static_queries[query_name] = query.get_sql()
+      for query_name, query_package in queries.items():
+        query = query_package.query
+        if not isinstance(query, QueryTemplate):
+          query = query(storenum)
+        static_queries[query_name] = (query.render(db_name), query.params)
 
-      for query_name, query in static_queries.items():
+      for query_name, (query, params) in static_queries.items():
         logger.info(f"SFT {storenum:0>3}: Querying {query_name} data")
-        results[query_name] = cursor.execute(query).fetchall()
+        cursor.execute(query, *params)
+
+        if not (columns := resolve_query_columns(queries[query_name].cols)):
+          columns = [description[0] for description in cursor.description]
+
+        results[query_name] = fetch_columnar(
+          cursor,
+          columns,
+          dtypes=resolve_query_dtypes(queries[query_name].cols, queries[query_name].schema),
+        )
 
   return results
 
 
-@cached_for_testing(date_for_sig=CUR_WEEK)
+@cached_result(date_for_sig=CUR_WEEK, copy_frames=False, version=source_digest(dataframe_utils))
 def get_store_data(
   storenum: StoreNum,
   queries: QueryDict,
+  versions: dict[QueryName, str] | None = None,
+  record_success: bool = True,
 ) -> StoreResultsPackage:  # sourcery skip: raise-from-previous-error
+  """Query a store, the result is cached under the answers of the version queries given as ``versions``.
+
+  Only called through the cache by :func:`fetch_store_data`, which runs the version queries first. Failures
+  always count against the store's circuit breaker, successes only close it when ``record_success`` is set.
+  """
   is_caching = inspect.stack()[1][3] == "caching_wrapper"
   empty_return = StoreResultsPackage(storenum=storenum)
 
+  breaker = STORE_CIRCUIT_BREAKERS.for_store(storenum)
+  if not breaker.allow():
+    logger.info(f"SFT {storenum:0>3}: Skipping store, queries to it are paused after repeated failures")
+    if is_caching:
+      raise DoNotCacheException(f"Queries to store {storenum} are paused", intended_return=empty_return)
+    else:
+      return empty_return
+
   logger.debug(
     f"SFT {storenum:0>3}: Getting Store Data",
   )
@@ -234,15 +570,11 @@ def get_store_data(
     logger.debug(f"SFT {storenum:0>3}: Finished querying store")
   except NoConnectionError:
     logger.warning(f"SFT {storenum:0>3}: Failed to connect to store SQL server")
-    logger.info(f"SFT {storenum:0>3}: Retrying connection to store SQL server")
-    try:
-      query_results = query_store(storenum, queries)
-    except NoConnectionError:
-      logger.warning(f"SFT {storenum:0>3}: Connection failed on retry")
-      if is_caching:
-        raise DoNotCacheException(f"Failed to connect to store {storenum} SQL server", intended_return=empty_return)
-      else:
-        return empty_return
+    breaker.record_failure()
+    if is_caching:
+      raise DoNotCacheException(f"Failed to connect to store {storenum} SQL server", intended_return=empty_return)
+    else:
+      return empty_return
 
   except Exception as e:
     exc_type, exc_val, exc_tb = type(e), e, e.__traceback__
@@ -269,6 +601,7 @@ def get_store_data(
           exc_info=(exc_type, exc_val, exc_tb),
           stack_info=True,
         )
+    breaker.record_failure()
     if is_caching:
       raise DoNotCacheException(f"Failed to connect to store {storenum} SQL server", intended_return=empty_return)
     else:
@@ -276,16 +609,24 @@ def get_store_data(
 
   store_data = {}
 
+  if missing := queries.keys() - query_results.keys():
+    # StoreSQLConn swallows connection errors raised mid query, leaving the results incomplete
+    logger.warning(f"SFT {storenum:0>3}: Lost connection before {", ".join(missing)} finished")
+    breaker.record_failure()
+    if is_caching:
+      raise DoNotCacheException(f"Failed to connect to store {storenum} SQL server", intended_return=empty_return)
+    else:
+      return empty_return
+
   for query_name, query_result in query_results.items():
-    if not query_result:
+    if not query_result or (not len(next(iter(query_result.values()))) and not queries[query_name].allow_empty):
       logger.warning(f"SFT {storenum:0>3}: No results found for {query_name} query")
+      breaker.record_failure()
       if is_caching:
         raise DoNotCacheException(f"Failed to connect to store {storenum} SQL server", intended_return=empty_return)
       else:
         return empty_return
 
-    raw = [tuple(row) for row in query_result]
-
     if not (cols := queries.get(query_name).cols):
       logger.warning(f"SFT {storenum:0>3}: No columns found for {query_name} query")
 
@@ -296,22 +637,54 @@ def get_store_data(
       else:
         return empty_return
 
-    if not isinstance(cols, list) and issubclass(cols, ColNameEnum):
-      cols = cols.init_columns()
+    if (dtypes := resolve_query_dtypes(cols, queries[query_name].schema)) is not None:
+      store_data[query_name] = materialize_columns(query_result, dtypes)
+      continue
 
     store_data[query_name] = DataFrame(
-      raw,
+      query_result,
       dtype=object,
       # dtype=str,
       columns=cols,
     )
 
+  if record_success:
+    breaker.record_success()
+
   return StoreResultsPackage(
     storenum=storenum,
     data=store_data,
   )
 
 
+def fetch_store_data(storenum: StoreNum, queries: QueryDict) -> StoreResultsPackage:
+  """Query a store, reusing the cached results while the versions of every query are unchanged.
+
+  Results of queries without a version, like fingerprint and probe queries, are fetched every time, as are
+  the results of every query sent in the same job as one.
+  """
+  if not all(isinstance(package.query, QueryTemplate) and package.query.version for package in queries.values()):
+    return get_store_data.__wrapped__(storenum, queries)
+
+  # A cheap version query answering says nothing of whether the queries behind it will, only they reset the breaker
+  version_results = get_store_data.__wrapped__(
+    storenum,
+    {
+      query_name: QueryPackage(query=package.query.version, cols=[FINGERPRINT_COLUMN])
+      for query_name, package in queries.items()
+    },
+    record_success=False,
+  )
+  if not version_results:
+    return version_results
+
+  return get_store_data(
+    storenum=storenum,
+    queries=queries,
+    versions={query_name: repr(result[FINGERPRINT_COLUMN].iloc[0]) for query_name, result in version_results.items()},
+  )
+
+
 DEFAULT_STORES_LIST = [
   1,
   2,
@@ -385,10 +758,10 @@ if SETTINGS.testing_stores:
 
 
 def query_all_stores_multithreaded[q_name: QueryName](
-  queries: dict[q_name, QueryPackage], storenums: list[StoreNum] = DEFAULT_STORES_LIST
+  queries: dict[q_name, QueryPackage],
+  storenums: list[StoreNum] = DEFAULT_STORES_LIST,
+  size_hints: dict[StoreNum, float] | None = None,
 ) -> dict[q_name, dict[StoreNum, DataFrame]]:
-  store_querying_futures: list[Future] = []
-
   items = {storenum: storenum for storenum in storenums}
 
   with LiveCustom(
@@ -404,43 +777,141 @@ def query_all_stores_multithreaded[q_name: QueryName](
     updaters = updaters if isinstance(updaters, tuple) else (updaters,)
 
     remaining_updaters = {query_name: updater for query_name, updater in zip(queries.keys(), updaters)}
-    with ThreadPoolExecutor(
-      max_workers=len(storenums) * len(queries),
-    ) as executor:
-      for (query_name, query_package), storenum in product(queries.items(), storenums):
-        future = executor.submit(
-          get_store_data,
+
+    scheduler_task = pbar.add_task("", total=None)
+
+    def show_scheduler_state(scheduler: AdaptiveStoreScheduler) -> None:
+      pbar.update(
+        scheduler_task,
+        description=(
+          f"Queued {scheduler.queue_depth} | In flight {scheduler.in_flight}/{int(scheduler.limit)}"
+          f" | Failed {scheduler.failures}"
+        ),
+      )
+
+    # Queries that have to run after another one are sent to the store in the same job as it
+    groups: dict[q_name, list[q_name]] = {
+      query_name: [query_name] for query_name, package in queries.items() if package.after is None
+    }
+    for query_name, package in queries.items():
+      if package.after is not None:
+        groups[package.after].append(query_name)
+
+    with AdaptiveStoreScheduler(on_change=show_scheduler_state, size_hints=size_hints) as scheduler:
+      # Failed queries are re-queued behind the rest of the run after a backoff, so the other stores keep going
+      attempts: dict[Future, tuple[StoreNum, q_name, int, int | None]] = {}
+
+      # Slices of sliced queries per store, and the results gathered for them so far
+      slice_packages: dict[tuple[StoreNum, q_name], list[QueryPackage]] = {}
+      slice_results: dict[tuple[StoreNum, q_name], list[DataFrame | None]] = {}
+
+      def schedule(
+        storenum: StoreNum, query_name: q_name, attempt: int = 1, delay: float = 0.0, slice_index: int | None = None
+      ) -> None:
+        if slice_index is None:
+          job_name = query_name
+          per_store = None
+          # Per store queries are rendered up front, the result cache keys on the query text and its version
+          job_queries = {
+            grouped_name: package
+            if isinstance((package := queries[grouped_name]).query, QueryTemplate)
+            else package._replace(query=package.query(storenum))
+            for grouped_name in groups[query_name]
+          }
+        else:
+          job_name = f"{query_name} slice"
+          per_store = SLICES_PER_STORE
+          job_queries = {query_name: slice_packages[storenum, query_name][slice_index]}
+
+        future = scheduler.submit(
+          storenum,
+          job_name,
+          fetch_store_data,
+          delay,
+          per_store,
           storenum=storenum,
-          queries={query_name: query_package},
+          queries=job_queries,
         )
-        store_querying_futures.append(future)
+        attempts[future] = (storenum, query_name, attempt, slice_index)
+
+      for query_name, storenum in product(groups.keys(), storenums):
+        package = queries[query_name]
+        if package.slices is None or len(templates := package.slices(storenum)) < 2:
+          schedule(storenum, query_name)
+          continue
+
+        # A slice without lines is valid, a store without any is caught once the slices are reassembled
+        slice_packages[storenum, query_name] = [
+          package._replace(query=template, slices=None, allow_empty=True) for template in templates
+        ]
+        slice_results[storenum, query_name] = [None] * len(templates)
+        logger.debug(f"SFT {storenum:0>3}: Fetching {query_name} in {len(templates)} slices")
+        for slice_index in range(len(templates)):
+          schedule(storenum, query_name, slice_index=slice_index)
 
       query_results: dict[q_name, dict[StoreNum, DataFrame]] = {query_name: {} for query_name in queries.keys()}
 
       store_querying_task = pbar.add_task("Querying Stores for Scan Data", total=len(storenums))
-      for future in as_completed(store_querying_futures):
-        try:
-          result = cast(StoreResultsPackage, future.result())
-          storenum = result.storenum
-          logger.debug(f"SFT {storenum:0>3}: {result}")
-
-          if result:
-            for query_name, query_result in result.items():
-              container = query_results.setdefault(query_name, {})
-              container[storenum] = query_result
-              remaining_updaters[query_name](storenum)
-              logger.info(
-                f"SFT {storenum:0>3}: Finished getting {query_name}",
-                extra={"markup": True},
-              )
-
-        except Exception as e:
-          logger.error(
-            "An exception occurred while querying a store",
-            exc_info=(type(e), e, e.__traceback__),
-            stack_info=True,
-          )
-        if all(storenum in container for container in query_results.values()):
-          pbar.update(store_querying_task, advance=1)
+      while attempts:
+        done, _ = wait(attempts, return_when=FIRST_COMPLETED)
+
+        for future in done:
+          storenum, query_name, attempt, slice_index = attempts.pop(future)
+          try:
+            result = cast(StoreResultsPackage, future.result())
+            logger.debug(f"SFT {storenum:0>3}: {result}")
+          except Exception as e:
+            logger.error(
+              "An exception occurred while querying a store",
+              exc_info=(type(e), e, e.__traceback__),
+              stack_info=True,
+            )
+            result = None
+
+          if not result:
+            if (storenum, query_name) in slice_packages and (storenum, query_name) not in slice_results:
+              # Another slice of the store already gave up
+              continue
+            if RETRY_POLICY.should_retry(attempt):
+              breaker = STORE_CIRCUIT_BREAKERS.for_store(storenum)
+              delay = max(RETRY_POLICY.delay(attempt), breaker.retry_after())
+              logger.info(f"SFT {storenum:0>3}: Re-queueing {query_name} in {delay:.1f}s (attempt {attempt + 1})")
+              schedule(storenum, query_name, attempt + 1, delay, slice_index)
+            else:
+              logger.warning(f"SFT {storenum:0>3}: Giving up on {query_name} after {attempt} attempts")
+              slice_results.pop((storenum, query_name), None)
+            continue
+
+          if slice_index is not None:
+            if (gathered := slice_results.get((storenum, query_name))) is None:
+              continue
+            gathered[slice_index] = result[query_name]
+            if any(slice_result is None for slice_result in gathered):
+              continue
+
+            del slice_results[storenum, query_name]
+            package = queries[query_name]
+            combined = concat_slices(gathered, resolve_query_dtypes(package.cols, package.schema))
+            if combined.empty and not package.allow_empty:
+              logger.warning(f"SFT {storenum:0>3}: No results found for {query_name} query")
+              continue
+            result = StoreResultsPackage(storenum=storenum, data={query_name: combined})
+
+          for query_name, query_result in result.items():
+            container = query_results.setdefault(query_name, {})
+            container[storenum] = query_result
+            remaining_updaters[query_name](storenum)
+            logger.info(
+              f"SFT {storenum:0>3}: Finished getting {query_name}",
+              extra={"markup": True},
+            )
+
+          if all(storenum in container for container in query_results.values()):
+            pbar.update(store_querying_task, advance=1)
+
+    pbar.remove_task(scheduler_task)
+
+  for storenum, latency in STORE_CONNECTION_POOL.latency_summary().items():
+    logger.debug(f"SFT {storenum:0>3}: Mean connect latency {latency:.2f}s")
 
   return query_results
@@ -0,0 +1,107 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+from collections.abc import Iterable
+from datetime import datetime
+from logging import getLogger
+from typing import NamedTuple
+
+from pandas import DatetimeIndex, Series, date_range, to_datetime
+from sql_query_builders import DAY_COLUMN, LINES_COLUMN, build_daily_line_counts_query
+from sql_querying import DEFAULT_STORES_LIST, query_all_stores_multithreaded
+from types_custom import QueryPackage, StoreNum
+
+logger = getLogger(__name__)
+
+
+class StoreProbe(NamedTuple):
+  storenum: StoreNum
+  # Itemized invoice lines per day, indexed by midnight of the day
+  daily_lines: Series
+  # Days of the window without a single line
+  missing_days: DatetimeIndex
+
+  @property
+  def total_lines(self) -> int:
+    return int(self.daily_lines.sum())
+
+  @property
+  def complete(self) -> bool:
+    return self.missing_days.empty
+
+
+def probe_stores(
+  start: datetime,
+  end: datetime,
+  storenums: list[StoreNum] = DEFAULT_STORES_LIST,
+  dept_ids: Iterable[str] | None = None,
+) -> dict[StoreNum, StoreProbe]:
+  """Count the itemized invoice lines of every store per day before extracting them.
+
+  Stores without lines on some days of the window are flagged right away, rather than after their invoices
+  have been downloaded and validated.
+
+  The counts are taken fresh on every run. The line counts query carries no version, so the result cache never
+  answers it, and a store that had no lines yet is probed again next time instead of being dropped all week.
+
+  :param start: Start of the extraction window. Inclusive
+  :type start: datetime
+  :param end: End of the extraction window. Exclusive
+  :type end: datetime
+  :param storenums: Stores to probe.
+  :type storenums: list[StoreNum]
+  :param dept_ids: Only count lines of items in these departments, all departments if not given.
+  :type dept_ids: Iterable[str] | None
+  :return: Probe of every store that answered. Stores that could not be queried are left out.
+  :rtype: dict[StoreNum, StoreProbe]
+  """
+  expected_days = date_range(start=start, end=end, freq="D", inclusive="left").normalize()
+
+  results = query_all_stores_multithreaded(
+    queries={
+      "daily_lines": QueryPackage(
+        query=build_daily_line_counts_query(start, end, dept_ids=dept_ids),
+        cols=[DAY_COLUMN, LINES_COLUMN],
+        allow_empty=True,
+      )
+    },
+    storenums=storenums,
+  )["daily_lines"]
+
+  probes = {}
+  for storenum, counts in results.items():
+    daily_lines = Series(
+      counts[LINES_COLUMN].astype(int).to_numpy(),
+      index=DatetimeIndex(to_datetime(counts[DAY_COLUMN])).normalize(),
+      name=LINES_COLUMN,
+    ).sort_index()
+
+    probe = StoreProbe(
+      storenum=storenum,
+      daily_lines=daily_lines,
+      missing_days=expected_days.difference(daily_lines.index),
+    )
+
+    if not probe.complete:
+      logger.warning(
+        f"SFT {storenum:0>3}: Probe counted no invoice lines on"
+        f" {", ".join(str(day.date()) for day in probe.missing_days)}, the store may not have uploaded those days yet"
+      )
+
+    probes[storenum] = probe
+
+  if unanswered := sorted(set(storenums).difference(probes)):
+    logger.warning(f"Stores {", ".join(str(storenum) for storenum in unanswered)} could not be probed")
+
+  return probes
+
+
+def extractable_stores(probes: dict[StoreNum, StoreProbe]) -> list[StoreNum]:
+  """Stores worth running the full extraction against, every probed store with at least one line.
+
+  Stores that failed the probe or have nothing to extract would only fail the extraction after exhausting
+  its retries.
+  """
+  return [storenum for storenum, probe in probes.items() if probe.total_lines]
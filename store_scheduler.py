@@ -0,0 +1,245 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+import json
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from threading import Lock, Timer
+from time import monotonic, perf_counter
+from typing import Any, NamedTuple, Self
+
+from config import SETTINGS
+from types_custom import QueryName, StoreNum
+from utils import atomic_write
+
+logger = getLogger(__name__)
+
+
+CWD = Path.cwd()
+
+
+STORE_QUERY_STATS_PATH = CWD / "store_query_stats.json"
+
+# Weight given to the newest duration in the per store moving average
+STATS_SMOOTHING = 0.3
+# A job taking this many times longer than its store's average counts as congestion
+LATENCY_CONGESTION_FACTOR = 2.0
+# Multiplicative decrease applied to the limit on congestion or failure
+LIMIT_BACKOFF = 0.5
+
+
+type StoreQueryStats = dict[str, dict[QueryName, float]]
+
+
+class _ScheduledJob(NamedTuple):
+  storenum: StoreNum
+  query_name: QueryName
+  func: Callable[..., Any]
+  kwargs: dict[str, Any]
+  future: Future
+  # monotonic time the job may start at, 0 for jobs that may start right away
+  not_before: float = 0.0
+  # Jobs the store may have in flight for this one to start, the scheduler's per_store when not given
+  per_store: int | None = None
+
+
+class AdaptiveStoreScheduler:
+  """Runs store queries with a bounded, self tuning number of queries in flight.
+
+  The global limit follows additive increase / multiplicative decrease. Every successful query that
+  finishes within ``LATENCY_CONGESTION_FACTOR`` times its store's historical duration raises the limit by
+  ``1 / limit``. A failed or congested query halves the limit. A job only starts while its store has fewer
+  than ``per_store`` queries in flight, or fewer than the limit it was submitted with. Queued jobs are started slowest first, based on the durations persisted from previous
+  runs, so the slowest stores do not end up as the long tail. Stores given a ``size_hints`` entry, such as
+  their probed line count, are ordered by it first.
+  """
+
+  def __init__(
+    self,
+    max_in_flight: int = SETTINGS.sql_max_in_flight,
+    min_in_flight: int = SETTINGS.sql_min_in_flight,
+    per_store: int = SETTINGS.sql_pool_size,
+    succeeded: Callable[[Any], bool] = bool,
+    on_change: Callable[["AdaptiveStoreScheduler"], None] | None = None,
+    stats_path: Path = STORE_QUERY_STATS_PATH,
+    size_hints: dict[StoreNum, float] | None = None,
+  ):
+    self.max_in_flight = max_in_flight
+    self.min_in_flight = min(min_in_flight, max_in_flight)
+    self.per_store = per_store
+    self.succeeded = succeeded
+    self.on_change = on_change
+    self.stats_path = stats_path
+    self.size_hints = size_hints or {}
+
+    self.limit = float(max(self.min_in_flight, max_in_flight // 2))
+    self.in_flight = 0
+    self.failures = 0
+
+    self.stats: StoreQueryStats = {}
+    if stats_path.exists():
+      with stats_path.open("r") as file:
+        self.stats = json.load(file)
+
+    self._lock = Lock()
+    self._pending: list[_ScheduledJob] = []
+    self._store_in_flight: dict[StoreNum, int] = {}
+    self._timers: list[Timer] = []
+    self._closed = False
+    self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="store_query")
+
+  @property
+  def queue_depth(self) -> int:
+    return len(self._pending)
+
+  def expected_duration(self, storenum: StoreNum, query_name: QueryName | None = None) -> float:
+    """Historical duration of a query against a store, or of all its queries when ``query_name`` is not given.
+
+    Stores that have never been timed are assumed to be the slowest so they are measured early.
+    """
+    if (store_stats := self.stats.get(str(storenum))) is None:
+      return float("inf")
+    if query_name is None:
+      return sum(store_stats.values())
+    return store_stats.get(query_name, float("inf"))
+
+  def submit(
+    self,
+    storenum: StoreNum,
+    query_name: QueryName,
+    func: Callable[..., Any],
+    delay: float = 0.0,
+    per_store: int | None = None,
+    /,
+    **kwargs,
+  ) -> Future:
+    """Queue ``func(**kwargs)`` as a query of ``query_name`` against ``storenum``.
+
+    Delayed jobs are queued behind every job that may start right away. ``per_store`` replaces the
+    scheduler's per store limit for this job, so jobs meant to run side by side, like the slices of a
+    store, can do so while the other jobs of the store still wait for it to be idle.
+
+    :return: Future resolved with the return of ``func`` once the job has run.
+    :rtype: Future
+    """
+    future = Future()
+    not_before = monotonic() + delay if delay > 0 else 0.0
+
+    with self._lock:
+      self._pending.append(_ScheduledJob(storenum, query_name, func, kwargs, future, not_before, per_store))
+      self._pending.sort(
+        key=lambda job: (
+          job.not_before,
+          -self.size_hints.get(job.storenum, 0.0),
+          -self.expected_duration(job.storenum),
+          -self.expected_duration(job.storenum, job.query_name),
+        ),
+      )
+
+      if not_before:
+        timer = Timer(delay, self._dispatch)
+        timer.daemon = True
+        self._timers.append(timer)
+        timer.start()
+
+    self._dispatch()
+    return future
+
+  def _dispatch(self) -> None:
+    started: list[_ScheduledJob] = []
+
+    with self._lock:
+      if self._closed:
+        return
+      while self.in_flight < int(self.limit) and (job := self._next_runnable()) is not None:
+        self._pending.remove(job)
+        self.in_flight += 1
+        self._store_in_flight[job.storenum] = self._store_in_flight.get(job.storenum, 0) + 1
+        started.append(job)
+
+    for job in started:
+      self._executor.submit(self._run, job)
+
+    self._notify()
+
+  def _next_runnable(self) -> _ScheduledJob | None:
+    now = monotonic()
+    for job in self._pending:
+      per_store = self.per_store if job.per_store is None else job.per_store
+      if job.not_before <= now and self._store_in_flight.get(job.storenum, 0) < per_store:
+        return job
+    return None
+
+  def _run(self, job: _ScheduledJob) -> None:
+    if not job.future.set_running_or_notify_cancel():
+      self._finish(job, None, succeeded=True)
+      return
+
+    start = perf_counter()
+    try:
+      result = job.func(**job.kwargs)
+    except BaseException as e:
+      self._finish(job, None, succeeded=False)
+      job.future.set_exception(e)
+    else:
+      self._finish(job, perf_counter() - start, succeeded=self.succeeded(result))
+      job.future.set_result(result)
+
+  def _finish(self, job: _ScheduledJob, duration: float | None, succeeded: bool) -> None:
+    with self._lock:
+      self.in_flight -= 1
+      self._store_in_flight[job.storenum] -= 1
+
+      expected = self.expected_duration(job.storenum, job.query_name)
+      congested = duration is not None and duration > expected * LATENCY_CONGESTION_FACTOR
+
+      if not succeeded or congested:
+        self.failures += not succeeded
+        self.limit = max(float(self.min_in_flight), self.limit * LIMIT_BACKOFF)
+        logger.debug(
+          f"SFT {job.storenum:0>3}: {job.query_name} {"failed" if not succeeded else "was slow"},"
+          f" lowering the in flight limit to {int(self.limit)}"
+        )
+      else:
+        self.limit = min(float(self.max_in_flight), self.limit + 1 / self.limit)
+
+      if succeeded and duration is not None:
+        store_stats = self.stats.setdefault(str(job.storenum), {})
+        previous = store_stats.get(job.query_name)
+        store_stats[job.query_name] = (
+          duration if previous is None else previous + STATS_SMOOTHING * (duration - previous)
+        )
+
+    self._dispatch()
+
+  def _notify(self) -> None:
+    if self.on_change is not None:
+      self.on_change(self)
+
+  def save_stats(self) -> None:
+    with self._lock:
+      stats = json.dumps(self.stats, indent=2)
+    atomic_write(self.stats_path, lambda temp_path: temp_path.write_text(stats))
+
+  def shutdown(self) -> None:
+    with self._lock:
+      self._closed = True
+      cancelled, self._pending = self._pending, []
+      timers, self._timers = self._timers, []
+    for timer in timers:
+      timer.cancel()
+    for job in cancelled:
+      job.future.cancel()
+
+    self._executor.shutdown(wait=True)
+    self.save_stats()
+
+  def __enter__(self) -> Self:
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.shutdown()
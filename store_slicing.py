@@ -0,0 +1,114 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+import json
+from datetime import datetime, timedelta
+from logging import getLogger
+from pathlib import Path
+
+from config import SETTINGS
+from pandas import Series, Timestamp, to_datetime
+from types_column_names import ItemizedInvoiceCols
+from types_custom import ItemizedInvoiceDataType, StoreNum
+from utils import atomic_write
+
+logger = getLogger(__name__)
+
+
+CWD = Path.cwd()
+
+
+STORE_LINE_HISTORY_PATH = CWD / "store_line_history.json"
+
+# Weight given to the newest run in the per store moving average
+HISTORY_SMOOTHING = 0.3
+
+
+type Slice = tuple[datetime, datetime]
+
+
+class StoreLineHistory:
+  """Average number of itemized invoice lines per day of every store, smoothed across runs."""
+
+  def __init__(self, path: Path = STORE_LINE_HISTORY_PATH):
+    self.path = path
+
+    self.daily_lines: dict[str, float] = {}
+    if path.exists():
+      with path.open("r") as file:
+        self.daily_lines = json.load(file)
+
+  def lines_per_day(self, storenum: StoreNum) -> float | None:
+    return self.daily_lines.get(str(storenum))
+
+  def record(self, storenum: StoreNum, data: ItemizedInvoiceDataType, start: datetime, end: datetime) -> None:
+    """Fold the invoice lines of ``storenum`` between ``start`` and ``end`` into its average.
+
+    Only the days the window covers whole are counted, a partial day at either end would drag the average down.
+    """
+    first_day, last_day = Timestamp(start).ceil("D"), Timestamp(end).floor("D")
+    if (days := (last_day - first_day).days) <= 0:
+      return
+
+    line_days = to_datetime(data[ItemizedInvoiceCols.DateTime]).dt.normalize()
+    lines_per_day = ((line_days >= first_day) & (line_days < last_day)).sum() / days
+    previous = self.daily_lines.get(str(storenum))
+    self.daily_lines[str(storenum)] = (
+      lines_per_day if previous is None else previous + HISTORY_SMOOTHING * (lines_per_day - previous)
+    )
+
+  def save(self) -> None:
+    atomic_write(self.path, lambda temp_path: temp_path.write_text(json.dumps(self.daily_lines, indent=2)))
+
+
+def plan_slices(
+  start: datetime,
+  end: datetime,
+  daily_lines: Series | None = None,
+  lines_per_day: float | None = None,
+  target_lines: int = SETTINGS.slice_target_lines,
+) -> list[Slice]:
+  """Cut the window of a store's extraction at day boundaries into slices of about ``target_lines`` lines.
+
+  Days are counted from ``daily_lines`` when given, days missing from it having no lines, and are otherwise
+  estimated at ``lines_per_day``. A store without either is not sliced.
+
+  :param start: Start of the window. Inclusive
+  :type start: datetime
+  :param end: End of the window. Exclusive
+  :type end: datetime
+  :param daily_lines: Lines per day, indexed by midnight of the day, e.g. from a store probe.
+  :type daily_lines: Series | None
+  :param lines_per_day: Average lines per day of the store, e.g. from its history.
+  :type lines_per_day: float | None
+  :param target_lines: Lines to aim for per slice.
+  :type target_lines: int
+  :return: Consecutive slices covering the window, in order.
+  :rtype: list[Slice]
+  """
+  if daily_lines is None and lines_per_day is None:
+    return [(start, end)]
+
+  cuts = [start]
+  accumulated = 0.0
+  day_start = start
+
+  while day_start < end:
+    day_end = min(end, datetime.combine(day_start.date(), datetime.min.time()) + timedelta(days=1))
+
+    if daily_lines is not None:
+      accumulated += daily_lines.get(Timestamp(day_start).normalize(), 0)
+    else:
+      accumulated += lines_per_day
+
+    if accumulated >= target_lines and day_end < end:
+      cuts.append(day_end)
+      accumulated = 0.0
+
+    day_start = day_end
+
+  cuts.append(end)
+
+  return list(zip(cuts, cuts[1:]))
@@ -0,0 +1,124 @@
+if __name__ == "__main__":
+  from logging_config import configure_logging
+
+  configure_logging()
+
+import json
+from collections.abc import Callable
+from logging import getLogger
+from pathlib import Path
+
+from pandas import DataFrame, isna, read_pickle
+from sql_query_builders import FINGERPRINT_COLUMN
+from types_custom import StoreNum
+from utils import atomic_write
+
+logger = getLogger(__name__)
+
+
+CWD = Path.cwd()
+
+
+TABLE_CACHE_FOLDER = CWD / "table_cache"
+
+
+class StoreTableCache:
+  """Local copy of a slowly changing table per store, versioned by a server side fingerprint of the table.
+
+  A store is only re-downloaded when the fingerprint its server reports differs from the one the local copy
+  was taken at.
+  """
+
+  def __init__(self, name: str, folder: Path = TABLE_CACHE_FOLDER):
+    self.name = name
+    self.folder = folder / name
+    self.folder.mkdir(exist_ok=True, parents=True)
+    self.fingerprints_path = self.folder / "fingerprints.json"
+
+    self.fingerprints: dict[str, int] = {}
+    if self.fingerprints_path.exists():
+      with self.fingerprints_path.open("r") as file:
+        self.fingerprints = json.load(file)
+
+  def _store_path(self, storenum: StoreNum) -> Path:
+    return self.folder / f"{storenum:0>3}.pkl"
+
+  def fingerprint(self, storenum: StoreNum) -> int | None:
+    """Fingerprint the local copy of ``storenum`` was taken at, None if there is no usable local copy."""
+    if not self._store_path(storenum).exists():
+      return None
+    return self.fingerprints.get(str(storenum))
+
+  def load(self, storenum: StoreNum) -> DataFrame | None:
+    if not (path := self._store_path(storenum)).exists():
+      return None
+    return read_pickle(path)
+
+  def update(self, storenum: StoreNum, fingerprint: int | None, data: DataFrame) -> None:
+    atomic_write(self._store_path(storenum), data.to_pickle)
+
+    if fingerprint is None:
+      self.fingerprints.pop(str(storenum), None)
+    else:
+      self.fingerprints[str(storenum)] = fingerprint
+    self._write_fingerprints()
+
+  def refresh(
+    self,
+    fetched: dict[StoreNum, DataFrame],
+    fingerprints: dict[StoreNum, DataFrame],
+    prepare: Callable[[dict[StoreNum, DataFrame]], dict[StoreNum, DataFrame]] | None = None,
+  ) -> dict[StoreNum, DataFrame]:
+    """Reconcile the tables fetched for every store with the local copies.
+
+    ``fetched`` is expected to come from a query that returns no rows while the table still matches the
+    fingerprint of the local copy. The fingerprint query has to run right before it on the same connection,
+    see ``QueryPackage.after``. A change landing between the two then only results in a redundant download on
+    the next run.
+
+    :param fetched: Table rows queried per store, empty for stores whose table did not change.
+    :type fetched: dict[StoreNum, DataFrame]
+    :param fingerprints: Result of the fingerprint query per store.
+    :type fingerprints: dict[StoreNum, DataFrame]
+    :param prepare: Called once with the fetched tables of the changed stores, returning the tables to cache
+      and return in their place, e.g. after validation. Stores missing from its return are left uncached.
+    :type prepare: Callable[[dict[StoreNum, DataFrame]], dict[StoreNum, DataFrame]] | None
+    :return: Current table per store.
+    :rtype: dict[StoreNum, DataFrame]
+    """
+    tables = {}
+    changed = {}
+    changed_fingerprints = {}
+
+    for storenum, store_fingerprint in fingerprints.items():
+      if (store_fetched := fetched.get(storenum)) is None:
+        continue
+
+      fingerprint = store_fingerprint[FINGERPRINT_COLUMN].iloc[0] if len(store_fingerprint) else None
+      fingerprint = None if isna(fingerprint) else int(fingerprint)
+
+      if store_fetched.empty and fingerprint is not None and (known := self.fingerprint(storenum)) is not None:
+        # The guarded query found the table matching the local copy. A fingerprint that differs regardless was
+        # taken mid change, so it is not recorded and the next run checks again
+        if fingerprint != known:
+          logger.debug(f"SFT {storenum:0>3}: {self.name} changed while being checked, keeping the local copy")
+        else:
+          logger.debug(f"SFT {storenum:0>3}: {self.name} unchanged, using the local copy")
+        tables[storenum] = self.load(storenum)
+      else:
+        changed[storenum] = store_fetched
+        changed_fingerprints[storenum] = fingerprint
+
+    if prepare is not None:
+      changed = prepare(changed)
+
+    for storenum, table in changed.items():
+      logger.debug(f"SFT {storenum:0>3}: {self.name} changed, caching {len(table)} rows")
+      self.update(storenum, changed_fingerprints[storenum], table)
+      tables[storenum] = table
+
+    return tables
+
+  def _write_fingerprints(self) -> None:
+    fingerprints = json.dumps(self.fingerprints, indent=2)
+    atomic_write(self.fingerprints_path, lambda temp_path: temp_path.write_text(fingerprints))
@@ -6,7 +6,7 @@ if __name__ == "__main__":
 from enum import auto
 from logging import getLogger
 
-from types_custom import ColNameEnum, classproperty
+from types_custom import ColNameEnum, PhysicalDtype, classproperty
 
 logger = getLogger(__name__)
 
@@ -239,6 +239,34 @@ class ItemizedInvoiceCols(ColNameEnum):
     "PricePerBeforeDiscount",
     "PriceChangedBy",
   ]
+  __dtypes__ = {
+    "Invoice_Number": PhysicalDtype.INT,
+    "CustNum": PhysicalDtype.TEXT,
+    "Phone_1": PhysicalDtype.TEXT,
+    "AgeVerificationMethod": PhysicalDtype.TEXT,
+    "AgeVerification": PhysicalDtype.TEXT,
+    "LineNum": PhysicalDtype.INT,
+    "Cashier_ID": PhysicalDtype.TEXT,
+    "Station_ID": PhysicalDtype.TEXT,
+    "ItemNum": PhysicalDtype.TEXT,
+    "ItemName": PhysicalDtype.TEXT,
+    "ItemName_Extra": PhysicalDtype.TEXT,
+    "DiffItemName": PhysicalDtype.TEXT,
+    "Dept_ID": PhysicalDtype.CATEGORY,
+    "Unit_Type": PhysicalDtype.CATEGORY,
+    "DateTime": PhysicalDtype.DATETIME,
+    "CostPer": PhysicalDtype.DECIMAL,
+    "PricePer": PhysicalDtype.DECIMAL,
+    "Tax1Per": PhysicalDtype.DECIMAL,
+    "Inv_Cost": PhysicalDtype.DECIMAL,
+    "Inv_Price": PhysicalDtype.DECIMAL,
+    "Inv_Retail_Price": PhysicalDtype.DECIMAL,
+    "origPricePer": PhysicalDtype.DECIMAL,
+    "MixNMatchRate": PhysicalDtype.TEXT,
+    "SalePricePer": PhysicalDtype.DECIMAL,
+    "PricePerBeforeDiscount": PhysicalDtype.DECIMAL,
+    "PriceChangedBy": PhysicalDtype.TEXT,
+  }
   Invoice_Number = auto()
   CustNum = auto()
   Phone_1 = auto()
@@ -300,6 +328,11 @@ class ItemizedInvoiceCols(ColNameEnum):
 
 
 class BulkRateCols(ColNameEnum):
+  __dtypes__ = {
+    "ItemNum": PhysicalDtype.TEXT,
+    "Bulk_Price": PhysicalDtype.DECIMAL,
+    "Bulk_Quan": PhysicalDtype.DECIMAL,
+  }
   ItemNum = auto()
   Bulk_Price = auto()
   Bulk_Quan = auto()
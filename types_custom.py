@@ -6,14 +6,17 @@ if __name__ == "__main__":
 from collections import UserDict
 from enum import Enum, StrEnum, auto
 from logging import getLogger
-from typing import Any, Literal, NamedTuple, TypedDict
+from typing import TYPE_CHECKING, Any, Callable, Literal, NamedTuple, TypedDict
 
+from numpy import ndarray
 from pandas import DataFrame, Series
 from pydantic import ValidationError
 from pyodbc import Row
-from pypika.queries import QueryBuilder
 from validation_config import CustomBaseModel, ValidationErrPackage
 
+if TYPE_CHECKING:
+  from sql_query_builders import QueryTemplate
+
 logger = getLogger(__name__)
 
 
@@ -46,9 +49,21 @@ class StatesEnum(Enum):
   WI = "WI"
 
 
+class PhysicalDtype(StrEnum):
+  """Physical storage type a query result column is materialized into at ingest."""
+
+  INT = "Int64"
+  DATETIME = "datetime64[ns]"
+  CATEGORY = "category"
+  # Money and other fixed point values stay as Decimal objects since every consumer does Decimal arithmetic
+  DECIMAL = "decimal"
+  TEXT = "text"
+
+
 class ColNameEnum(StrEnum):
   __exclude__ = []
   __init_include__ = []
+  __dtypes__: dict[str, PhysicalDtype] = {}
 
   @classmethod
   def ordered_column_names(cls, *columns: list[str]) -> list[str]:
@@ -77,6 +92,11 @@ class ColNameEnum(StrEnum):
       return cls.all_columns()
     return [str(column) for column in cls if str(column) in cls.__init_include__ and not str(column).startswith("_")]
 
+  @classmethod
+  def physical_dtypes(cls) -> dict[str, PhysicalDtype]:
+    """Return the physical dtype of every init column that declares one in ``__dtypes__``."""
+    return {column: cls.__dtypes__[column] for column in cls.init_columns() if column in cls.__dtypes__}
+
   @classmethod
   def testing_columns(cls) -> list[str]:
     return [str(column) for column in cls if str(column) not in cls.__exclude__]
@@ -390,11 +410,20 @@ type PromoFlag = Literal["N", "Y"]
 type QueryName = str
 type QueryDict = dict[QueryName, QueryPackage]
 type QueryResultRaw = list[Row]
+type QueryResultColumns = dict[str, ndarray]
 
 
 class QueryPackage(NamedTuple):
-  query: QueryBuilder
+  query: "QueryTemplate | Callable[[StoreNum], QueryTemplate]"
   cols: type[ColNameEnum] | list[str]
+  # An empty result is a valid answer (e.g. an incremental pull with nothing new) rather than a failed query
+  allow_empty: bool = False
+  # Column enum declaring the dtypes of a query selecting a subset of its columns by name
+  schema: type[ColNameEnum] | None = None
+  # Query this one has to run right after, on the same connection
+  after: QueryName | None = None
+  # Splits a store's query into slices fetched as separate jobs and concatenated in order
+  slices: "Callable[[StoreNum], list[QueryTemplate]] | None" = None
 
 
 class SQLCreds(TypedDict):
@@ -448,7 +477,7 @@ class StoreResultsPackage(UserDict):
 
 
 class QueryResultsPackage(StoreResultsPackage):
-  data: dict[QueryName, QueryResultRaw]
+  data: dict[QueryName, QueryResultColumns]
 
 
 class classproperty(property):
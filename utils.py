@@ -1,4 +1,5 @@
 import contextlib
+import sys
 from pathlib import Path
 
 if __name__ == "__main__":
@@ -6,13 +7,13 @@ if __name__ == "__main__":
 
   configure_logging()
 
+import os
 import pickle
 from collections.abc import Callable, Mapping, Sequence
-from datetime import datetime
+from datetime import datetime, timedelta
 from decimal import ROUND_FLOOR, Decimal, InvalidOperation
 from ftplib import FTP
 from functools import wraps
-from hashlib import md5
 from io import BufferedWriter
 from json import load
 from logging import getLogger
@@ -21,9 +22,11 @@ from re import match
 from threading import Lock
 from typing import Any
 
+from config import SETTINGS
 from dateutil.relativedelta import MO, SU, WE, relativedelta
 from dateutil.utils import today
 from numpy import nan
+from result_cache import RESULT_CACHE, collect_frames, frame_fingerprint, source_digest
 from rich.progress import Progress, TaskID
 from types_custom import StoreNum
 
@@ -39,10 +42,6 @@ FTP_CREDS_FILE = (CWD / __file__).with_name("ftp_creds.json")
 DECIMAL_MAX_DIGITS = Decimal("1.00")
 TERMINAL_WIDTH = get_terminal_size().columns
 
-RESULTS_PICKLE_CACHE = CWD / "_testing_pickles"
-if __debug__:  # noqa
-  RESULTS_PICKLE_CACHE.mkdir(exist_ok=True)
-
 IGNORE_ARGTYPES = (Progress,)
 IGNORE_KWARG_KEYS = ("errors", "buydowns_data", "vap_data", "live")
 
@@ -182,7 +181,7 @@ def get_week_of(week_shift: int = 0) -> datetime:
 
 
 class DoNotCacheException[**P](Exception):
-  """Exception to indicate that a function's return should not be cached by cached_for_testing"""
+  """Exception to indicate that a function's return should not be cached by cached_result"""
 
   def __init__(self, *args, intended_return: Any = None, **kwargs):
     self.__intended_return = intended_return
@@ -199,7 +198,9 @@ def process_arg_signature(arg: Any, hash_list: list[Any], func: Callable, annota
     return
   if annotations and hasattr(annotations, "__metadata__") and "ignore_for_sig" in annotations.__metadata__:
     return
-  if isinstance(arg, (str, int, float)):
+  if hasattr(arg, "cache_signature"):
+    process_arg_signature(arg.cache_signature(), hash_list, func)
+  elif isinstance(arg, (str, int, float)):
     hash_list.append(arg)
   elif isinstance(arg, Mapping):
     for key, value in arg.items():
@@ -231,86 +232,123 @@ def process_arg_signature(arg: Any, hash_list: list[Any], func: Callable, annota
   #     hash.update(str(arg).encode())
 
 
-def cached_for_testing[**TP, TR](
+def cached_result[**TP, TR](
   _func: Callable[TP, TR] | None = None,
   *,
-  pickle_path_override: str = None,
-  hash_for_sig: bool = False,
+  key_override: str = None,
   date_for_sig: datetime = None,
+  copy_frames: bool = True,
+  max_age: timedelta | None = None,
+  version: str | None = None,
 ) -> Callable[TP, TR] | Callable[[Callable[TP, TR]], Callable[TP, TR]]:
-  if pickle_path_override is not None:
-    pickle_path_override = pickle_path_override if pickle_path_override.endswith(".pickle") else pickle_path_override + ".pickle"
-
-  def cached_for_testing_under[**P, R](func: Callable[P, R]) -> Callable[P, R]:
+  def cached_result_under[**P, R](func: Callable[P, R]) -> Callable[P, R]:
     """
-    decorator to pickle the results of a function to disk for testing purposes
+    decorator to store the results of a function in the result cache
+
+    The key of a result covers the source of the module defining the function, ``version``, ``date_for_sig``,
+    the arguments as processed by process_arg_signature, and the content of every DataFrame passed in, ignored
+    for the signature or not.
+
+    Edits to code the function calls in other modules are not seen by the key, a function depending on such
+    code passes a digest of those modules as ``version``.
+
+    Results are read back with ``copy_frames`` as given to ResultCache.get, callers that only read the frames
+    they get pass False.
 
     Arguments:
         func -- Func to cache the return of
 
     Returns:
-        The unpickled result of the function if it exists, otherwise the result of the function
+        The cached result of the function if there is one, otherwise the result of the function
     """
-    # if not __debug__:
-    #   return func
-
-    pickle_path = RESULTS_PICKLE_CACHE / func.__module__
-    pickle_path.mkdir(exist_ok=True)
-
-    if hash_for_sig:
-      arghash = md5(usedforsecurity=False)
-
-    func_path = f"{func.__module__}.{func.__name__}"
-    # arghash.update(func_path.encode())
+    func_path = f"{func.__module__}.{func.__qualname__}"
+    func_version = source_digest(sys.modules[func.__module__])
 
     @wraps(func)
     def caching_wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
-      if pickle_path_override:
-        filename = pickle_path / pickle_path_override
+      if not SETTINGS.result_cache:
+        try:
+          return func(*args, **kwargs)
+        except DoNotCacheException as e:
+          return e.intended_return
+
+      if key_override:
+        key = RESULT_CACHE.make_key(func_path, func_version, version, key_override)
       else:
         # Process all args to form a unique function signature
-        # hash the function name and the arguments to get a unique filename
         arg_anno = [v for k, v in func.__annotations__.items() if k not in kwargs and k != "return"]
         kwarg_anno = {k: v for k, v in func.__annotations__.items() if k in kwargs and k != "return"}
 
-        hash_list = [func_path]
+        hash_list = [func_path, func_version, version, date_for_sig]
 
         process_arg_signature(args, hash_list, func, arg_anno)
         process_arg_signature(kwargs, hash_list, func, kwarg_anno)
 
-        pass
-
-        # create the filename from the hash
-        if hash_for_sig:
-          for item in hash_list:
-            arghash.update(str(item).encode())
-          filename = pickle_path / f"{func.__name__}_{arghash.hexdigest()}.pickle"
-        else:
-          strfixed = "_".join([str(item).replace(" ", "_").replace("-", "_") for item in hash_list])
-          filename = (
-            (pickle_path / f"{func.__name__}_{str(date_for_sig.date())}_{strfixed}.pickle")
-            if date_for_sig is not None
-            else pickle_path / f"{func.__name__}_{strfixed}.pickle"
-          )
-        pass
-
-      # if the file exists, load it and return the result
-      # otherwise, call the function and save the result to disk
-      if filename.exists():
-        with filename.open("rb") as file:
-          return pickle.load(file)
-      else:
-        try:
-          result = func(*args, **kwargs)
-        except DoNotCacheException as e:
-          return e.intended_return
-        with filename.open("wb") as file:
-          pickle.dump(result, file)
+        # The data passed in is part of the key whether or not it is part of the signature
+        frames = []
+        collect_frames([arg for arg in args if func.__qualname__.split(".")[0] != arg.__class__.__qualname__], frames)
+        collect_frames(kwargs, frames)
+        hash_list.extend(frame_fingerprint(frame) for frame in frames)
+
+        key = RESULT_CACHE.make_key(*hash_list)
+
+      found, result = RESULT_CACHE.get(key, copy_frames=copy_frames, max_age=max_age)
+      if found:
         return result
 
+      try:
+        result = func(*args, **kwargs)
+      except DoNotCacheException as e:
+        return e.intended_return
+      RESULT_CACHE.put(key, result, label=func_path)
+      return result
+
     return caching_wrapper
 
-  return cached_for_testing_under if _func is None else cached_for_testing_under(_func)
+  return cached_result_under if _func is None else cached_result_under(_func)
+
+
+def atomic_write(path: Path, writer: Callable[[Path], Any], temp_path: Path | None = None) -> None:
+  """Write a file through ``writer``, which is given a temporary path to write to, then move it over ``path``.
+
+  Readers only ever see the previous file or the complete new one, never a partially written one.
+
+  :param path: Path of the file to write.
+  :type path: Path
+  :param writer: Writes the file to the path it is given.
+  :type writer: Callable[[Path], Any]
+  :param temp_path: Path to write to first, ``path`` with a ``.tmp`` suffix if not given.
+  :type temp_path: Path | None
+  """
+  temp_path = path.with_suffix(".tmp") if temp_path is None else temp_path
+  try:
+    writer(temp_path)
+  except BaseException:
+    temp_path.unlink(missing_ok=True)
+    raise
+  os.replace(temp_path, path)
+
+
+def dump_versioned_pickle(path: Path, version: str, data: Any) -> None:
+  """Pickle ``data`` to ``path`` under ``version``, to be read back with :func:`load_versioned_pickle`."""
+  atomic_write(path, lambda temp_path: temp_path.write_bytes(pickle.dumps((version, data), pickle.HIGHEST_PROTOCOL)))
+
+
+def load_versioned_pickle(path: Path, version: str) -> Any | None:
+  """Data pickled to ``path`` by :func:`dump_versioned_pickle`.
+
+  :return: The data, None if there is no file, it cannot be read or it was pickled under another version.
+  :rtype: Any | None
+  """
+  if not path.exists():
+    return None
+  try:
+    with path.open("rb") as file:
+      pickled_version, data = pickle.load(file)
+  except (OSError, EOFError, pickle.UnpicklingError, TypeError, ValueError, AttributeError) as e:
+    logger.warning(f"Dropping unreadable cache {path}: {e!r}")
+    return None
+  return data if isinstance(pickled_version, str) and pickled_version == version else None
 
 
 class SingletonType(type):
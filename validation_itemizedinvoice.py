@@ -3,13 +3,17 @@ if __name__ == "__main__":
 
   configure_logging()
 
+from collections.abc import Iterable
 from datetime import datetime
 from decimal import Decimal
+from functools import cache
+from inspect import get_annotations
 from logging import getLogger
 from re import sub
 from typing import Annotated, Literal, Optional
 
-from pydantic import AfterValidator, BeforeValidator, Field
+from pydantic import AfterValidator, BeforeValidator, Field, create_model
+from types_column_names import ItemizedInvoiceCols
 from types_custom import DeptIDsEnum, StatesEnum, StoreNum, UnitsOfMeasureEnum
 from utils import truncate_decimal
 from validation_config import CustomBaseModel, ReportingFieldInfo
@@ -83,3 +87,42 @@ class ItemizedInvoiceModel(CustomBaseModel):
   Manufacturer_Buydown_Amt: Optional[Decimal] = None
   loyalty_disc_desc: Optional[str] = None
   LoyaltyDiscountAmt: Optional[Decimal] = None
+
+
+def itemized_invoice_model(columns: Iterable[str]) -> type[ItemizedInvoiceModel]:
+  """ItemizedInvoiceModel for invoice lines queried with only ``columns`` of the itemized invoice columns.
+
+  Fields of the columns left out of the select list default to None. Every selected column keeps its field as
+  declared, so a NULL in a selected column that is required still fails its row.
+
+  :param columns: Columns of the invoice lines to validate.
+  :type columns: Iterable[str]
+  :return: ItemizedInvoiceModel itself when no required column is missing.
+  :rtype: type[ItemizedInvoiceModel]
+  """
+  return _itemized_invoice_model(frozenset(columns))
+
+
+@cache
+def _itemized_invoice_model(columns: frozenset[str]) -> type[ItemizedInvoiceModel]:
+  fields = ItemizedInvoiceModel.model_fields
+  omitted = {
+    field_name
+    for field_name in ItemizedInvoiceCols.init_columns()
+    if field_name in fields and field_name not in columns and fields[field_name].is_required()
+  }
+  if not omitted:
+    return ItemizedInvoiceModel
+
+  # Every field is declared again, the failed validation logging looks fields up in the annotations of the class
+  annotations = get_annotations(ItemizedInvoiceModel)
+  return create_model(
+    ItemizedInvoiceModel.__name__,
+    __base__=ItemizedInvoiceModel,
+    **{
+      field_name: (Optional[field.annotation], None)
+      if field_name in omitted
+      else (annotations[field_name], ... if field.is_required() else field.default)
+      for field_name, field in fields.items()
+    },
+  )